@@ -0,0 +1,132 @@
+from datetime import datetime
+
+# What the super admin can see and filter per table. Passwords are never selected.
+ADMIN_TABLES = {
+    'users': {
+        'columns': ['id', 'name', 'email', 'mobile', 'license_plate', 'role'],
+        'sortable': ['id', 'name', 'email'],
+        'date_column': None,
+        'filters': ['plate'],
+    },
+    'reservations': {
+        'columns': ['id', 'license_plate', 'lot_name', 'slot_name', 'reservation_expiry'],
+        'sortable': ['id', 'reservation_expiry', 'lot_name'],
+        'date_column': 'reservation_expiry',
+        'filters': ['plate', 'lot', 'date_from', 'date_to'],
+    },
+    'parking_sessions': {
+        'columns': ['id', 'license_plate', 'lot_name', 'slot_name', 'start_time', 'end_time', 'duration', 'paid'],
+        'sortable': ['id', 'start_time', 'lot_name'],
+        'date_column': 'start_time',
+        'filters': ['plate', 'lot', 'paid', 'date_from', 'date_to'],
+    },
+}
+
+PAGE_SIZE = 50
+
+
+def parse_filters(args):
+    """Pulls the dashboard filters out of the request args, dropping blanks and bad values."""
+    filters = {}
+    for name in ('plate', 'lot'):
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+    if args.get('paid') in ('0', '1'):
+        filters['paid'] = int(args['paid'])
+    for name in ('date_from', 'date_to'):
+        value = args.get(name)
+        if value:
+            try:
+                filters[name] = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                pass
+    return filters
+
+
+def _where(table, filters):
+    spec = ADMIN_TABLES[table]
+    clauses, params = [], []
+    if 'plate' in filters and 'plate' in spec['filters']:
+        clauses.append("license_plate = %s")
+        params.append(filters['plate'])
+    if 'lot' in filters and 'lot' in spec['filters']:
+        clauses.append("lot_name = %s")
+        params.append(filters['lot'])
+    if 'paid' in filters and 'paid' in spec['filters']:
+        clauses.append("paid = %s")
+        params.append(filters['paid'])
+    if spec['date_column']:
+        if 'date_from' in filters:
+            clauses.append(f"{spec['date_column']} >= %s")
+            params.append(filters['date_from'])
+        if 'date_to' in filters:
+            # Inclusive of the whole end day
+            clauses.append(f"{spec['date_column']} < %s + INTERVAL 1 DAY")
+            params.append(filters['date_to'])
+    return clauses, params
+
+
+def _sort(table, sort, order):
+    spec = ADMIN_TABLES[table]
+    column = sort if sort in spec['sortable'] else 'id'
+    descending = order == 'desc'
+    return column, descending
+
+
+def _order_by(column, descending):
+    direction = 'DESC' if descending else 'ASC'
+    if column == 'id':
+        return f"id {direction}"
+    return f"{column} {direction}, id {direction}"
+
+
+def page_query(table, filters, sort=None, order=None, after=None, limit=PAGE_SIZE):
+    """
+    Builds a keyset-paginated SELECT. `after` is the cursor from the previous page's
+    last row ("value|id", or just "id" when sorting by id). Fetches one extra row so
+    the caller can tell whether a next page exists.
+    """
+    spec = ADMIN_TABLES[table]
+    column, descending = _sort(table, sort, order)
+    clauses, params = _where(table, filters)
+
+    if after:
+        op = '<' if descending else '>'
+        if column == 'id':
+            clauses.append(f"id {op} %s")
+            params.append(after)
+        else:
+            value, _, last_id = after.rpartition('|')
+            clauses.append(f"({column} {op} %s OR ({column} = %s AND id {op} %s))")
+            params.extend([value, value, last_id])
+
+    query = f"SELECT {', '.join(spec['columns'])} FROM {table}"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += f" ORDER BY {_order_by(column, descending)} LIMIT %s"
+    params.append(limit + 1)
+    return query, params
+
+
+def next_cursor(table, rows, sort=None, limit=PAGE_SIZE):
+    """Returns the `after` cursor for the page following `rows`, or None on the last page."""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    column, _ = _sort(table, sort, None)
+    if column == 'id':
+        return str(last['id'])
+    return f"{last[column]}|{last['id']}"
+
+
+def export_query(table, filters, sort=None, order=None):
+    """Same filters and ordering as the dashboard, without a page limit."""
+    spec = ADMIN_TABLES[table]
+    column, descending = _sort(table, sort, order)
+    clauses, params = _where(table, filters)
+    query = f"SELECT {', '.join(spec['columns'])} FROM {table}"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += f" ORDER BY {_order_by(column, descending)}"
+    return query, params
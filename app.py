@@ -1,30 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-from datetime import datetime, timedelta
-from twilio.rest import Client
+from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, abort, stream_with_context
 import pymysql
 from dotenv import load_dotenv
+from admin_queries import ADMIN_TABLES, PAGE_SIZE, export_query, next_cursor, page_query, parse_filters
+from db import get_db_connection
+from catalog import catalog_store, occupancy_board
+from occupancy import occupancy_index
+from occupancy_hub import occupancy_hub
+from plate_resolver import plate_index
+from notifications import send_sms
+from reservations import reserve_slot, SLOT_TAKEN, UNPAID
+from unpaid_guard import unpaid_guard
+import metrics
+from functools import wraps
+import csv
+import io
+import json
 import os
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key"
-
-RDS_HOST = os.getenv('RDS_HOST')
-RDS_USER = os.getenv('RDS_USER')
-RDS_PASSWORD = os.getenv('RDS_PASSWORD')
-RDS_DB_NAME = os.getenv('RDS_DB_NAME')
-
-# Helper function to connect to the AWS RDS MySQL database
-def get_db_connection():
-    conn = pymysql.connect(
-        host=RDS_HOST,
-        user=RDS_USER,
-        password=RDS_PASSWORD,
-        db=RDS_DB_NAME,
-        cursorclass=pymysql.cursors.DictCursor  # This allows results to be accessed like dictionaries
-    )
-    return conn
+metrics.instrument_flask(app)
 
 
 @app.route('/')
@@ -47,6 +44,7 @@ def register():
                 (name, mobile, email, password, license_plate),
             )
             conn.commit()
+            plate_index.add(license_plate)
             flash("Registration successful! Please log in.", "success")
             return redirect(url_for('login'))
         except pymysql.MySQLError:
@@ -66,6 +64,7 @@ def login():
 
         # Check for superadmin credentials
         if email == 'superadmin' and password == 'superadmin':
+            conn.close()
             session['role'] = 'superadmin'  # Store superadmin in session
             flash("Login successful! Welcome Super Admin.", "success")
             return redirect(url_for('superadmin_dashboard'))
@@ -79,16 +78,10 @@ def login():
         if user:
             license_plate = user['license_plate']
             session['license_plate'] = license_plate
+            conn.close()
 
-            # Check for unpaid parking session
-            cursor.execute('''
-                SELECT * 
-                FROM parking_sessions
-                WHERE license_plate = %s AND paid = 0 AND end_time IS NOT NULL
-                ORDER BY end_time DESC
-                LIMIT 1
-            ''', (license_plate,))
-            unpaid_session = cursor.fetchone()
+            # Check for unpaid parking session (cached for the rest of the flow)
+            unpaid_session = unpaid_guard.latest_unpaid(license_plate)
 
             if unpaid_session:
                 flash("You have a pending payment for a completed parking session.", "danger")
@@ -97,6 +90,7 @@ def login():
             flash("Login successful!", "success")
             return redirect(url_for('lots'))
         else:
+            conn.close()
             flash("Invalid email or password.", "danger")
     
     return render_template('login.html')
@@ -104,41 +98,33 @@ def login():
 
 
 
+def require_paid_up(view):
+    """Sends drivers with an unpaid completed session to the payment page instead of the view."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        license_plate = session.get('license_plate')
+        if license_plate and unpaid_guard.has_unpaid(license_plate):
+            flash("You have unpaid parking charges. Please proceed to payment.", "warning")
+            return redirect(url_for('payment'))
+        return view(*args, **kwargs)
+    return wrapped
+
+
 @app.route('/lots')
+@require_paid_up
 def lots():
     license_plate = session.get('license_plate')
     if not license_plate:
         flash("You must be logged in to access this page.", "danger")
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Check for unpaid parking sessions
-    cursor.execute('''
-        SELECT * 
-        FROM parking_sessions 
-        WHERE license_plate = %s AND paid = 0 AND end_time IS NOT NULL
-    ''', (license_plate,))
-    unpaid_session = cursor.fetchone()
-
-    if unpaid_session:
-        conn.close()
-        flash("You have unpaid parking charges. Please proceed to payment.", "warning")
-        return redirect(url_for('payment'))
-
-    conn.close()
-    lots = ['Lot A', 'Lot B', 'Lot C', 'Lot D']
+    # Lots come from the catalog; free/reserved/occupied counts from the occupancy bitmaps
+    occupancy_hub.start()  # Camera entry/exit events feed the occupied counts
+    lots = [dict(name=lot.name, **occupancy_board.counts(lot.name)) for lot in catalog_store.current().lots]
     return render_template('lots.html', lots=lots)
 
-# The send_alert function and other routes remain unchanged. Just update cursor-based execution inside the functions.
 
 def send_alert(actual_license_plate, reserved_license_plate):
-    # Twilio credentials
-    account_sid = os.getenv("ACCOUNT_SID")
-    auth_token = os.getenv("AUTH_TOKEN")    # Replace with your Twilio Auth Token
-    client = Client(account_sid, auth_token)
-
     # Your mobile number (person in charge of parking lot)
     manager_phone_number = os.getenv("MANAGER_PHONE_NUMBER")  # Replace with your verified Twilio number
 
@@ -150,14 +136,9 @@ def send_alert(actual_license_plate, reserved_license_plate):
         f"Please verify the issue immediately."
     )
 
-    # Send SMS
-    message = client.messages.create(
-        body=message_body,
-        from_=os.getenv("TWILIO_NO"),  
-        to=manager_phone_number  # Send alert to the parking manager
-    )
-
-    print(f"Alert sent to {manager_phone_number}: {message.sid}")
+    # Queue the SMS; a background worker delivers it so the request never waits on Twilio
+    send_sms(manager_phone_number, message_body, key=('mismatch', actual_license_plate, reserved_license_plate))
+    print(f"Alert queued for {manager_phone_number}")
 
 @app.route('/validate_entry', methods=['POST'])
 def validate_entry():
@@ -170,14 +151,15 @@ def validate_entry():
     cursor.execute('''
     SELECT * FROM reservations
     WHERE lot_name = %s AND slot_name = %s AND reservation_expiry > NOW()
-''', (lot_name, slot_name)).fetchone()
+''', (lot_name, slot_name))
     reservation = cursor.fetchone()
 
     conn.close()
 
     if reservation:
         reserved_license_plate = reservation['license_plate']
-        if actual_license_plate != reserved_license_plate:
+        # OCR'd text: spacing and O/0-style slips still match; another car's plate doesn't
+        if not plate_index.matches(actual_license_plate, reserved_license_plate):
             print(f"Mismatch detected: {actual_license_plate} != {reserved_license_plate}.")
             # Send alert to parking manager
             send_alert(actual_license_plate, reserved_license_plate)
@@ -191,88 +173,65 @@ def validate_entry():
 
 @app.route('/slots/<lot_name>', methods=['GET'])
 def slots(lot_name):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    lot = catalog_store.current().lot(lot_name)
+    if lot is None:
+        abort(404)
+    # Current reservations come from the in-process occupancy index, not a query per view
+    reserved = occupancy_index.reserved_slots(lot_name)
 
-    # Get current reservations for the selected lot
-    cursor.execute('''
-        SELECT slot_name, reservation_expiry FROM reservations
-        WHERE lot_name = %s AND reservation_expiry > NOW()
-    ''', (lot_name,))
-    reservations = cursor.fetchall()
-
-    # Build slot status dictionary
-    slots = {f'Slot {i}': None for i in range(1, 9)}  # Default all slots as available
-    for reservation in reservations:
-        try:
-            # Check if reservation_expiry is a string
-            if isinstance(reservation['reservation_expiry'], str):
-                # Convert string to datetime object, including fractional seconds
-                expiry_datetime = datetime.strptime(reservation['reservation_expiry'], '%Y-%m-%d %H:%M:%S.%f')
-            else:
-                # If it's already a datetime, use it directly
-                expiry_datetime = reservation['reservation_expiry']
-        except ValueError:
-            # Fallback if no fractional seconds are present
-            if isinstance(reservation['reservation_expiry'], str):
-                expiry_datetime = datetime.strptime(reservation['reservation_expiry'], '%Y-%m-%d %H:%M:%S')
-            else:
-                expiry_datetime = reservation['reservation_expiry']
-        
-        # Update the slots dictionary with the expiry time
-        slots[reservation['slot_name']] = expiry_datetime
+    return render_template('slots.html', lot_name=lot_name, slots=slot_statuses(lot, reserved))
 
-    conn.close()
-    return render_template('slots.html', lot_name=lot_name, slots=slots)
+
+@app.route('/slots/<lot_name>/events')
+def slot_events(lot_name):
+    # Server-sent events: a snapshot of the lot, then one message per slot change
+    return Response(occupancy_hub.stream(lot_name), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def slot_statuses(lot, reserved):
+    """Slot name -> reservation expiry, or None for available slots, in the lot's display order."""
+    return {slot_name: reserved.get(slot_name) for slot_name in lot.slot_names}
 
 @app.route('/reserve', methods=['POST'])
+@require_paid_up
 def reserve():
     license_plate = session.get('license_plate')  # Get license plate from session
     if not license_plate:
         flash("You must be logged in to reserve a slot.", "danger")
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Check if the user has any unpaid parking sessions
-    cursor.execute('''
-        SELECT * 
-        FROM parking_sessions 
-        WHERE license_plate = %s AND paid = 0 AND end_time IS NOT NULL
-    ''', (license_plate,))
-    unpaid_session = cursor.fetchone()
-
-    if unpaid_session:
-        conn.close()
-        flash("You have unpaid parking charges. Please proceed to payment.", "warning")
-        return redirect(url_for('payment'))
-
-    # Proceed with reservation if no unpaid session
     lot_name = request.form['lot_name']
     slot_name = request.form['slot_name']
-    reservation_expiry = datetime.now() + timedelta(minutes=10)
+    if not catalog_store.current().has_slot(lot_name, slot_name):
+        flash(f"{slot_name} in {lot_name} does not exist.", "danger")
+        return redirect(url_for('lots'))
 
+    # Unpaid check, availability check and insert happen in one transaction
     try:
-        cursor.execute('''
-            INSERT INTO reservations (license_plate, lot_name, slot_name, reservation_expiry)
-            VALUES (%s, %s, %s, %s)
-        ''', (license_plate, lot_name, slot_name, reservation_expiry))
-        conn.commit()
-
-        session['booking_details'] = {
-            'license_plate': license_plate,
-            'lot_name': lot_name,
-            'slot_name': slot_name,
-            'reservation_expiry': reservation_expiry.strftime('%Y-%m-%d %H:%M:%S')
-        }
-        flash(f"Slot {slot_name} in {lot_name} reserved successfully!", "success")
-        return redirect(url_for('thankyou'))
+        outcome, reservation_expiry = reserve_slot(license_plate, lot_name, slot_name)
     except pymysql.MySQLError:
         flash("Failed to reserve slot. Please try again.", "danger")
-    finally:
-        cursor.close()
-        conn.close()
+        return redirect(url_for('slots', lot_name=lot_name))
+
+    if outcome == UNPAID:
+        flash("You have unpaid parking charges. Please proceed to payment.", "warning")
+        return redirect(url_for('payment'))
+
+    if outcome == SLOT_TAKEN:
+        occupancy_index.invalidate(lot_name)
+        flash(f"Slot {slot_name} in {lot_name} was just reserved by someone else. Please pick another slot.", "warning")
+        return redirect(url_for('slots', lot_name=lot_name))
+
+    occupancy_index.reserve(lot_name, slot_name, reservation_expiry)
+    session['booking_details'] = {
+        'license_plate': license_plate,
+        'lot_name': lot_name,
+        'slot_name': slot_name,
+        'reservation_expiry': reservation_expiry.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    flash(f"Slot {slot_name} in {lot_name} reserved successfully!", "success")
+    return redirect(url_for('thankyou'))
 
 
 @app.route('/thankyou')
@@ -291,40 +250,29 @@ def payment():
         flash("You must be logged in to view payment details.", "danger")
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
     # Fetch the latest unpaid, completed parking session
-    cursor.execute('''
-        SELECT * 
-        FROM parking_sessions
-        WHERE license_plate = %s AND paid = 0 AND end_time IS NOT NULL
-        ORDER BY end_time DESC
-        LIMIT 1
-    ''', (license_plate,))
-    session_data = cursor.fetchone()
+    session_data = unpaid_guard.latest_unpaid(license_plate)
 
     if not session_data:
-        conn.close()
         # Only redirect to `lots` if no pending payments exist
         return redirect(url_for('lots'))
 
-    # Calculate payment based on duration
-    duration_minutes = session_data['duration'] // 60  # Convert seconds to minutes
-    if duration_minutes <= 10:
-        total_amount = 20  # Flat rate for first 10 minutes
-    else:
-        additional_minutes = duration_minutes - 10
-        total_amount = 20 + (additional_minutes * 2)  # ₹20 for first 10 mins + ₹2 per extra minute
+    return render_template('payment.html', **payment_context(session_data))
+
+
+def payment_context(session_data):
+    """Template variables for payment.html (shared with the ASGI app)."""
+    import tariff  # Pulls in numpy; loaded by the first payment page, not at worker start
+
+    # Calculate payment based on duration, with the lot's rate plan
+    total_amount = tariff.price(session_data['duration'], session_data['lot_name'], session_data['start_time'])
 
     # Calculate total time spent
     start_time = session_data['start_time']
     end_time = session_data['end_time']
     total_time_spent = end_time - start_time  # This works if start_time and end_time are datetime objects
 
-    conn.close()
-
-    return render_template(
-        'payment.html',
+    return dict(
         total_amount=total_amount,
         session_data=session_data,
         start_time=start_time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -335,48 +283,41 @@ def payment():
 @app.route('/confirm_payment', methods=['POST'])
 def confirm_payment():
     license_plate = session.get('license_plate')
-    
-    print(f"Session License Plate: {license_plate}")  # Debugging
 
     if not license_plate:
         flash("You must be logged in to confirm payment.", "danger")
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    
-    try:
-        # Fetch the row that needs to be updated
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id
-            FROM parking_sessions
-            WHERE license_plate = %s AND end_time IS NOT NULL AND paid = 0
-            ORDER BY end_time DESC
-            LIMIT 1
-        ''', (license_plate,))
-        row_to_update = cursor.fetchone()
-
-        print(f"Row to update: {row_to_update}")  # Debugging
-
-        if row_to_update:
+    # The session shown on the payment page; the UPDATE re-checks paid = 0 itself
+    row_to_update = unpaid_guard.latest_unpaid(license_plate)
+
+    if row_to_update:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
             # Update the 'paid' status to 1
             cursor.execute('''
                 UPDATE parking_sessions
                 SET paid = 1
-                WHERE id = %s
+                WHERE id = %s AND paid = 0
             ''', (row_to_update['id'],))
+            updated = cursor.rowcount
             conn.commit()
-            flash("Payment confirmed successfully!", "success")
-        else:
-            flash("No pending payments to confirm.", "info")
-
-    except Exception as e:
-        flash(f"Error: {str(e)}", "danger")
-    
-    finally:
-        conn.close()  # Always close the connection
-
-    print("Redirecting to 'lots' page...")  # Debugging
+            unpaid_guard.invalidate(license_plate)
+            if updated:
+                flash("Payment confirmed successfully!", "success")
+            elif unpaid_guard.latest_unpaid(license_plate):
+                # The cached session was stale (paid elsewhere); a newer one is still due
+                flash("That session was already paid, but another one is pending. Please review it.", "warning")
+                return redirect(url_for('payment'))
+            else:
+                flash("This session has already been paid.", "info")
+        except Exception as e:
+            flash(f"Error: {str(e)}", "danger")
+        finally:
+            conn.close()  # Always close the connection
+    else:
+        flash("No pending payments to confirm.", "info")
 
     return redirect(url_for('lots'))
 
@@ -394,21 +335,93 @@ def superadmin_dashboard():
         flash("You do not have permission to access this page.", "danger")
         return redirect(url_for('login'))
 
+    filters = parse_filters(request.args)
+    sort = request.args.get('sort')
+    order = request.args.get('order')
+
+    # One keyset page per table; each table pages independently via <table>_after
+    pages = {}
     conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        with conn.cursor() as cursor:
+            for table in ADMIN_TABLES:
+                query, params = page_query(table, filters, sort, order, request.args.get(f'{table}_after'))
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                pages[table] = (rows[:PAGE_SIZE], next_cursor(table, rows, sort))
+    finally:
+        conn.close()
 
-    cursor.execute("SELECT * FROM users")
-    users = cursor.fetchall()
+    # Links keep the current filters; export links drop the page cursors
+    args = request.args.to_dict()
+    filter_args = {k: v for k, v in args.items() if not k.endswith('_after')}
+    next_pages = {
+        table: url_for('superadmin_dashboard', **dict(args, **{f'{table}_after': cursor})) if cursor else None
+        for table, (_, cursor) in pages.items()
+    }
+    export_links = {
+        table: {fmt: url_for('superadmin_export', table=table, fmt=fmt, **filter_args) for fmt in ('csv', 'ndjson')}
+        for table in ADMIN_TABLES
+    }
 
-    cursor.execute("SELECT * FROM reservations")
-    reservations = cursor.fetchall()
+    return render_template(
+        'super_admin.html',
+        users=pages['users'][0],
+        reservations=pages['reservations'][0],
+        parking_sessions=pages['parking_sessions'][0],
+        next_pages=next_pages,
+        export_links=export_links,
+        filters=filter_args,
+    )
 
-    cursor.execute("SELECT * FROM parking_sessions")
-    parking_sessions = cursor.fetchall()
 
-    conn.close()
+@app.route('/superadmin/export/<table>.<fmt>')
+def superadmin_export(table, fmt):
+    if session.get('role') != 'superadmin':
+        flash("You do not have permission to access this page.", "danger")
+        return redirect(url_for('login'))
+    if table not in ADMIN_TABLES or fmt not in ('csv', 'ndjson'):
+        abort(404)
+
+    query, params = export_query(table, parse_filters(request.args), request.args.get('sort'), request.args.get('order'))
+    columns = ADMIN_TABLES[table]['columns']
 
-    return render_template('super_admin.html', users=users, reservations=reservations, parking_sessions=parking_sessions)
+    def generate():
+        # Unbuffered server-side cursor: rows are streamed from MySQL as they are sent,
+        # so memory stays flat no matter how many rows match.
+        conn = get_db_connection()
+        finished = False
+        try:
+            cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+            cursor.execute(query, params)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == 'csv':
+                writer.writerow(columns)
+            for i, row in enumerate(cursor, 1):
+                if fmt == 'csv':
+                    writer.writerow([row[column] for column in columns])
+                else:
+                    buffer.write(json.dumps(row, default=str) + "\n")
+                if i % 500 == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+            finished = True
+        finally:
+            if finished:
+                conn.close()
+            else:
+                # Client went away mid-stream; don't drain the rest of the result set
+                conn.discard()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'},
+    )
 
 
 # Add User
@@ -429,6 +442,7 @@ def add_user():
             VALUES (%s, %s, %s, %s, %s, 'user')
         """, (name, email, mobile, license_plate, password))
         conn.commit()
+        plate_index.add(license_plate)
         flash("User added successfully!", "success")
     except pymysql.MySQLError:
         flash("Error adding user. Please try again.", "danger")
@@ -445,8 +459,12 @@ def delete_user(user_id):
     cursor = conn.cursor()
 
     try:
+        cursor.execute("SELECT license_plate FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
         cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
         conn.commit()
+        if user and user['license_plate']:
+            plate_index.remove(user['license_plate'])
         flash("User deleted successfully.", "success")
     except pymysql.MySQLError:
         flash("Error deleting user. Please try again.", "danger")
@@ -463,8 +481,12 @@ def delete_reservation(reservation_id):
     cursor = conn.cursor()
 
     try:
+        cursor.execute("SELECT lot_name, slot_name FROM reservations WHERE id = %s", (reservation_id,))
+        reservation = cursor.fetchone()
         cursor.execute("DELETE FROM reservations WHERE id = %s", (reservation_id,))
         conn.commit()
+        if reservation:
+            occupancy_index.release(reservation['lot_name'], reservation['slot_name'])
         flash("Reservation deleted successfully.", "success")
     except pymysql.MySQLError:
         flash("Error deleting reservation. Please try again.", "danger")
@@ -481,8 +503,12 @@ def mark_paid(session_id):
     cursor = conn.cursor()
 
     try:
+        cursor.execute("SELECT license_plate FROM parking_sessions WHERE id = %s", (session_id,))
+        parking_session = cursor.fetchone()
         cursor.execute("UPDATE parking_sessions SET paid = 1 WHERE id = %s", (session_id,))
         conn.commit()
+        if parking_session:
+            unpaid_guard.invalidate(parking_session['license_plate'])
         flash("Parking session marked as paid.", "success")
     except pymysql.MySQLError:
         flash("Error marking session as paid. Please try again.", "danger")
@@ -491,5 +517,22 @@ def mark_paid(session_id):
     conn.close()
     return redirect(url_for('superadmin_dashboard'))
 
+def main(argv=None):
+    """Development server; production runs app:app under gunicorn (or asgi_app:application)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Smart parking web app (development server)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--no-debug', action='store_true', help="Disable the debugger and reloader")
+    args = parser.parse_args(argv)
+    if args.no_debug or os.environ.get('WERKZEUG_RUN_MAIN'):  # The reloader's child, not its watcher
+        from migrations import migrate
+
+        migrate()  # gunicorn does this in gunicorn.conf.py, the ASGI app on startup
+        metrics.serve(metrics.METRICS_WEB_PORT)
+    app.run(host=args.host, port=args.port, debug=not args.no_debug)
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    main()
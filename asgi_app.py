@@ -0,0 +1,103 @@
+# Async serving mode. The read-heavy driver pages (lots, slots, payment) are Quart views
+# that query MySQL through aiomysql, so a slow query parks a coroutine instead of a worker
+# thread. Every other route is the unchanged Flask app, run behind the same ASGI server:
+#
+#     hypercorn asgi_app:application --bind 0.0.0.0:8001 --workers 4
+import asyncio
+
+from quart import Quart, Response, abort, flash, redirect, render_template, session, url_for
+from hypercorn.middleware import AsyncioWSGIMiddleware
+
+import app as sync_app
+import metrics
+from catalog import catalog_store, occupancy_board
+from occupancy import occupancy_index
+from occupancy_hub import occupancy_hub
+from unpaid_guard import unpaid_guard
+
+quart_app = Quart(__name__, template_folder=sync_app.app.template_folder, static_folder=None)
+# Same key and cookie format as Flask, so one login works against both apps
+quart_app.secret_key = sync_app.app.secret_key
+metrics.instrument_quart(quart_app)  # Covers the async views; the Flask app below instruments itself
+
+
+@quart_app.before_serving
+async def startup():
+    from migrations import migrate
+
+    # Every worker runs this; migrate() holds a lock, so the first applies and the rest find nothing to do
+    await asyncio.to_thread(migrate)
+    # Each worker process serves its own registry on the first free port from METRICS_WEB_PORT
+    metrics.serve(metrics.METRICS_WEB_PORT, tries=metrics.METRICS_WEB_PORTS)
+
+
+@quart_app.route('/lots')
+async def lots():
+    license_plate = session.get('license_plate')
+    if not license_plate:
+        await flash("You must be logged in to access this page.", "danger")
+        return redirect(url_for('login'))
+
+    if await unpaid_guard.latest_unpaid_async(license_plate) is not None:
+        await flash("You have unpaid parking charges. Please proceed to payment.", "warning")
+        return redirect(url_for('payment'))
+
+    occupancy_hub.start()
+    catalog = await catalog_store.current_async()
+    lots = [dict(name=lot.name, **await occupancy_board.counts_async(lot.name)) for lot in catalog.lots]
+    return await render_template('lots.html', lots=lots)
+
+
+@quart_app.route('/slots/<lot_name>')
+async def slots(lot_name):
+    lot = (await catalog_store.current_async()).lot(lot_name)
+    if lot is None:
+        abort(404)
+    reserved = await occupancy_index.reserved_slots_async(lot_name)
+    return await render_template('slots.html', lot_name=lot_name, slots=sync_app.slot_statuses(lot, reserved))
+
+
+@quart_app.route('/slots/<lot_name>/events')
+async def slot_events(lot_name):
+    # Each open stream is a coroutine here rather than a held worker thread
+    response = Response(occupancy_hub.stream_async(lot_name), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.timeout = None
+    return response
+
+
+@quart_app.route('/payment')
+async def payment():
+    license_plate = session.get('license_plate')
+    if not license_plate:
+        await flash("You must be logged in to view payment details.", "danger")
+        return redirect(url_for('login'))
+
+    session_data = await unpaid_guard.latest_unpaid_async(license_plate)
+    if not session_data:
+        return redirect(url_for('lots'))
+
+    return await render_template('payment.html', **sync_app.payment_context(session_data))
+
+
+ASYNC_ENDPOINTS = {'lots', 'slots', 'slot_events', 'payment'}
+
+# Templates link to Flask-only pages (login, confirm_payment, ...): register their URLs,
+# without views, so url_for() can build them here too.
+for rule in sync_app.app.url_map.iter_rules():
+    if rule.endpoint not in ASYNC_ENDPOINTS:
+        quart_app.add_url_rule(rule.rule, rule.endpoint, methods=rule.methods)
+
+_wsgi_app = AsyncioWSGIMiddleware(sync_app.app)
+
+
+def _is_async_path(path):
+    return path in ('/lots', '/payment') or path.startswith('/slots/')
+
+
+async def application(scope, receive, send):
+    """ASGI entry point: async views for the hot read paths, the Flask app for everything else."""
+    if scope['type'] == 'lifespan' or (scope['type'] == 'http' and _is_async_path(scope['path'])):
+        await quart_app(scope, receive, send)
+    else:
+        await _wsgi_app(scope, receive, send)
@@ -0,0 +1,310 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from dotenv import load_dotenv
+
+from db import get_db_connection
+from occupancy import occupancy_index
+
+load_dotenv()
+
+CATALOG_CHECK_SECONDS = float(os.getenv('CATALOG_CHECK_SECONDS', 30))  # How often to look for catalog edits
+
+CATALOG_QUERY = '''
+    SELECT l.name AS lot_name, s.name AS slot_name
+    FROM lots l
+    LEFT JOIN slots s ON s.lot_id = l.id
+    ORDER BY l.position, l.id, s.position, s.id
+'''
+VERSION_QUERY = "SELECT version FROM catalog_version WHERE id = 1"
+
+# One lot: its name, slot names in display order, and slot name -> bit position
+Lot = namedtuple('Lot', ['name', 'slot_names', 'positions'])
+
+
+class Catalog:
+    """Immutable snapshot of every lot and its slots. Replaced wholesale on reload, never edited."""
+
+    __slots__ = ('version', 'lots', '_by_name')
+
+    def __init__(self, version, rows):
+        slot_names = {}
+        for row in rows:
+            names = slot_names.setdefault(row['lot_name'], [])
+            if row['slot_name'] is not None:
+                names.append(row['slot_name'])
+        self.version = version
+        self.lots = tuple(
+            Lot(name, tuple(names), MappingProxyType({slot_name: i for i, slot_name in enumerate(names)}))
+            for name, names in slot_names.items()
+        )
+        self._by_name = MappingProxyType({lot.name: lot for lot in self.lots})
+
+    def lot(self, lot_name):
+        return self._by_name.get(lot_name)
+
+    def has_slot(self, lot_name, slot_name):
+        lot = self._by_name.get(lot_name)
+        return lot is not None and slot_name in lot.positions
+
+    @property
+    def lot_names(self):
+        return [lot.name for lot in self.lots]
+
+
+def fetch_catalog_version(cursor):
+    cursor.execute(VERSION_QUERY)
+    row = cursor.fetchone()
+    return row['version'] if row else 0
+
+
+def fetch_catalog():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            version = fetch_catalog_version(cursor)
+            cursor.execute(CATALOG_QUERY)
+            return Catalog(version, cursor.fetchall())
+    finally:
+        conn.close()
+
+
+class CatalogStore:
+    """Holds the current Catalog; checks catalog_version at most every CATALOG_CHECK_SECONDS and reloads on change."""
+
+    def __init__(self, check_seconds=CATALOG_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._checked_at = 0.0
+        self._listeners = []  # Called with the new Catalog after every reload
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _stale(self):
+        return self._catalog is None or time.monotonic() - self._checked_at > self.check_seconds
+
+    def _install(self, catalog):
+        with self._lock:
+            changed = self._catalog is None or catalog.version != self._catalog.version
+            if changed:
+                self._catalog = catalog
+            self._checked_at = time.monotonic()
+        if changed:
+            for listener in self._listeners:
+                listener(catalog)
+
+    def current(self):
+        if self._stale():
+            if self._catalog is not None:
+                conn = get_db_connection()
+                try:
+                    with conn.cursor() as cursor:
+                        unchanged = fetch_catalog_version(cursor) == self._catalog.version
+                finally:
+                    conn.close()
+                if unchanged:
+                    with self._lock:
+                        self._checked_at = time.monotonic()
+                    return self._catalog
+            self._install(fetch_catalog())
+        return self._catalog
+
+    async def current_async(self):
+        """current() for the ASGI app, on the async pool."""
+        from db import fetch_all_async, fetch_one_async
+
+        if self._stale():
+            row = await fetch_one_async(VERSION_QUERY)
+            version = row['version'] if row else 0
+            if self._catalog is not None and version == self._catalog.version:
+                with self._lock:
+                    self._checked_at = time.monotonic()
+                return self._catalog
+            self._install(Catalog(version, await fetch_all_async(CATALOG_QUERY)))
+        return self._catalog
+
+    def invalidate(self):
+        """Forces a version check on the next access (e.g. right after editing the catalog)."""
+        with self._lock:
+            self._checked_at = 0.0
+
+
+class LotBoard:
+    """Reserved and camera-occupied bitmaps for one lot, with counts kept as bits flip."""
+
+    __slots__ = ('lot', 'reserved', 'occupied', 'busy_count', 'occupied_count')
+
+    def __init__(self, lot):
+        self.lot = lot
+        self.reserved = 0  # Bit i set: slot i has an unexpired reservation
+        self.occupied = 0  # Bit i set: a camera sees a vehicle in slot i
+        self.busy_count = 0  # Slots reserved or occupied
+        self.occupied_count = 0
+
+    def set(self, position, reserved=None, occupied=None):
+        bit = 1 << position
+        was_busy = bool((self.reserved | self.occupied) & bit)
+        was_occupied = bool(self.occupied & bit)
+        if reserved is not None:
+            self.reserved = self.reserved | bit if reserved else self.reserved & ~bit
+        if occupied is not None:
+            self.occupied = self.occupied | bit if occupied else self.occupied & ~bit
+        self.busy_count += bool((self.reserved | self.occupied) & bit) - was_busy
+        self.occupied_count += bool(self.occupied & bit) - was_occupied
+
+    def counts(self):
+        total = len(self.lot.slot_names)
+        return {
+            'total': total,
+            'free': total - self.busy_count,
+            'reserved': self.busy_count - self.occupied_count,  # Reserved and not yet occupied
+            'occupied': self.occupied_count,
+        }
+
+
+class OccupancyBoard:
+    """
+    Per-lot bitmaps of slot state, kept current from occupancy index changes (reservations,
+    expiries, deletions) and camera entry/exit events, so per-lot counts cost O(1).
+    """
+
+    def __init__(self, store, index=occupancy_index):
+        self.store = store
+        self.index = index
+        # Reentrant: a rebuild reads the index, which may call back into _on_reservation
+        self._lock = threading.RLock()
+        self._catalog = None
+        self._boards = {}  # lot_name -> LotBoard
+        index.add_listener(self._on_reservation)
+        store.add_listener(self._rebuild)
+
+    def _rebuild(self, catalog):
+        # New catalog: fresh boards, refilled from the index and the previous camera state
+        with self._lock:
+            reserved = self.index.snapshot()
+            occupied = {lot_name: self._occupied_names(board) for lot_name, board in self._boards.items()}
+            boards = {lot.name: LotBoard(lot) for lot in catalog.lots}
+            for lot_name, board in boards.items():
+                for slot_name in reserved.get(lot_name, ()):
+                    if slot_name in board.lot.positions:
+                        board.set(board.lot.positions[slot_name], reserved=True)
+                for slot_name in occupied.get(lot_name, ()):
+                    if slot_name in board.lot.positions:
+                        board.set(board.lot.positions[slot_name], occupied=True)
+            self._catalog, self._boards = catalog, boards
+
+    @staticmethod
+    def _occupied_names(board):
+        return {slot_name for slot_name, i in board.lot.positions.items() if board.occupied >> i & 1}
+
+    def _update(self, lot_name, slot_name, **state):
+        with self._lock:
+            board = self._boards.get(lot_name)
+            position = board.lot.positions.get(slot_name) if board is not None else None
+            if position is not None:  # Slots outside the catalog are ignored
+                board.set(position, **state)
+
+    def _on_reservation(self, lot_name, slot_name, expiry, reason):
+        self._update(lot_name, slot_name, reserved=expiry is not None)
+
+    def set_occupied(self, lot_name, slot_name, occupied):
+        self._update(lot_name, slot_name, occupied=occupied)
+
+    def is_occupied(self, lot_name, slot_name):
+        with self._lock:
+            board = self._boards.get(lot_name)
+            position = board.lot.positions.get(slot_name) if board is not None else None
+            return position is not None and bool(board.occupied >> position & 1)
+
+    def occupied_slots(self, lot_name):
+        with self._lock:
+            board = self._boards.get(lot_name)
+            return self._occupied_names(board) if board is not None else set()
+
+    def counts(self, lot_name):
+        """{'total', 'free', 'reserved', 'occupied'} for the lot, or None if it isn't in the catalog."""
+        self.store.current()
+        self.index.ensure_fresh(lot_name)
+        return self._counts(lot_name)
+
+    async def counts_async(self, lot_name):
+        await self.store.current_async()
+        await self.index.ensure_fresh_async(lot_name)
+        return self._counts(lot_name)
+
+    def _counts(self, lot_name):
+        self.index.evict_expired()
+        with self._lock:
+            board = self._boards.get(lot_name)
+            return board.counts() if board is not None else None
+
+
+catalog_store = CatalogStore()
+occupancy_board = OccupancyBoard(catalog_store)
+
+
+def _bump_version(cursor):
+    cursor.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+
+
+def add_lot(name, slot_names):
+    """Adds a lot after the existing ones, with its slots in the given order."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(position), -1) + 1 AS position FROM lots")
+            cursor.execute("INSERT INTO lots (name, position) VALUES (%s, %s)", (name, cursor.fetchone()['position']))
+            lot_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO slots (lot_id, name, position) VALUES (%s, %s, %s)",
+                [(lot_id, slot_name, i) for i, slot_name in enumerate(slot_names, 1)],
+            )
+            _bump_version(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    catalog_store.invalidate()
+
+
+def remove_lot(name):
+    """Removes a lot and (by cascade) its slots."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM lots WHERE name = %s", (name,))
+            _bump_version(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    catalog_store.invalidate()
+
+
+if __name__ == "__main__":
+    # Catalog maintenance: running processes pick edits up within CATALOG_CHECK_SECONDS
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Edit the lot/slot catalog")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="Show lots and slot counts")
+    add = commands.add_parser('add-lot', help="Add a lot with numbered slots")
+    add.add_argument('name')
+    add.add_argument('--slots', type=int, required=True)
+    add.add_argument('--prefix', default='Slot ', help="Slot names are <prefix><n>")
+    remove = commands.add_parser('remove-lot', help="Remove a lot and its slots")
+    remove.add_argument('name')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for lot in fetch_catalog().lots:
+            print(f"{lot.name}: {len(lot.slot_names)} slots")
+    else:
+        if args.command == 'add-lot':
+            add_lot(args.name, [f"{args.prefix}{i}" for i in range(1, args.slots + 1)])
+        else:
+            remove_lot(args.name)
+        print(f"{args.command} {args.name}: done")
@@ -0,0 +1,376 @@
+import os
+import threading
+import time
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+RDS_HOST = os.getenv('RDS_HOST')
+RDS_USER = os.getenv('RDS_USER')
+RDS_PASSWORD = os.getenv('RDS_PASSWORD')
+RDS_DB_NAME = os.getenv('RDS_DB_NAME')
+
+# Pool tuning (all optional, sensible defaults for a small RDS instance)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))  # Max open connections per process
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))  # Seconds to wait for a free connection
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))  # Close connections idle longer than this
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))  # Recycle connections older than this
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 30))  # Ping connections idle longer than this
+
+
+class PoolExhaustedError(pymysql.err.OperationalError):
+    """Raised when no connection became free within the pool timeout."""
+
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    """DictCursor that counts and times every statement (executemany batches go through execute)."""
+
+    def execute(self, query, args=None):
+        with metrics.sql_timer(query):
+            return super().execute(query, args)
+
+
+def connect():
+    """Opens a new, unpooled connection to the AWS RDS MySQL database."""
+    return pymysql.connect(
+        host=RDS_HOST,
+        user=RDS_USER,
+        password=RDS_PASSWORD,
+        db=RDS_DB_NAME,
+        cursorclass=TimedDictCursor  # Rows as dictionaries, with per-statement metrics
+    )
+
+
+class PooledConnection:
+    """Thin wrapper around a pymysql connection whose close() hands it back to the pool."""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise pymysql.err.InterfaceError("Connection already returned to the pool")
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, self._created_at)
+
+    def discard(self):
+        """Closes the underlying connection instead of returning it (e.g. mid-stream aborts)."""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._discard_checked_out(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget to close (e.g. early returns)
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pymysql connections."""
+
+    def __init__(self, connect_fn=connect, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 idle_timeout=DB_POOL_IDLE_TIMEOUT, max_lifetime=DB_POOL_MAX_LIFETIME,
+                 ping_after=DB_POOL_PING_AFTER):
+        self._connect = connect_fn
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # Stack of (raw, created_at, returned_at); most recently used on top
+        self._open = 0  # Connections currently open (idle + checked out)
+
+        # Metrics
+        self.checkouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.failed_pings = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.exhausted = 0
+        self.peak_in_use = 0
+
+    def connection(self):
+        """Checks out a healthy connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = time.monotonic()
+
+        with self._cond:
+            while True:
+                entry = self._take_idle()
+                if entry is not None:
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.exhausted += 1
+                    raise PoolExhaustedError(
+                        f"No database connection available after {self.timeout}s "
+                        f"(pool size {self.max_size})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            if waited:
+                self.waits += 1
+                self.wait_time += time.monotonic() - wait_started
+
+        if entry is None:
+            raw, created_at = self._open_new()
+        else:
+            raw, created_at = self._validate(*entry)
+
+        with self._cond:
+            self.checkouts += 1
+            in_use = self._open - len(self._idle)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+
+        return PooledConnection(self, raw, created_at)
+
+    def _take_idle(self):
+        # Called with the lock held. Drops expired connections while looking for a usable one.
+        now = time.monotonic()
+        while self._idle:
+            raw, created_at, returned_at = self._idle.pop()
+            if now - created_at > self.max_lifetime or now - returned_at > self.idle_timeout:
+                self._discard(raw)
+                self.recycled += 1
+                continue
+            return raw, created_at, returned_at
+        return None
+
+    def _validate(self, raw, created_at, returned_at):
+        # Only ping connections that sat idle long enough to have been dropped server-side
+        if time.monotonic() - returned_at <= self.ping_after:
+            return raw, created_at
+        try:
+            raw.ping(reconnect=False)
+            return raw, created_at
+        except pymysql.MySQLError:
+            with self._cond:
+                self.failed_pings += 1
+            try:
+                raw.close()
+            except Exception:
+                pass
+            return self._open_new()
+
+    def _open_new(self):
+        # The slot is already counted in _open; replace the dead connection in place
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return raw, time.monotonic()
+
+    def _discard(self, raw):
+        # Called with the lock held
+        self._open -= 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _discard_checked_out(self, raw):
+        with self._cond:
+            self._discard(raw)
+            self._cond.notify()
+
+    def _release(self, raw, created_at):
+        broken = not raw.open
+        if not broken and raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            # Never hand out a connection with a half-finished transaction or a stale snapshot
+            try:
+                raw.rollback()
+            except pymysql.MySQLError:
+                broken = True
+
+        with self._cond:
+            if broken or time.monotonic() - created_at > self.max_lifetime:
+                self._discard(raw)
+                if not broken:
+                    self.recycled += 1
+            else:
+                self._idle.append((raw, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        """Closes every idle connection. Checked-out connections close when released."""
+        with self._cond:
+            while self._idle:
+                raw, _, _ = self._idle.pop()
+                self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'peak_in_use': self.peak_in_use,
+                'checkouts': self.checkouts,
+                'created': self.created,
+                'recycled': self.recycled,
+                'failed_pings': self.failed_pings,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'exhausted': self.exhausted,
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns the process-wide pool, creating it on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool()
+                _pool_pid = pid
+    return _pool
+
+
+# Helper function to get a pooled connection; conn.close() returns it to the pool
+def get_db_connection():
+    return get_pool().connection()
+
+
+def _pool_metrics():
+    if _pool is None or _pool_pid != os.getpid():
+        return
+    stats = _pool.stats()
+    for key in ('open', 'idle', 'in_use', 'peak_in_use'):
+        yield f'db_pool_{key}', 'gauge', f"Pool connections: {key.replace('_', ' ')}", {}, stats[key]
+    for key in ('checkouts', 'created', 'recycled', 'failed_pings', 'waits', 'exhausted'):
+        yield f'db_pool_{key}_total', 'counter', f"Pool {key.replace('_', ' ')} since start", {}, stats[key]
+    yield 'db_pool_wait_seconds_total', 'counter', "Time spent waiting for a free connection", {}, stats['wait_time']
+
+
+metrics.add_collector(_pool_metrics)
+
+
+# --- Async access for the ASGI app (asgi_app.py); needs aiomysql ---
+
+_async_pools = {}  # Event loop -> aiomysql pool; a pool can't be shared across loops
+
+
+async def get_async_pool():
+    """Returns this event loop's aiomysql pool, creating it on first use."""
+    import asyncio
+
+    import aiomysql
+
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = await aiomysql.create_pool(
+            host=RDS_HOST,
+            user=RDS_USER,
+            password=RDS_PASSWORD,
+            db=RDS_DB_NAME,
+            maxsize=DB_POOL_SIZE,
+            pool_recycle=DB_POOL_MAX_LIFETIME,
+            autocommit=True,  # Read-only queries; don't hold a snapshot between them
+            cursorclass=aiomysql.DictCursor,
+        )
+        # Another task may have created one while we were connecting
+        if loop in _async_pools:
+            pool.close()
+            pool = _async_pools[loop]
+        else:
+            _async_pools[loop] = pool
+    return pool
+
+
+async def fetch_one_async(query, params=()):
+    """Runs a read query on the async pool and returns the first row (a dict) or None."""
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            with metrics.sql_timer(query):
+                await cursor.execute(query, params)
+            return await cursor.fetchone()
+
+
+async def fetch_all_async(query, params=()):
+    """Runs a read query on the async pool and returns every row as a dict."""
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            with metrics.sql_timer(query):
+                await cursor.execute(query, params)
+            return await cursor.fetchall()
+
+
+if __name__ == "__main__":
+    # Benchmark: queries/sec with a fresh connection per request vs. the pool
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Compare per-request connections with the pool")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    def unpooled_request(_):
+        conn = connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+        finally:
+            conn.close()
+
+    def pooled_request(_):
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+        finally:
+            conn.close()
+
+    for label, fn in (("unpooled", unpooled_request), ("pooled", pooled_request)):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(fn, range(args.requests)))
+        elapsed = time.perf_counter() - started
+        print(f"{label:>9}: {args.requests / elapsed:8.1f} req/s ({elapsed:.2f}s)")
+
+    print(f"Pool stats: {get_pool().stats()}")
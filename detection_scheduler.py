@@ -0,0 +1,78 @@
+import os
+
+import cv2
+
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', 0.002))  # Fraction of changed pixels that counts as motion
+MOTION_PIXEL_DELTA = int(os.getenv('MOTION_PIXEL_DELTA', 25))  # Grey-level change for a pixel to count as changed
+DETECT_EVERY = int(os.getenv('DETECT_EVERY', 5))  # Detection stride while every track's plate is settled
+MOTION_DOWNSCALE = 4  # Frame differencing runs on a 1/4-size thumbnail
+
+
+class DetectionScheduler:
+    """
+    Decides per frame whether a camera needs Haar detection:
+    - no tracks and no motion in the lane: skip (empty or static gate)
+    - tracks present but all plates settled: detect every DETECT_EVERY frames, and at least
+      once every max_gap of frame time, so slow processing can't starve tracks into expiring
+    - otherwise: detect every frame
+    Detection is limited to the camera's region of interest, if one is configured.
+    """
+
+    def __init__(self, roi=None, motion_threshold=MOTION_THRESHOLD, detect_every=DETECT_EVERY, max_gap=None):
+        self.roi = tuple(roi) if roi else None  # (x, y, w, h) around the lane, in frame pixels
+        self.motion_threshold = motion_threshold
+        self.detect_every = max(1, detect_every)
+        self.max_gap = max_gap  # timedelta; None bounds the stride by frame count only
+        self._previous = None
+        self._since_detect = 0
+        self._last_detect = None  # Frame time of the last detection
+
+        self.frames = 0
+        self.detections_run = 0
+        self.motion_skips = 0
+        self.stride_skips = 0
+
+    def crop(self, img_gray):
+        """Returns (region to detect on, (x, y) offset of that region in the frame)."""
+        if self.roi is None:
+            return img_gray, (0, 0)
+        x, y, w, h = self.roi
+        return img_gray[y: y + h, x: x + w], (x, y)
+
+    def _motion(self, region):
+        h, w = region.shape[:2]
+        thumb = cv2.resize(region, (max(1, w // MOTION_DOWNSCALE), max(1, h // MOTION_DOWNSCALE)),
+                           interpolation=cv2.INTER_AREA)
+        previous, self._previous = self._previous, thumb
+        if previous is None or previous.shape != thumb.shape:
+            return 1.0
+        changed = cv2.absdiff(thumb, previous) > MOTION_PIXEL_DELTA
+        return float(changed.mean())
+
+    def should_detect(self, region, tracks, now=None):
+        """region: this frame's cropped grey image; tracks: the camera's live tracks; now: the frame's time."""
+        self.frames += 1
+        motion = self._motion(region)
+        self._since_detect += 1
+
+        if not tracks and motion < self.motion_threshold:
+            self.motion_skips += 1
+            return False
+        if (tracks and all(track.readings.settled for track in tracks) and self._since_detect < self.detect_every
+                and not self._gap_reached(now)):
+            self.stride_skips += 1
+            return False
+
+        self._since_detect = 0
+        self._last_detect = now
+        self.detections_run += 1
+        return True
+
+    def _gap_reached(self, now):
+        # Skipped frames never refresh a track's last_seen, so detect before the grace period runs out
+        if self.max_gap is None or now is None:
+            return False
+        return self._last_detect is None or now - self._last_detect >= self.max_gap
+
+    def detection_rate(self):
+        return self.detections_run / self.frames if self.frames else 0.0
@@ -0,0 +1,124 @@
+import os
+import queue
+import re
+import threading
+import time
+
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EVIDENCE_DIR = os.getenv('EVIDENCE_DIR', 'evidence')  # Local bucket root; keys mirror an object store layout
+EVIDENCE_RETENTION_DAYS = float(os.getenv('EVIDENCE_RETENTION_DAYS', 30))
+EVIDENCE_MAX_BYTES = int(os.getenv('EVIDENCE_MAX_BYTES', 2 * 1024 ** 3))  # Oldest crops are pruned past this
+EVIDENCE_QUEUE_SIZE = int(os.getenv('EVIDENCE_QUEUE_SIZE', 256))
+EVIDENCE_JPEG_QUALITY = int(os.getenv('EVIDENCE_JPEG_QUALITY', 90))
+EVIDENCE_SWEEP_SECONDS = 300  # How often retention and size caps are enforced
+
+
+def evidence_key(camera, track_id, plate, timestamp):
+    """Object key for an entry crop, e.g. entry/2024/05/01/gate-1/093012_000042_MH12AB1234.jpg"""
+    plate = re.sub(r'[^A-Z0-9]', '', (plate or 'UNREAD').upper())
+    camera = re.sub(r'[^A-Za-z0-9_-]', '_', camera)
+    return f"entry/{timestamp:%Y/%m/%d}/{camera}/{timestamp:%H%M%S}_{track_id:06d}_{plate}.jpg"
+
+
+class EvidenceArchiver:
+    """
+    Writes entry crops off the capture/processing threads. JPEG encoding and the file write
+    happen on one background thread; when it falls behind, new crops are dropped rather
+    than stalling the cameras. Old and excess files are swept on start and periodically.
+    """
+
+    def __init__(self, root=EVIDENCE_DIR, retention_days=EVIDENCE_RETENTION_DAYS, max_bytes=EVIDENCE_MAX_BYTES,
+                 queue_size=EVIDENCE_QUEUE_SIZE):
+        self.root = root
+        self.retention_seconds = retention_days * 86400
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="evidence-archiver", daemon=True)
+        self._last_sweep = 0.0
+
+        self.saved = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._thread.start()
+
+    def submit(self, img_roi, camera, track_id, plate, timestamp):
+        """Queues a crop for archiving. The crop is copied, so the caller's frame can be reused."""
+        try:
+            self._queue.put_nowait((img_roi.copy(), evidence_key(camera, track_id, plate, timestamp)))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            if time.monotonic() - self._last_sweep > EVIDENCE_SWEEP_SECONDS:
+                self.sweep()
+            try:
+                item = self._queue.get(timeout=EVIDENCE_SWEEP_SECONDS)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            try:
+                self._write(*item)
+                self.saved += 1
+            except Exception as e:
+                print(f"Error archiving evidence {item[1]}: {e}")
+
+    def _write(self, img_roi, key):
+        ok, encoded = cv2.imencode('.jpg', img_roi, [cv2.IMWRITE_JPEG_QUALITY, EVIDENCE_JPEG_QUALITY])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        path = os.path.join(self.root, *key.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers (or a sync to a real bucket) never see half a file
+        tmp = path + '.part'
+        with open(tmp, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp, path)
+
+    def sweep(self):
+        """Deletes crops past the retention period, then the oldest ones until under the size cap."""
+        self._last_sweep = time.monotonic()
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+
+        cutoff = time.time() - self.retention_seconds
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.pruned += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        # Drop the day/camera directories the pruning emptied
+        for dirpath, _, _ in sorted(os.walk(self.root), key=lambda entry: len(entry[0]), reverse=True):
+            if dirpath != self.root:
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,29 @@
+# gunicorn settings, read by `gunicorn ... app:app` when started from this directory.
+#
+# The schema is migrated once, in the master, before any worker serves a request.
+#
+# Metrics: each worker keeps its own registry, so each serves it on a port of its own,
+# METRICS_WEB_PORT + the worker's slot. A Prometheus target then always reads the same
+# process, and the app port has no /metrics. Slots are reused as workers are replaced;
+# during a reload (HUP) the new workers start next to the old ones, so list twice as many
+# ports as workers in the scrape config.
+import metrics
+
+
+def on_starting(server):
+    from db import get_pool
+    from migrations import migrate
+
+    migrate()
+    get_pool().close_all()  # Workers open their own pools; don't leave them the master's sockets
+
+
+def pre_fork(server, worker):
+    # Runs in the master: the lowest slot no live worker holds
+    taken = {getattr(other, 'metrics_slot', None) for other in server.WORKERS.values()}
+    worker.metrics_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    if metrics.METRICS_WEB_PORT:
+        metrics.serve(int(metrics.METRICS_WEB_PORT) + worker.metrics_slot)
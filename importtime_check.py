@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Import-time regression check for every process entry point. Each entry module is imported
+# in a fresh interpreter under `python -X importtime`; the check fails if an import pulls in
+# something that should only load on first use (OCR model, Twilio, Flask in the alert
+# worker, ...), or if import time exceeds its budget / a saved baseline.
+#
+#     python importtime_check.py                           # Check every process against its budget
+#     python importtime_check.py --save importtime.json    # Record a baseline on this machine
+#     python importtime_check.py --baseline importtime.json --tolerance 0.25
+
+HEAVY = ['easyocr', 'torch', 'torchvision', 'onnxruntime', 'twilio']  # Loaded on first use only, never at import
+
+PROCESSES = {
+    'web': {
+        'module': 'app',  # gunicorn app:app
+        'budget_ms': 1500,
+        'forbidden': HEAVY + ['cv2', 'numpy', 'quart', 'hypercorn'],
+    },
+    'async web': {
+        'module': 'asgi_app',  # hypercorn asgi_app:application
+        'budget_ms': 2500,
+        'forbidden': HEAVY + ['cv2', 'numpy'],
+    },
+    'alert worker': {
+        'module': 'session_alert',
+        'budget_ms': 500,
+        'forbidden': HEAVY + ['flask', 'app', 'cv2', 'numpy'],
+    },
+    'camera pipeline': {
+        'module': 'pipeline',
+        'budget_ms': 2500,
+        'forbidden': HEAVY + ['flask', 'app', 'session_alert', 'notifications'],
+    },
+    'OCR worker': {
+        'module': 'plate_workers',  # Imported by every spawned pipeline worker process
+        'budget_ms': 1500,
+        'forbidden': HEAVY + ['flask', 'pymysql', 'db'],
+    },
+    'maintenance': {
+        'module': 'maintenance',
+        'budget_ms': 500,
+        'forbidden': HEAVY + ['flask', 'cv2', 'numpy'],
+    },
+}
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr):
+    """Returns [(name, self_us, cumulative_us, depth)] from `-X importtime` output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def measure(module):
+    """Imports `module` in a fresh interpreter. Returns (import ms, wall ms, entries, error)."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    entries = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        return None, wall_ms, entries, lines[-1] if lines else f"exit status {result.returncode}"
+    # The target is the last top-level entry for its name; its cumulative time covers everything it pulled in
+    import_us = next(cumulative for name, _, cumulative, depth in reversed(entries) if name == module and depth == 0)
+    return import_us / 1000, wall_ms, entries, None
+
+
+def heaviest(entries, count=5):
+    """Top-level packages by total self time."""
+    totals = {}
+    for name, self_us, _, _ in entries:
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def check(runs=3, baseline=None, tolerance=0.25):
+    """Measures every process; returns (results, problems)."""
+    results, problems = {}, []
+    for label, spec in PROCESSES.items():
+        samples = [measure(spec['module']) for _ in range(runs)]
+        error = next((error for *_, error in samples if error), None)
+        if error:
+            problems.append(f"{label}: import {spec['module']} failed: {error}")
+            continue
+        # Best of N: the least noisy estimate of the work the import actually does
+        import_ms, wall_ms, entries, _ = min(samples, key=lambda sample: sample[0])
+        results[label] = import_ms
+        print(f"{label:<16} import {spec['module']:<14} {import_ms:8.1f}ms  (process {wall_ms:6.0f}ms)  heaviest: "
+              + ", ".join(f"{package} {us / 1000:.0f}ms" for package, us in heaviest(entries)))
+
+        loaded = {name.split('.')[0] for name, _, _, _ in entries}
+        for module in spec['forbidden']:
+            if module in loaded:
+                problems.append(f"{label}: importing {spec['module']} loads {module}")
+        limit = spec['budget_ms']
+        if baseline and label in baseline:
+            limit = min(limit, baseline[label] * (1 + tolerance))
+        if import_ms > limit:
+            problems.append(f"{label}: import took {import_ms:.1f}ms, limit {limit:.1f}ms")
+    return results, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time regression check for each process")
+    parser.add_argument('--runs', type=int, default=3, help="Imports per process; the fastest counts")
+    parser.add_argument('--baseline', help="JSON from --save; fail if a process got slower than it by --tolerance")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save', help="Write this run's import times as a baseline")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results, problems = check(args.runs, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save}")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"All {len(PROCESSES)} processes within their import budgets.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import time
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+# Load test for the driver read paths: N concurrent keep-alive clients hammer /lots,
+# /slots/<lot> and /payment for a fixed time, then throughput and tail latency are
+# reported. Point it at the sync (Flask) and async (asgi_app) servers to compare them:
+#
+#     gunicorn -w 4 --threads 8 -b 127.0.0.1:8000 app:app
+#     hypercorn -w 4 -b 127.0.0.1:8001 asgi_app:application
+#     python loadtest.py --email driver@example.com --password secret \
+#         --target sync=http://127.0.0.1:8000 --target async=http://127.0.0.1:8001
+
+DEFAULT_PATHS = ['/lots', '/slots/Lot A', '/payment']
+
+
+def login_cookie(base_url, email, password):
+    """Logs in once through the Flask app and returns the session cookie header."""
+    jar = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({'username': email, 'password': password}).encode()
+    opener.open(base_url + '/login', data=data).read()
+    return "; ".join(f"{cookie.name}={cookie.value}" for cookie in jar)
+
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response; returns (status, keep_alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Server closed the connection")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(url, paths, cookie, deadline, latencies, errors):
+    parsed = urllib.parse.urlsplit(url)
+    host, port = parsed.hostname, parsed.port or 80
+    requests = [
+        (f"GET {urllib.parse.quote(path)} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+         f"Cookie: {cookie}\r\nConnection: keep-alive\r\n\r\n").encode()
+        for path in paths
+    ]
+    reader = writer = None
+    i = 0
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            writer.write(requests[i % len(requests)])
+            status, keep_alive = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status >= 500:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+        i += 1
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, paths, cookie, clients, seconds):
+    latencies, errors = [], []
+    deadline = time.monotonic() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(client(url, paths, cookie, deadline, latencies, errors) for _ in range(clients)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare sync vs async serving under concurrent drivers")
+    parser.add_argument('--target', action='append', required=True, help="label=base_url (repeatable)")
+    parser.add_argument('--email', required=True, help="Driver account used for the session cookie")
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--path', action='append', help="Paths to cycle through (default: lots, slots, payment)")
+    args = parser.parse_args(argv)
+
+    targets = [target.split('=', 1) for target in args.target]
+    # One login is enough: both apps share the secret key and cookie format
+    cookie = login_cookie(targets[0][1], args.email, args.password)
+    paths = args.path or DEFAULT_PATHS
+
+    print(f"{args.clients} clients, {args.seconds:.0f}s each, paths {paths}")
+    for label, url in targets:
+        latencies, errors, elapsed = asyncio.run(run(url, paths, cookie, args.clients, args.seconds))
+        latencies.sort()
+        print(f"{label:>8}: {len(latencies) / elapsed:8.1f} req/s, "
+              f"p50 {percentile(latencies, 0.50) * 1000:7.1f}ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:7.1f}ms, "
+              f"p99.9 {percentile(latencies, 0.999) * 1000:7.1f}ms, {len(errors)} errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+from dotenv import load_dotenv
+
+import db
+from migrations import migrate
+
+load_dotenv()
+
+# Retention (all optional)
+RESERVATION_RETENTION_HOURS = float(os.getenv('RESERVATION_RETENTION_HOURS', 24))  # Keep expired reservations this long
+SESSION_RETENTION_DAYS = float(os.getenv('SESSION_RETENTION_DAYS', 90))  # Keep paid, closed sessions this long
+ARCHIVE_KEEP_MONTHS = int(os.getenv('ARCHIVE_KEEP_MONTHS', 0))  # Drop archive months older than this; 0 keeps all
+
+# Pacing: every chunk is its own short transaction, so live traffic never waits long on us
+MAINTENANCE_CHUNK_ROWS = int(os.getenv('MAINTENANCE_CHUNK_ROWS', 1000))
+MAINTENANCE_PAUSE_SECONDS = float(os.getenv('MAINTENANCE_PAUSE_SECONDS', 0.05))
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv('MAINTENANCE_INTERVAL_SECONDS', 3600))
+LOCK_WAIT_SECONDS = 5  # A chunk that waits longer than this on app locks is rolled back and retried
+MAX_CHUNK_RETRIES = 5
+
+# Hot table -> its archive and which rows age out. `condition` takes the cutoff as its only parameter.
+ARCHIVES = {
+    'reservations': {
+        'archive': 'reservations_archive',
+        'columns': ['id', 'license_plate', 'lot_name', 'slot_name', 'reservation_expiry'],
+        'age_column': 'reservation_expiry',
+        'condition': "reservation_expiry < %s",
+    },
+    'parking_sessions': {
+        'archive': 'parking_sessions_archive',
+        'columns': ['id', 'license_plate', 'lot_name', 'slot_name', 'start_time', 'end_time', 'duration', 'paid',
+                    'session_key'],
+        'age_column': 'end_time',
+        # Unpaid sessions stay put however old: the payment guard and the driver still need them
+        'condition': "paid = 1 AND end_time < %s",
+    },
+}
+
+PARTITION_NAME = re.compile(r'^p(\d{4})(\d{2})$')  # One partition per month: p202401, p202402, ...
+
+
+def cutoffs(now=None):
+    """Rows older than these (per hot table) are due for the archive."""
+    now = now or datetime.now()
+    return {
+        'reservations': now - timedelta(hours=RESERVATION_RETENTION_HOURS),
+        'parking_sessions': now - timedelta(days=SESSION_RETENTION_DAYS),
+    }
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _where(table, only_lot=None):
+    clause = ARCHIVES[table]['condition']
+    return clause + " AND lot_name = %s" if only_lot else clause
+
+
+def _params(cutoff, only_lot=None):
+    return (cutoff, only_lot) if only_lot else (cutoff,)
+
+
+def archive_months(cursor, archive):
+    """Months that already have a partition in the archive table, oldest first."""
+    cursor.execute('''
+        SELECT partition_name AS name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+    ''', (archive,))
+    months = []
+    for row in cursor.fetchall():
+        match = PARTITION_NAME.match(row['name'])
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def missing_partitions(cursor, archive, first_month, last_month):
+    """Month partitions to split off pmax so rows up to last_month land in their own month."""
+    existing = archive_months(cursor, archive)
+    month = _next_month(existing[-1]) if existing else first_month
+    months = []
+    while month <= last_month:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def add_partitions(cursor, archive, months):
+    # Splitting pmax is cheap because it's kept empty: partitions are always added before rows arrive
+    parts = ", ".join(
+        f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_next_month(month):%Y-%m-%d}'))" for month in months
+    )
+    cursor.execute(f"ALTER TABLE {archive} REORGANIZE PARTITION pmax INTO "
+                   f"({parts}, PARTITION pmax VALUES LESS THAN MAXVALUE)")
+
+
+def expired_partitions(cursor, archive, now=None, keep_months=ARCHIVE_KEEP_MONTHS):
+    """Partition names whose whole month is older than keep_months (none if keep_months is 0)."""
+    if keep_months <= 0:
+        return []
+    oldest_kept = _month_start(now or datetime.now())
+    for _ in range(keep_months):
+        oldest_kept = datetime(oldest_kept.year - (oldest_kept.month == 1), (oldest_kept.month - 2) % 12 + 1, 1)
+    return [f"p{month:%Y%m}" for month in archive_months(cursor, archive) if month < oldest_kept]
+
+
+def due_rows(cursor, table, cutoff, only_lot=None):
+    """(count, oldest, newest) of the rows in `table` the next run would archive."""
+    age_column = ARCHIVES[table]['age_column']
+    cursor.execute(f'''
+        SELECT COUNT(*) AS n, MIN({age_column}) AS oldest, MAX({age_column}) AS newest
+        FROM {table} WHERE {_where(table, only_lot)}
+    ''', _params(cutoff, only_lot))
+    row = cursor.fetchone()
+    return row['n'], row['oldest'], row['newest']
+
+
+def _move_chunk(conn, table, cutoff, chunk_rows, processed_mark, only_lot=None):
+    """Moves up to chunk_rows due rows in one transaction. Returns (selected, moved)."""
+    spec = ARCHIVES[table]
+    columns = ", ".join(spec['columns'])
+    with conn.cursor() as cursor:
+        # Pick candidates with a plain read (no range locks), then lock only those rows by
+        # primary key and recheck the condition in case one changed in between.
+        cursor.execute(f'''
+            SELECT id FROM {table} WHERE {_where(table, only_lot)}
+            ORDER BY {spec['age_column']} LIMIT %s
+        ''', (*_params(cutoff, only_lot), chunk_rows))
+        selected = [row['id'] for row in cursor.fetchall()]
+        if not selected:
+            conn.commit()
+            return 0, 0
+
+        marks = ", ".join(["%s"] * len(selected))
+        cursor.execute(f"SELECT id FROM {table} WHERE id IN ({marks}) AND {spec['condition']} FOR UPDATE",
+                       (*selected, cutoff))
+        ids = [row['id'] for row in cursor.fetchall()]
+        if ids:
+            marks = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"INSERT IGNORE INTO {spec['archive']} ({columns}) "
+                           f"SELECT {columns} FROM {table} WHERE id IN ({marks})", ids)
+            if table == 'parking_sessions':
+                # Their alert bookkeeping is done with too. The newest processed row always stays:
+                # the alert worker resumes from MAX(id) in processed_sessions.
+                cursor.execute(f"DELETE FROM processed_sessions WHERE id IN ({marks}) AND id < %s",
+                               (*ids, processed_mark))
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({marks})", ids)
+        conn.commit()
+        return len(selected), len(ids)
+
+
+def archive_table(conn, table, cutoff, chunk_rows=MAINTENANCE_CHUNK_ROWS, pause=MAINTENANCE_PAUSE_SECONDS,
+                  only_lot=None):
+    """Moves every due row of `table` into its archive, a chunk at a time. Returns rows moved."""
+    spec = ARCHIVES[table]
+    with conn.cursor() as cursor:
+        count, oldest, _ = due_rows(cursor, table, cutoff, only_lot)
+        if not count:
+            conn.commit()
+            return 0
+        months = missing_partitions(cursor, spec['archive'], _month_start(oldest), _month_start(cutoff))
+        if months:
+            add_partitions(cursor, spec['archive'], months)
+            print(f"Maintenance: added {len(months)} partitions to {spec['archive']}")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS mark FROM processed_sessions")
+        processed_mark = cursor.fetchone()['mark']
+        conn.commit()
+
+    moved = 0
+    retries = 0
+    while True:
+        try:
+            selected, chunk_moved = _move_chunk(conn, table, cutoff, chunk_rows, processed_mark, only_lot)
+        except pymysql.err.OperationalError as e:
+            # Lock wait timeout / deadlock with live traffic: back off and try the chunk again
+            conn.rollback()
+            retries += 1
+            if retries > MAX_CHUNK_RETRIES:
+                print(f"Maintenance: giving up on {table} for this run after {retries} failed chunks ({e})")
+                break
+            time.sleep(pause * 10 * retries)
+            continue
+        retries = 0
+        moved += chunk_moved
+        if selected < chunk_rows:
+            break
+        time.sleep(pause)
+    return moved
+
+
+def drop_expired_partitions(conn, table, now=None):
+    archive = ARCHIVES[table]['archive']
+    with conn.cursor() as cursor:
+        names = expired_partitions(cursor, archive, now)
+        if names:
+            cursor.execute(f"ALTER TABLE {archive} DROP PARTITION {', '.join(names)}")
+            print(f"Maintenance: dropped {', '.join(names)} from {archive}")
+    return names
+
+
+def _connect():
+    # Unpooled on purpose: the session settings below must not leak into app connections
+    conn = db.connect()
+    with conn.cursor() as cursor:
+        cursor.execute("SET SESSION innodb_lock_wait_timeout = %s", (LOCK_WAIT_SECONDS,))
+    return conn
+
+
+def run_maintenance(now=None, dry_run=False, chunk_rows=MAINTENANCE_CHUNK_ROWS, pause=MAINTENANCE_PAUSE_SECONDS):
+    """
+    One maintenance pass: archives due reservations and sessions, then drops archive months
+    past ARCHIVE_KEEP_MONTHS. With dry_run, only reports what would happen. Returns
+    {table: rows moved (or due, for a dry run)}.
+    """
+    now = now or datetime.now()
+    if not dry_run:
+        migrate()
+    conn = _connect()
+    report = {}
+    try:
+        if dry_run:
+            with conn.cursor() as cursor:
+                for table, cutoff in cutoffs(now).items():
+                    spec = ARCHIVES[table]
+                    count, oldest, newest = due_rows(cursor, table, cutoff)
+                    report[table] = count
+                    print(f"{table}: {count} rows before {cutoff:%Y-%m-%d %H:%M} would move to {spec['archive']}"
+                          + (f" ({oldest} .. {newest})" if count else ""))
+                    if count:
+                        months = missing_partitions(cursor, spec['archive'], _month_start(oldest), _month_start(cutoff))
+                        if months:
+                            print(f"  would add partitions {', '.join(f'p{month:%Y%m}' for month in months)}")
+                    names = expired_partitions(cursor, spec['archive'], now)
+                    if names:
+                        print(f"  would drop partitions {', '.join(names)} (ARCHIVE_KEEP_MONTHS={ARCHIVE_KEEP_MONTHS})")
+            return report
+
+        # One maintainer at a time across hosts; a second one just skips this pass
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK('spms_maintenance', 0) AS locked")
+            if not cursor.fetchone()['locked']:
+                print("Maintenance: another run is in progress, skipping")
+                return report
+        try:
+            for table, cutoff in cutoffs(now).items():
+                started = time.perf_counter()
+                report[table] = archive_table(conn, table, cutoff, chunk_rows, pause)
+                print(f"Maintenance: archived {report[table]} {table} rows in {time.perf_counter() - started:.1f}s")
+                drop_expired_partitions(conn, table, now)
+        finally:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT RELEASE_LOCK('spms_maintenance')")
+                cursor.fetchone()
+    finally:
+        conn.close()
+    return report
+
+
+# Benchmark -----------------------------------------------------------------------------
+
+BENCH_LOT = 'Bench Lot'
+BENCH_PLATES = 5000
+
+
+def _bench_queries():
+    """Hot-table queries from the app, the alert worker and the admin dashboard, aimed at the bench lot."""
+    from admin_queries import page_query
+    from migrations import HOT_QUERIES
+    from session_alert import EXPECTED_PLATE
+
+    params = {
+        'latest unpaid session': ("BENCH 0001",),
+        'slot availability': (BENCH_LOT, "Slot 1"),
+        'lot occupancy': (BENCH_LOT,),
+    }
+    queries = [(name, query, params.get(name, default)) for name, query, default in HOT_QUERIES]
+    queries.append(("alert worker cycle", '''
+        SELECT ps.id, ps.license_plate, %s AS expected_plate FROM parking_sessions ps
+        WHERE ps.id > (SELECT COALESCE(MAX(id), 0) - 100 FROM parking_sessions)
+          AND NOT EXISTS (SELECT 1 FROM processed_sessions p WHERE p.id = ps.id)
+    ''', (EXPECTED_PLATE,)))
+    for label, filters in (("admin sessions by lot", {'lot': BENCH_LOT}), ("admin unpaid sessions", {'paid': 0})):
+        query, query_params = page_query('parking_sessions', filters, sort='start_time', order='desc')
+        queries.append((label, query, tuple(query_params)))
+    query, query_params = page_query('reservations', {'lot': BENCH_LOT}, sort='reservation_expiry', order='desc')
+    queries.append(("admin reservations by lot", query, tuple(query_params)))
+    return queries
+
+
+def _time_queries(conn, queries, repeat):
+    timings = {}
+    with conn.cursor() as cursor:
+        for name, query, params in queries:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(query, params)
+                cursor.fetchall()
+                samples.append(time.perf_counter() - started)
+            conn.commit()
+            samples.sort()
+            timings[name] = (samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))])
+    return timings
+
+
+def _table_rows(conn):
+    with conn.cursor() as cursor:
+        counts = {}
+        for table in ('reservations', 'parking_sessions'):
+            cursor.execute(f"SELECT COUNT(*) AS n FROM {table}")
+            counts[table] = cursor.fetchone()['n']
+        conn.commit()
+    return counts
+
+
+def _load_synthetic_year(conn, now, days, per_day, batch_rows=10000):
+    """A year of bench-lot history: mostly paid sessions, a few unpaid, one reservation per session."""
+    sessions, reservations = [], []
+    with conn.cursor() as cursor:
+        def flush():
+            cursor.executemany('''
+                INSERT INTO parking_sessions (license_plate, lot_name, slot_name, start_time, end_time, duration, paid)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', sessions)
+            cursor.executemany('''
+                INSERT INTO reservations (license_plate, lot_name, slot_name, reservation_expiry)
+                VALUES (%s, %s, %s, %s)
+            ''', reservations)
+            conn.commit()
+            sessions.clear()
+            reservations.clear()
+
+        i = 0
+        for day in range(days, 0, -1):
+            day_start = now - timedelta(days=day)
+            for n in range(per_day):
+                i += 1
+                plate = f"BENCH {i % BENCH_PLATES:04d}"
+                slot = f"Slot {i % 50 + 1}"
+                start = day_start + timedelta(seconds=n * 86400 // per_day)
+                duration = 600 + i * 37 % 7200
+                end = start + timedelta(seconds=duration)
+                sessions.append((plate, BENCH_LOT, slot, start, end, duration, int(i % 50 != 0)))
+                reservations.append((plate, BENCH_LOT, slot, start))
+                if len(sessions) >= batch_rows:
+                    flush()
+        flush()
+    return i
+
+
+def _delete_bench_rows(conn):
+    with conn.cursor() as cursor:
+        for table in ('reservations', 'parking_sessions', 'reservations_archive', 'parking_sessions_archive'):
+            while True:
+                cursor.execute(f"DELETE FROM {table} WHERE lot_name = %s LIMIT 10000", (BENCH_LOT,))
+                conn.commit()
+                if cursor.rowcount < 10000:
+                    break
+
+
+def benchmark(days=365, per_day=2000, repeat=50):
+    """Times hot-table queries with a synthetic year of history, then again after archiving it."""
+    migrate()
+    now = datetime.now()
+    conn = _connect()
+    try:
+        print(f"Loading {days} days x {per_day} bench sessions and reservations...")
+        _load_synthetic_year(conn, now, days, per_day)
+        queries = _bench_queries()
+        # Warm the buffer pool once so both passes measure steady-state latency
+        _time_queries(conn, queries, 1)
+        before_rows = _table_rows(conn)
+        before = _time_queries(conn, queries, repeat)
+
+        started = time.perf_counter()
+        moved = {table: archive_table(conn, table, cutoff, pause=0, only_lot=BENCH_LOT)
+                 for table, cutoff in cutoffs(now).items()}
+        elapsed = time.perf_counter() - started
+        print(f"Archived {moved} in {elapsed:.1f}s")
+
+        _time_queries(conn, queries, 1)
+        after_rows = _table_rows(conn)
+        after = _time_queries(conn, queries, repeat)
+
+        for table in before_rows:
+            print(f"{table}: {before_rows[table]} rows -> {after_rows[table]}")
+        print(f"{'query':<28}{'before p50':>12}{'p99':>10}{'after p50':>12}{'p99':>10}")
+        for name, _, _ in queries:
+            (b50, b99), (a50, a99) = before[name], after[name]
+            print(f"{name:<28}{b50 * 1000:>10.2f}ms{b99 * 1000:>8.2f}ms{a50 * 1000:>10.2f}ms{a99 * 1000:>8.2f}ms")
+    finally:
+        _delete_bench_rows(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archive expired reservations and old paid sessions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="Archive due rows (once, or forever with --every)")
+    run.add_argument('--dry-run', action='store_true', help="Only report what would be moved or dropped")
+    run.add_argument('--every', type=float, nargs='?', const=MAINTENANCE_INTERVAL_SECONDS,
+                     help="Repeat every N seconds (default MAINTENANCE_INTERVAL_SECONDS)")
+    bench = commands.add_parser('bench', help="Hot-table query latency before/after archiving a synthetic year")
+    bench.add_argument('--days', type=int, default=365)
+    bench.add_argument('--per-day', type=int, default=2000)
+    bench.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.days, args.per_day, args.repeat)
+    else:
+        while True:
+            try:
+                run_maintenance(dry_run=args.dry_run)
+            except pymysql.MySQLError as e:
+                print(f"Maintenance run failed: {e}")
+            if args.dry_run or not args.every:
+                break
+            time.sleep(args.every)
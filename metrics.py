@@ -0,0 +1,452 @@
+import bisect
+import contextvars
+import os
+import random
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# In-process metrics in the Prometheus text format: counters, gauges and histograms,
+# plus hooks for the web apps and the pool's cursors. Each process keeps its own
+# numbers and serves them with serve() on a port of its own: web workers on
+# METRICS_WEB_PORT + their slot (gunicorn.conf.py), other processes on METRICS_PORT.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 1.0))  # Share of timings recorded (scaled back up)
+METRICS_PORT = os.getenv('METRICS_PORT')  # Port for serve() in processes without a web app
+METRICS_WEB_PORT = os.getenv('METRICS_WEB_PORT')  # First port for web worker processes, one port each
+METRICS_WEB_PORTS = int(os.getenv('METRICS_WEB_PORTS', 16))  # Ports from METRICS_WEB_PORT tried by ASGI workers
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = METRICS_ENABLED
+_sample_rate = METRICS_SAMPLE_RATE if METRICS_ENABLED else 0.0
+_weight = 1.0 / _sample_rate if _sample_rate > 0 else 0.0
+
+
+def configure(enabled=None, sample_rate=None):
+    """Changes the enabled flag / sample rate at runtime (used by the benchmark)."""
+    global _enabled, _sample_rate, _weight
+    if enabled is not None:
+        _enabled = enabled
+    if sample_rate is not None:
+        _sample_rate = sample_rate
+    rate = _sample_rate if _enabled else 0.0
+    _weight = 1.0 / rate if rate > 0 else 0.0
+
+
+def sampled():
+    """True if the current operation should be timed; every one at sample rate 1, none when disabled."""
+    rate = _sample_rate if _enabled else 0.0
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def sampling_weight():
+    """Weight for an observation that was sampled: how many operations it stands for."""
+    return _weight
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}  # Label values tuple -> value
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1.0):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+                                 for labels, value in values]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._functions = {}  # Label values tuple -> callable read at scrape time
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, fn, *labels):
+        """Reads the value from fn() at scrape time instead (queue depths, pool sizes)."""
+        with self._lock:
+            self._functions[labels] = fn
+
+    def remove(self, *labels):
+        with self._lock:
+            self._values.pop(labels, None)
+            self._functions.pop(labels, None)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for labels, fn in functions:
+            try:
+                values[labels] = fn()
+            except Exception:
+                pass  # A gone object shouldn't break the scrape
+        return self._header() + [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+                                 for labels, value in values.items()]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels, weight=_weight)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels, weight=1.0):
+        """Records one value; `weight` > 1 stands in for unsampled observations."""
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0.0] * (len(self.buckets) + 1), 0.0, 0.0]
+            entry[0][i] += weight
+            entry[1] += value * weight
+            entry[2] += weight
+
+    def time(self, *labels):
+        """Context manager timing its block into the histogram, subject to sampling."""
+        return _Timer(self, labels) if sampled() else _NULL_TIMER
+
+    def render(self):
+        with self._lock:
+            values = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        lines = self._header()
+        for labels, counts, total, count in values:
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, labels, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {_format_value(count)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get_or_create(self, cls, name, help, labels, **kwargs):
+        # Same name -> same metric, so several modules can record into one series
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            return metric
+
+    def add_collector(self, fn):
+        """fn() -> iterable of (name, kind, help, {label: value}, value), called at scrape time."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def remove_collector(self, fn):
+        with self._lock:
+            if fn in self._collectors:
+                self._collectors.remove(fn)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        families = {}  # Collected samples grouped per metric name, as the format requires
+        for fn in collectors:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                print(f"Metrics collector {fn.__name__} failed: {e}")
+                continue
+            for name, kind, help, labels, value in samples:
+                family = families.setdefault(name, [f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+                family.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        for family in families.values():
+            lines.extend(family)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name, help, labels=()):
+    return registry._get_or_create(Counter, name, help, labels)
+
+
+def gauge(name, help, labels=()):
+    return registry._get_or_create(Gauge, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return registry._get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+
+add_collector = registry.add_collector
+remove_collector = registry.remove_collector
+render = registry.render
+
+
+# --- SQL ---
+
+SQL_SECONDS = histogram('sql_query_seconds', "SQL statement latency", ('statement', 'table'))
+SQL_QUERIES = counter('sql_queries_total', "SQL statements executed (exact, unsampled)", ('statement', 'table'))
+
+_STATEMENT = re.compile(r'^\s*\(?\s*(\w+)')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+`?(\w+)', re.IGNORECASE)
+_labels_by_query = {}  # Query text -> (statement, table); the app has a fixed set of queries
+_request_queries = contextvars.ContextVar('request_queries', default=None)  # [count] for the current request
+
+
+def query_label(query):
+    """(statement, first table) for a query, e.g. ('SELECT', 'parking_sessions')."""
+    label = _labels_by_query.get(query)
+    if label is None:
+        statement = _STATEMENT.match(query)
+        table = _TABLE.search(query)
+        label = (statement.group(1).upper() if statement else 'OTHER', table.group(1) if table else '')
+        if len(_labels_by_query) < 2000:  # Bounded in case something builds queries dynamically
+            _labels_by_query[query] = label
+    return label
+
+
+def sql_timer(query):
+    """Counts one statement (also towards the current request) and times it if sampled."""
+    if not _enabled:
+        return _NULL_TIMER
+    label = query_label(query if isinstance(query, str) else query.decode(errors='replace'))
+    SQL_QUERIES.inc(*label)
+    request_queries = _request_queries.get()
+    if request_queries is not None:
+        request_queries[0] += 1
+    return SQL_SECONDS.time(*label)
+
+
+# --- Web apps ---
+
+HTTP_SECONDS = histogram('http_request_seconds', "Request latency until the response is returned",
+                         ('endpoint', 'method', 'status'))
+HTTP_SQL_QUERIES = histogram('http_request_sql_queries', "SQL statements per request", ('endpoint',),
+                             buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34))
+
+
+def _request_started():
+    return time.perf_counter() if sampled() else None, _request_queries.set([0])
+
+
+def _request_finished(state, endpoint, method, status):
+    started, token = state
+    queries = _request_queries.get()
+    _request_queries.reset(token)
+    endpoint = endpoint or 'unmatched'
+    if started is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - started, endpoint, method, str(status), weight=_weight)
+    HTTP_SQL_QUERIES.observe(queries[0], endpoint)
+
+
+def instrument_flask(app):
+    """Per-endpoint latency and SQL count for every request of a Flask app."""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics = _request_started()
+
+    @app.after_request
+    def _metrics_finish(response):
+        state = g.pop('_metrics', None)
+        if state is not None:
+            _request_finished(state, request.endpoint, request.method, response.status_code)
+        return response
+
+    return app
+
+
+def instrument_quart(app):
+    """instrument_flask() for the Quart app; hooks are coroutines so they don't run in a thread."""
+    from quart import g, request
+
+    @app.before_request
+    async def _metrics_start():
+        g._metrics = _request_started()
+
+    @app.after_request
+    async def _metrics_finish(response):
+        state = g.pop('_metrics', None)
+        if state is not None:
+            _request_finished(state, request.endpoint, request.method, response.status_code)
+        return response
+
+    return app
+
+
+def serve(port=METRICS_PORT, host='0.0.0.0', tries=1):
+    """
+    Serves /metrics from a background thread. With tries > 1 the first free port of
+    port .. port + tries - 1 is taken (workers without a fixed slot). Returns the server or None.
+    """
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would drown the console
+
+    for candidate in range(int(port), int(port) + tries):
+        try:
+            server = ThreadingHTTPServer((host, candidate), Handler)
+            break
+        except OSError as e:
+            error = e
+    else:
+        print(f"Metrics endpoint disabled, port {port} unavailable ({error})")
+        return None
+    port = candidate
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+if __name__ == "__main__":
+    # Overhead benchmark: cost per timed operation at full, sampled and disabled instrumentation,
+    # and per request on a minimal Flask app with and without the hooks.
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure instrumentation overhead")
+    parser.add_argument('--operations', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--sample-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    bench = histogram('bench_seconds', "Benchmark only", ('stage',))
+    query = "SELECT * FROM parking_sessions WHERE license_plate = %s"
+
+    def loop(timed):
+        started = time.perf_counter()
+        for _ in range(args.operations):
+            with timed():
+                pass
+        return (time.perf_counter() - started) / args.operations * 1e9
+
+    baseline = loop(lambda: _NULL_TIMER)
+    for label, enabled, rate in (("full", True, 1.0), (f"sampled {args.sample_rate:g}", True, args.sample_rate),
+                                 ("disabled", False, 1.0)):
+        configure(enabled=enabled, sample_rate=rate)
+        stage = loop(lambda: bench.time('bench'))
+        sql = loop(lambda: sql_timer(query))
+        print(f"{label:>14}: timer {stage - baseline:6.0f}ns/op, SQL hook {sql - baseline:6.0f}ns/op")
+
+    try:
+        from flask import Flask
+    except ImportError:
+        raise SystemExit("Flask not installed; skipping the request benchmark")
+
+    def requests_per_second(instrumented):
+        app = Flask('bench')
+        app.add_url_rule('/', 'index', lambda: 'ok')
+        if instrumented:
+            instrument_flask(app)
+        client = app.test_client()
+        for _ in range(200):
+            client.get('/')
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            client.get('/')
+        return args.requests / (time.perf_counter() - started)
+
+    configure(enabled=True, sample_rate=1.0)
+    plain = requests_per_second(False)
+    for label, rate in (("full", 1.0), (f"sampled {args.sample_rate:g}", args.sample_rate)):
+        configure(sample_rate=rate)
+        instrumented = requests_per_second(True)
+        print(f"{label:>14}: {instrumented:8.0f} req/s vs {plain:8.0f} uninstrumented "
+              f"({(plain / instrumented - 1) * 100:+.1f}% per-request cost)")
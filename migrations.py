@@ -0,0 +1,298 @@
+import sys
+
+from db import get_db_connection
+
+# Every migration is (version, description, function taking a cursor). Append only;
+# never edit a migration that has shipped.
+
+
+def _index_exists(cursor, table, index_name):
+    cursor.execute('''
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    ''', (table, index_name))
+    return cursor.fetchone() is not None
+
+
+def _unique_indexes_on(cursor, table, columns):
+    """Names of the unique indexes (primary key included) over exactly `columns`, in that order."""
+    cursor.execute('''
+        SELECT index_name AS index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index) AS index_columns
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND non_unique = 0
+        GROUP BY index_name
+    ''', (table,))
+    wanted = ','.join(column.strip().lower() for column in columns.split(','))
+    return [row['index_name'] for row in cursor.fetchall() if row['index_columns'].lower() == wanted]
+
+
+def _add_index(cursor, table, index_name, columns, unique=False):
+    # Tables that predate the migrations may already carry some of these indexes, possibly
+    # under another name (a UNIQUE column gets MySQL's default name, the column's)
+    if _index_exists(cursor, table, index_name):
+        return
+    if unique and _unique_indexes_on(cursor, table, columns):
+        return
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    cursor.execute(f"ALTER TABLE {table} ADD {kind} {index_name} ({columns})")
+
+
+def _0001_core_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            mobile VARCHAR(20) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            license_plate VARCHAR(20) NOT NULL,
+            role VARCHAR(20) NOT NULL DEFAULT 'user',
+            UNIQUE KEY uq_users_email (email)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reservations (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            license_plate VARCHAR(20) NOT NULL,
+            lot_name VARCHAR(100) NOT NULL,
+            slot_name VARCHAR(100) NOT NULL,
+            reservation_expiry DATETIME(6) NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parking_sessions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            license_plate VARCHAR(20) NOT NULL,
+            lot_name VARCHAR(100) NOT NULL,
+            slot_name VARCHAR(100) NOT NULL,
+            start_time DATETIME NOT NULL,
+            end_time DATETIME NULL,
+            duration INT NULL,
+            paid TINYINT(1) NOT NULL DEFAULT 0
+        )
+    ''')
+    # Previously created ad hoc by session_alert.create_processed_sessions_table()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS processed_sessions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            license_plate VARCHAR(255) NOT NULL,
+            lot_name VARCHAR(255) NOT NULL,
+            slot_name VARCHAR(255) NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            processed_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _0002_hot_query_indexes(cursor):
+    # Latest unpaid completed session per plate (login, lots, reserve, payment, confirm_payment):
+    # equality on plate and paid, then end_time for both the IS NOT NULL range and ORDER BY.
+    _add_index(cursor, 'parking_sessions', 'idx_ps_plate_unpaid', 'license_plate, paid, end_time')
+    # Slot availability and validate_entry: equality on lot and slot, range on expiry
+    _add_index(cursor, 'reservations', 'idx_res_slot_expiry', 'lot_name, slot_name, reservation_expiry')
+    # Occupancy index full load: range on expiry, covering lot and slot
+    _add_index(cursor, 'reservations', 'idx_res_expiry', 'reservation_expiry, lot_name, slot_name')
+    # Login lookup
+    _add_index(cursor, 'users', 'uq_users_email', 'email', unique=True)
+
+
+def _0003_session_keys(cursor):
+    # Idempotency key for sessions written by the camera pipeline: retried batches and
+    # journal replays are no-ops on a repeated key, so a row can never be written twice.
+    cursor.execute("SHOW COLUMNS FROM parking_sessions LIKE 'session_key'")
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE parking_sessions ADD COLUMN session_key CHAR(40) NULL")
+    _add_index(cursor, 'parking_sessions', 'uq_ps_session_key', 'session_key', unique=True)
+
+
+def _0004_lot_catalog(cursor):
+    # Lots and their slots, in display order. catalog_version is bumped on every edit so
+    # running processes know to reload their in-memory copy (catalog.py).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lots (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            position INT NOT NULL DEFAULT 0,
+            UNIQUE KEY uq_lots_name (name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS slots (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            lot_id INT NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            position INT NOT NULL DEFAULT 0,
+            UNIQUE KEY uq_slots_lot_name (lot_id, name),
+            FOREIGN KEY (lot_id) REFERENCES lots (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT IGNORE INTO catalog_version (id, version) VALUES (1, 1)")
+
+    # Seed the layout the app used to hard-code: Lot A-D with Slot 1-8 each
+    cursor.execute("SELECT COUNT(*) AS n FROM lots")
+    if cursor.fetchone()['n'] == 0:
+        for lot_position, letter in enumerate('ABCD'):
+            cursor.execute("INSERT INTO lots (name, position) VALUES (%s, %s)", (f"Lot {letter}", lot_position))
+            lot_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO slots (lot_id, name, position) VALUES (%s, %s, %s)",
+                [(lot_id, f"Slot {i}", i) for i in range(1, 9)],
+            )
+
+
+def _0005_archive_tables(cursor):
+    # Where maintenance.py moves old rows. Partitioned by month on the column that ages
+    # them out (maintenance adds a partition per month as it goes, so pmax stays empty and
+    # whole months can later be dropped instantly). MySQL requires the partitioning column
+    # in every unique key, hence the composite primary keys.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reservations_archive (
+            id INT NOT NULL,
+            license_plate VARCHAR(20) NOT NULL,
+            lot_name VARCHAR(100) NOT NULL,
+            slot_name VARCHAR(100) NOT NULL,
+            reservation_expiry DATETIME(6) NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, reservation_expiry),
+            INDEX idx_resa_plate (license_plate, reservation_expiry)
+        )
+        PARTITION BY RANGE (TO_DAYS(reservation_expiry)) (PARTITION pmax VALUES LESS THAN MAXVALUE)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parking_sessions_archive (
+            id INT NOT NULL,
+            license_plate VARCHAR(20) NOT NULL,
+            lot_name VARCHAR(100) NOT NULL,
+            slot_name VARCHAR(100) NOT NULL,
+            start_time DATETIME NOT NULL,
+            end_time DATETIME NOT NULL,
+            duration INT NULL,
+            paid TINYINT(1) NOT NULL,
+            session_key CHAR(40) NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, end_time),
+            INDEX idx_psa_plate (license_plate, end_time)
+        )
+        PARTITION BY RANGE (TO_DAYS(end_time)) (PARTITION pmax VALUES LESS THAN MAXVALUE)
+    ''')
+    # Lets the sweeper find paid, closed sessions past retention without scanning the table
+    _add_index(cursor, 'parking_sessions', 'idx_ps_paid_end', 'paid, end_time')
+
+
+def _0006_drop_duplicate_email_index(cursor):
+    # Migration 2 used to add uq_users_email even where users.email was already UNIQUE
+    # under another name; the second index only slows writes down
+    if len(_unique_indexes_on(cursor, 'users', 'email')) > 1 and _index_exists(cursor, 'users', 'uq_users_email'):
+        cursor.execute("ALTER TABLE users DROP INDEX uq_users_email")
+
+
+MIGRATIONS = [
+    (1, "Create users, reservations, parking_sessions and processed_sessions", _0001_core_tables),
+    (2, "Indexes for hot parking_sessions / reservations queries", _0002_hot_query_indexes),
+    (3, "Idempotency key for pipeline-written parking_sessions", _0003_session_keys),
+    (4, "Lot and slot catalog", _0004_lot_catalog),
+    (5, "Partitioned archive tables for old reservations and sessions", _0005_archive_tables),
+    (6, "Drop the redundant uq_users_email where email already had a unique index", _0006_drop_duplicate_email_index),
+]
+
+
+def migrate():
+    """Applies every pending migration in order. Safe to call from several processes at once."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            # Serialize concurrent migrators (web startup, camera loop, alert worker, maintenance)
+            cursor.execute("SELECT GET_LOCK('spms_migrations', 60) AS locked")
+            if not cursor.fetchone()['locked']:
+                raise RuntimeError("Timed out waiting for the migration lock")
+            try:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        description VARCHAR(255) NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute("SELECT version FROM schema_migrations")
+                applied = {row['version'] for row in cursor.fetchall()}
+
+                for version, description, apply in MIGRATIONS:
+                    if version in applied:
+                        continue
+                    print(f"Applying migration {version}: {description}")
+                    apply(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (version, description),
+                    )
+                    conn.commit()
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK('spms_migrations')")
+                cursor.fetchone()
+    finally:
+        conn.close()
+
+
+# Hot queries that must be served by an index. Parameters are representative values only.
+HOT_QUERIES = [
+    ("latest unpaid session", '''
+        SELECT * FROM parking_sessions
+        WHERE license_plate = %s AND paid = 0 AND end_time IS NOT NULL
+        ORDER BY end_time DESC
+        LIMIT 1
+    ''', ("KA 01 AB 1234",)),
+    ("slot availability", '''
+        SELECT id FROM reservations
+        WHERE lot_name = %s AND slot_name = %s AND reservation_expiry > NOW()
+        LIMIT 1
+    ''', ("Lot A", "Slot 1")),
+    ("lot occupancy", '''
+        SELECT lot_name, slot_name, MAX(reservation_expiry) AS reservation_expiry
+        FROM reservations
+        WHERE reservation_expiry > NOW() AND lot_name = %s
+        GROUP BY lot_name, slot_name
+    ''', ("Lot A",)),
+    ("all occupancy", '''
+        SELECT lot_name, slot_name, MAX(reservation_expiry) AS reservation_expiry
+        FROM reservations
+        WHERE reservation_expiry > NOW()
+        GROUP BY lot_name, slot_name
+    ''', ()),
+    ("login", '''
+        SELECT * FROM users WHERE email = %s AND password = %s
+    ''', ("driver@example.com", "secret")),
+]
+
+
+def check_query_plans(queries=HOT_QUERIES):
+    """Runs EXPLAIN on each hot query and returns a list of those that fall back to a full scan."""
+    full_scans = []
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            for name, query, params in queries:
+                cursor.execute("EXPLAIN " + query, params)
+                for step in cursor.fetchall():
+                    if step['type'] == 'ALL':
+                        full_scans.append((name, step['table'], step.get('Extra')))
+    finally:
+        conn.close()
+    return full_scans
+
+
+if __name__ == "__main__":
+    migrate()
+    if '--check-plans' in sys.argv:
+        problems = check_query_plans()
+        for name, table, extra in problems:
+            print(f"FULL SCAN: {name} on {table} ({extra})")
+        if problems:
+            sys.exit(1)
+        print(f"All {len(HOT_QUERIES)} hot queries use an index.")
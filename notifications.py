@@ -0,0 +1,229 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+ALERT_TRANSPORT = os.getenv('ALERT_TRANSPORT', 'twilio')  # 'twilio' or 'log'
+ALERT_WORKERS = int(os.getenv('ALERT_WORKERS', 2))
+ALERT_QUEUE_SIZE = int(os.getenv('ALERT_QUEUE_SIZE', 1000))
+ALERT_COALESCE_SECONDS = float(os.getenv('ALERT_COALESCE_SECONDS', 60))  # Drop repeats of the same alert within this window
+ALERT_MAX_ATTEMPTS = int(os.getenv('ALERT_MAX_ATTEMPTS', 4))
+ALERT_BACKOFF_SECONDS = float(os.getenv('ALERT_BACKOFF_SECONDS', 1))
+
+DELIVERY_SECONDS = metrics.histogram('alert_delivery_seconds', "Alert queued to accepted by the SMS provider",
+                                     buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+class TwilioTransport:
+    """Sends SMS through Twilio with a single client built on first use."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self.from_number = os.getenv("TWILIO_NO")
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from twilio.rest import Client
+                    self._client = Client(os.getenv("ACCOUNT_SID"), os.getenv("AUTH_TOKEN"))
+        return self._client
+
+    def send(self, to, body):
+        message = self._get_client().messages.create(body=body, from_=self.from_number, to=to)
+        return message.sid
+
+
+class LogTransport:
+    """Local fake SMS sink: records messages in memory instead of sending them."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay  # Simulated provider latency in seconds
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to, body):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.sent.append((to, body))
+            return f"local-{len(self.sent)}"
+
+
+def default_transport():
+    if ALERT_TRANSPORT == 'log':
+        return LogTransport()
+    return TwilioTransport()
+
+
+class AlertDispatcher:
+    """Bounded in-process alert queue drained by a pool of worker threads."""
+
+    def __init__(self, transport=None, workers=ALERT_WORKERS, maxsize=ALERT_QUEUE_SIZE,
+                 coalesce_seconds=ALERT_COALESCE_SECONDS, max_attempts=ALERT_MAX_ATTEMPTS,
+                 backoff_seconds=ALERT_BACKOFF_SECONDS):
+        self.transport = transport
+        self.workers = workers
+        self.coalesce_seconds = coalesce_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._recent = {}  # Coalescing key -> time.monotonic() it was last accepted
+        self._lock = threading.Lock()
+        self._threads = []
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            if self.transport is None:
+                self.transport = default_transport()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"alert-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, to, body, key=None):
+        """Queues an SMS without blocking. Returns False if it was coalesced or dropped."""
+        self.start()
+        now = time.monotonic()
+        key = key if key is not None else (to, body)
+
+        with self._lock:
+            last = self._recent.get(key)
+            if last is not None and now - last < self.coalesce_seconds:
+                self.coalesced += 1
+                return False
+            if len(self._recent) > 10000:
+                # Forget keys whose window has passed
+                self._recent = {k: t for k, t in self._recent.items() if now - t < self.coalesce_seconds}
+            self._recent[key] = now
+
+        try:
+            self._queue.put_nowait((to, body, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"Alert queue full, dropping alert to {to}")
+            return False
+
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            try:
+                self._deliver(*item)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, to, body, enqueued_at):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                sid = self.transport.send(to, body)
+                DELIVERY_SECONDS.observe(time.monotonic() - enqueued_at)
+                with self._lock:
+                    self.sent += 1
+                print(f"Alert sent to {to}: {sid}")
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    with self._lock:
+                        self.failed += 1
+                    print(f"Failed to send alert to {to} after {attempt} attempts: {e}")
+                    return
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+    def flush(self, timeout=None):
+        """Blocks until every queued alert has been delivered or given up on."""
+        if not self._threads:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'enqueued': self.enqueued,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'sent': self.sent,
+                'retries': self.retries,
+                'failed': self.failed,
+            }
+
+
+dispatcher = AlertDispatcher()
+
+
+def _dispatcher_metrics():
+    stats = dispatcher.stats()
+    yield 'alert_queue_depth', 'gauge', "Alerts waiting for a worker", {}, stats.pop('queued')
+    for key, value in stats.items():
+        yield f'alerts_{key}_total', 'counter', f"Alerts {key} since start", {}, value
+
+
+metrics.add_collector(_dispatcher_metrics)
+
+# Give in-flight alerts a moment to go out when the process exits
+atexit.register(dispatcher.flush, 5)
+
+
+def send_sms(to, body, key=None):
+    """Queues an SMS on the shared dispatcher; returns immediately."""
+    return dispatcher.enqueue(to, body, key=key)
+
+
+if __name__ == "__main__":
+    # Benchmark: enqueue latency against a slow local fake SMS sink
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure alert enqueue latency")
+    parser.add_argument('--alerts', type=int, default=1000)
+    parser.add_argument('--provider-delay', type=float, default=0.2)
+    args = parser.parse_args()
+
+    sink = LogTransport(delay=args.provider_delay)
+    bench = AlertDispatcher(transport=sink, workers=4, maxsize=args.alerts, coalesce_seconds=60)
+
+    latencies = []
+    for i in range(args.alerts):
+        # Every other alert repeats the previous plate, so half are coalesced
+        started = time.perf_counter()
+        bench.enqueue("+910000000000", f"Alert for plate {i // 2}", key=i // 2)
+        latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"enqueue p50={p50 * 1e6:.1f}us p99={p99 * 1e6:.1f}us (provider delay {args.provider_delay}s)")
+    bench.flush()
+    print(f"Dispatcher stats: {bench.stats()}")
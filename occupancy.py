@@ -0,0 +1,231 @@
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+
+from db import get_db_connection
+
+# How long a lot's cached view may go without a reload from MySQL. Reservations made
+# by other worker processes become visible after at most this many seconds.
+OCCUPANCY_MAX_AGE = float(os.getenv('OCCUPANCY_MAX_AGE', 30))
+
+
+def parse_expiry(value):
+    """Normalizes a reservation_expiry column value (datetime or string) to a datetime."""
+    if not isinstance(value, str):
+        return value
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+    except ValueError:
+        # Fallback if no fractional seconds are present
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+def _active_reservations_query(lot_name=None):
+    query = '''
+        SELECT lot_name, slot_name, MAX(reservation_expiry) AS reservation_expiry
+        FROM reservations
+        WHERE reservation_expiry > NOW()
+    '''
+    params = ()
+    if lot_name is not None:
+        query += ' AND lot_name = %s'
+        params = (lot_name,)
+    query += ' GROUP BY lot_name, slot_name'
+    return query, params
+
+
+def _reservation_rows(rows):
+    return [(row['lot_name'], row['slot_name'], parse_expiry(row['reservation_expiry'])) for row in rows]
+
+
+def load_active_reservations(lot_name=None):
+    """Fetches (lot_name, slot_name, reservation_expiry) for every unexpired reservation."""
+    query, params = _active_reservations_query(lot_name)
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+    return _reservation_rows(rows)
+
+
+async def load_active_reservations_async(lot_name=None):
+    """load_active_reservations() on the async pool, for the ASGI app."""
+    from db import fetch_all_async
+
+    return _reservation_rows(await fetch_all_async(*_active_reservations_query(lot_name)))
+
+
+class SlotOccupancyIndex:
+    """In-process map of (lot, slot) -> reservation expiry, evicted by a heap of expiries."""
+
+    def __init__(self, loader=load_active_reservations, max_age=OCCUPANCY_MAX_AGE):
+        self._loader = loader
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._lots = {}  # lot_name -> {slot_name: expiry}
+        self._expiries = []  # Heap of (expiry, lot_name, slot_name); may hold stale entries
+        self._loaded_at = {}  # lot_name -> monotonic time of its last reload (None = invalidated)
+        self._all_loaded_at = None  # Monotonic time of the last full load
+        self._listeners = []  # Called with (lot_name, slot_name, expiry or None, reason) per change
+
+        self.hits = 0
+        self.misses = 0
+
+    def load_all(self):
+        """Populates every lot from MySQL in one query."""
+        self._apply_all(self._loader())
+
+    def _apply_all(self, rows):
+        with self._lock:
+            previous = self._lots
+            self._lots = {}
+            self._expiries = []
+            for lot_name, slot_name, expiry in rows:
+                self._set(lot_name, slot_name, expiry)
+            self._loaded_at.clear()
+            self._all_loaded_at = time.monotonic()
+            changes = []
+            for lot_name in set(previous) | set(self._lots):
+                changes += self._diff(lot_name, previous.get(lot_name, {}), self._lots.get(lot_name, {}))
+        self._notify(changes)
+
+    def _load_lot(self, lot_name):
+        self._apply_lot(lot_name, self._loader(lot_name))
+
+    def _apply_lot(self, lot_name, rows):
+        with self._lock:
+            previous = self._lots.get(lot_name, {})
+            self._lots[lot_name] = {}
+            for _, slot_name, expiry in rows:
+                self._set(lot_name, slot_name, expiry)
+            self._loaded_at[lot_name] = time.monotonic()
+            changes = self._diff(lot_name, previous, self._lots[lot_name])
+        self._notify(changes)
+
+    @staticmethod
+    def _diff(lot_name, before, after):
+        # Reservations made or removed by other processes, picked up by a reload
+        return [(lot_name, slot_name, after.get(slot_name), 'reload')
+                for slot_name in set(before) | set(after) if before.get(slot_name) != after.get(slot_name)]
+
+    def add_listener(self, listener):
+        """Registers listener(lot_name, slot_name, expiry or None, reason) for every slot change."""
+        self._listeners.append(listener)
+
+    def _notify(self, changes):
+        # Called without the lock, so listeners may read the index
+        for change in changes:
+            for listener in self._listeners:
+                listener(*change)
+
+    def _set(self, lot_name, slot_name, expiry):
+        # Called with the lock held
+        self._lots.setdefault(lot_name, {})[slot_name] = expiry
+        heapq.heappush(self._expiries, (expiry, lot_name, slot_name))
+
+    def _evict(self, now):
+        # Called with the lock held. Pops every expired heap entry that is still current.
+        changes = []
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, lot_name, slot_name = heapq.heappop(self._expiries)
+            slots = self._lots.get(lot_name)
+            if slots is not None and slots.get(slot_name) == expiry:
+                del slots[slot_name]
+                changes.append((lot_name, slot_name, None, 'expiry'))
+        return changes
+
+    def evict_expired(self):
+        """Drops reservations that have expired; returns the next expiry time (None if none)."""
+        with self._lock:
+            changes = self._evict(datetime.now())
+            next_expiry = self._expiries[0][0] if self._expiries else None
+        self._notify(changes)
+        return next_expiry
+
+    def _is_fresh(self, lot_name):
+        # Called with the lock held
+        loaded_at = self._loaded_at.get(lot_name, self._all_loaded_at)
+        return loaded_at is not None and time.monotonic() - loaded_at <= self.max_age
+
+    def _reload_needed(self, lot_name):
+        """None if the lot is fresh, else 'all' (nothing loaded yet) or 'lot'."""
+        with self._lock:
+            if self._is_fresh(lot_name):
+                self.hits += 1
+                return None
+            self.misses += 1
+            return 'all' if self._all_loaded_at is None and not self._loaded_at else 'lot'
+
+    def _current(self, lot_name):
+        with self._lock:
+            changes = self._evict(datetime.now())
+            slots = dict(self._lots.get(lot_name, {}))
+        self._notify(changes)
+        return slots
+
+    def ensure_fresh(self, lot_name):
+        """Reloads the lot from MySQL if its cached view is older than max_age."""
+        reload = self._reload_needed(lot_name)
+        if reload == 'all':
+            self.load_all()
+        elif reload == 'lot':
+            self._load_lot(lot_name)
+
+    async def ensure_fresh_async(self, lot_name, loader=load_active_reservations_async):
+        """ensure_fresh() for the ASGI app: same cache, reloads through the async driver."""
+        reload = self._reload_needed(lot_name)
+        if reload == 'all':
+            self._apply_all(await loader())
+        elif reload == 'lot':
+            self._apply_lot(lot_name, await loader(lot_name))
+
+    def reserved_slots(self, lot_name):
+        """Returns {slot_name: expiry} for the lot's unexpired reservations."""
+        self.ensure_fresh(lot_name)
+        return self._current(lot_name)
+
+    async def reserved_slots_async(self, lot_name):
+        """reserved_slots() for the ASGI app."""
+        await self.ensure_fresh_async(lot_name)
+        return self._current(lot_name)
+
+    def snapshot(self):
+        """Returns {lot_name: {slot_name: expiry}} for everything currently cached, without reloading."""
+        with self._lock:
+            changes = self._evict(datetime.now())
+            lots = {lot_name: dict(slots) for lot_name, slots in self._lots.items()}
+        self._notify(changes)
+        return lots
+
+    def reserve(self, lot_name, slot_name, expiry):
+        """Write-through hook for a newly committed reservation."""
+        with self._lock:
+            current = self._lots.get(lot_name, {}).get(slot_name)
+            if current is not None and expiry <= current:
+                return
+            self._set(lot_name, slot_name, expiry)
+        self._notify([(lot_name, slot_name, expiry, 'reserve')])
+
+    def release(self, lot_name, slot_name):
+        """Write-through hook for a deleted reservation."""
+        with self._lock:
+            removed = self._lots.get(lot_name, {}).pop(slot_name, None)
+        if removed is not None:
+            self._notify([(lot_name, slot_name, None, 'delete')])
+
+    def invalidate(self, lot_name=None):
+        """Forces the next read of the lot (or of every lot) to go to MySQL."""
+        with self._lock:
+            if lot_name is None:
+                self._loaded_at.clear()
+                self._all_loaded_at = None
+            else:
+                self._loaded_at[lot_name] = None
+
+
+occupancy_index = SlotOccupancyIndex()
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime
+
+from catalog import occupancy_board
+from occupancy import OCCUPANCY_MAX_AGE, occupancy_index
+
+OCCUPANCY_EVENT_PORT = int(os.getenv('OCCUPANCY_EVENT_PORT', 8766))  # Local UDP port for camera entry/exit events
+SUBSCRIBER_QUEUE_SIZE = 100  # Messages buffered per browser before it's resynced with a snapshot
+HEARTBEAT_SECONDS = 15  # Keeps proxies from closing idle streams and detects gone clients
+
+# Slot states pushed to browsers, strongest first
+OCCUPIED = 'occupied'  # A camera sees a vehicle in the slot
+RESERVED = 'reserved'
+AVAILABLE = 'available'
+
+
+def publish_camera_event(lot_name, slot_name, kind, plate=None):
+    """Tells the web process's hub a vehicle entered or left a slot (best effort, like the alert wake-up)."""
+    message = json.dumps({'lot': lot_name, 'slot': slot_name, 'kind': kind, 'plate': plate}).encode()
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(message, ("127.0.0.1", OCCUPANCY_EVENT_PORT))
+    except OSError:
+        pass
+
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+class Subscriber:
+    """One browser's stream of encoded messages for a lot."""
+
+    def __init__(self, lot_name, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.lot_name = lot_name
+        self.overflowed = False  # Messages were dropped; the stream sends a fresh snapshot
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        # Called by the hub from any thread; never blocks on a slow browser
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def reset(self):
+        self.overflowed = False
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber for the ASGI app: messages are handed to its event loop instead of a thread."""
+
+    def __init__(self, lot_name, loop, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        super().__init__(lot_name, maxsize)
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._put_nowait, message)
+        except RuntimeError:
+            pass  # Event loop already closed; the stream's finally will unsubscribe
+
+    def _put_nowait(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def reset(self):
+        # asyncio.Queue signals empty with asyncio.QueueEmpty, which isn't a queue.Empty
+        self.overflowed = False
+        while True:
+            try:
+                self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+
+class OccupancyHub:
+    """
+    In-process fan-out of slot changes to browsers watching a lot. Each change (reservation,
+    expiry, deletion, camera entry/exit) is encoded once and queued to every subscriber of
+    its lot, so N viewers cost one state change instead of N slots() queries.
+    """
+
+    def __init__(self, index=occupancy_index, board=occupancy_board, event_port=OCCUPANCY_EVENT_PORT):
+        self.index = index
+        self.board = board  # Holds camera occupancy alongside reservations
+        self.event_port = event_port
+        self._lock = threading.Lock()
+        self._subscribers = {}  # lot_name -> set of Subscriber
+        self._started = False
+        index.add_listener(self._on_index_change)
+
+        self.published = 0
+        self.delivered = 0
+
+    def start(self):
+        """Starts the expiry ticker and the camera event listener (idempotent)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._tick, name="occupancy-hub-tick", daemon=True).start()
+        threading.Thread(target=self._listen, name="occupancy-hub-events", daemon=True).start()
+
+    def subscribe(self, lot_name, loop=None):
+        self.start()
+        subscriber = Subscriber(lot_name) if loop is None else AsyncSubscriber(lot_name, loop)
+        with self._lock:
+            self._subscribers.setdefault(lot_name, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.lot_name)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.lot_name]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, lot_name, slot_name, state, expiry=None, reason=None):
+        with self._lock:
+            subscribers = list(self._subscribers.get(lot_name, ()))
+        if not subscribers:
+            return
+        message = sse('slot', {
+            'slot': slot_name, 'state': state, 'reason': reason, 'sent': time.time(),
+            'expiry': expiry.strftime('%H:%M:%S') if expiry else None,
+        })
+        for subscriber in subscribers:
+            subscriber.put(message)
+        self.published += 1
+        self.delivered += len(subscribers)
+
+    def snapshot(self, lot_name, reserved):
+        """SSE message with every non-available slot; the page marks all others available."""
+        occupied = self.board.occupied_slots(lot_name)
+        slots = {slot_name: {'state': RESERVED, 'expiry': expiry.strftime('%H:%M:%S')}
+                 for slot_name, expiry in reserved.items()}
+        for slot_name in occupied:
+            slots[slot_name] = {'state': OCCUPIED, 'expiry': None}
+        return sse('snapshot', {'slots': slots, 'sent': time.time()})
+
+    def _on_index_change(self, lot_name, slot_name, expiry, reason):
+        occupied = self.board.is_occupied(lot_name, slot_name)
+        state = OCCUPIED if occupied else RESERVED if expiry else AVAILABLE
+        self.publish(lot_name, slot_name, state, expiry, reason)
+
+    def camera_event(self, lot_name, slot_name, kind, plate=None):
+        self.board.set_occupied(lot_name, slot_name, kind == 'entry')
+        if kind == 'entry':
+            self.publish(lot_name, slot_name, OCCUPIED, reason='entry')
+        else:
+            expiry = self.index.reserved_slots(lot_name).get(slot_name)
+            self.publish(lot_name, slot_name, RESERVED if expiry else AVAILABLE, expiry, 'exit')
+
+    def _tick(self):
+        # Pushes expiries as they happen, and reloads watched lots so reservations made by
+        # other processes reach browsers within OCCUPANCY_MAX_AGE (one query per lot, not per viewer).
+        last_refresh = time.monotonic()
+        while True:
+            next_expiry = self.index.evict_expired()
+            if time.monotonic() - last_refresh >= OCCUPANCY_MAX_AGE:
+                last_refresh = time.monotonic()
+                with self._lock:
+                    watched = list(self._subscribers)
+                for lot_name in watched:
+                    try:
+                        self.index.reserved_slots(lot_name)
+                    except Exception as e:
+                        print(f"Occupancy hub: could not refresh {lot_name}: {e}")
+            wait = 1.0
+            if next_expiry is not None:
+                wait = min(wait, max(0.05, (next_expiry - datetime.now()).total_seconds()))
+            time.sleep(wait)
+
+    def _listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.bind(("127.0.0.1", self.event_port))
+        except OSError as e:
+            print(f"Occupancy hub: camera events disabled, port {self.event_port} unavailable ({e})")
+            sock.close()
+            return
+        while True:
+            data, _ = sock.recvfrom(4096)
+            try:
+                event = json.loads(data)
+                self.camera_event(event['lot'], event['slot'], event['kind'], event.get('plate'))
+            except Exception as e:
+                print(f"Occupancy hub: could not apply camera event {data!r}: {e}")
+
+    def stream(self, lot_name):
+        """SSE generator for the Flask app: a snapshot, then deltas as they're published."""
+        subscriber = self.subscribe(lot_name)
+        try:
+            yield self.snapshot(lot_name, self.index.reserved_slots(lot_name))
+            while True:
+                message = subscriber.get(HEARTBEAT_SECONDS)
+                if subscriber.overflowed:
+                    subscriber.reset()
+                    message = self.snapshot(lot_name, self.index.reserved_slots(lot_name))
+                yield message or ": ping\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def stream_async(self, lot_name):
+        """stream() for the ASGI app."""
+        subscriber = self.subscribe(lot_name, asyncio.get_running_loop())
+        try:
+            yield self.snapshot(lot_name, await self.index.reserved_slots_async(lot_name))
+            while True:
+                message = await subscriber.get(HEARTBEAT_SECONDS)
+                if subscriber.overflowed:
+                    subscriber.reset()
+                    message = self.snapshot(lot_name, await self.index.reserved_slots_async(lot_name))
+                yield message or ": ping\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+occupancy_hub = OccupancyHub()
+
+
+if __name__ == "__main__":
+    # Fan-out latency test: hundreds of local SSE subscribers on a running app, fed camera events
+    import argparse
+    import urllib.parse
+
+    parser = argparse.ArgumentParser(description="Measure slot-update fan-out latency to many subscribers")
+    parser.add_argument('--url', default='http://127.0.0.1:8001', help="App serving /slots/<lot>/events")
+    parser.add_argument('--lot', default='Lot A')
+    parser.add_argument('--slot', default='Slot 8')
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--events', type=int, default=20)
+    args = parser.parse_args()
+
+    parsed = urllib.parse.urlsplit(args.url)
+    path = urllib.parse.quote(f"/slots/{args.lot}/events")
+
+    async def subscriber(ready, latencies):
+        reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+        # HTTP/1.0 so the stream isn't chunked and every line is an SSE line
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {parsed.netloc}\r\nAccept: text/event-stream\r\n\r\n".encode())
+        received = 0
+        event = None
+        connected = False
+        while received < args.events:
+            line = (await reader.readline()).decode()
+            if not line:
+                break
+            if line.startswith('event:'):
+                event = line.split(':', 1)[1].strip()
+            elif line.startswith('data:'):
+                payload = json.loads(line.split(':', 1)[1])
+                if event == 'snapshot' and not connected:
+                    connected = True
+                    ready.release()
+                elif event == 'slot' and payload.get('reason') in ('entry', 'exit'):
+                    latencies.append(time.time() - payload['sent'])
+                    received += 1
+        writer.close()
+
+    async def run():
+        ready = asyncio.Semaphore(0)
+        latencies = []
+        tasks = [asyncio.create_task(subscriber(ready, latencies)) for _ in range(args.subscribers)]
+        for _ in range(args.subscribers):
+            await ready.acquire()
+        print(f"{args.subscribers} subscribers connected")
+        for i in range(args.events):
+            publish_camera_event(args.lot, args.slot, 'entry' if i % 2 == 0 else 'exit', 'BENCH')
+            await asyncio.sleep(0.1)
+        await asyncio.wait(tasks, timeout=10)
+        return latencies
+
+    latencies = sorted(asyncio.run(run()))
+    expected = args.subscribers * args.events
+    if not latencies:
+        raise SystemExit("No events received")
+    print(f"{len(latencies)}/{expected} deliveries, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+          f"p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.1f}ms, "
+          f"max {latencies[-1] * 1000:.1f}ms")
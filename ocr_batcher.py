@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+OCR_BATCH_SIZE = int(os.getenv('OCR_BATCH_SIZE', 8))
+OCR_MAX_WAIT = float(os.getenv('OCR_MAX_WAIT', 0.02))  # Seconds to wait for a batch to fill
+
+STAGE_SECONDS = metrics.histogram('pipeline_stage_seconds', "Time per pipeline stage", ('stage',))
+BATCH_SIZES = metrics.histogram('ocr_batch_size', "Crops per OCR batch", buckets=(1, 2, 4, 8, 16, 32))
+
+
+class OcrBatcher:
+    """
+    Collects plate crops from every camera into micro-batches and runs each batch as one
+    call of `batch_fn(items) -> results` on the executor. submit() returns a Future that
+    resolves to the crop's own result. With timed=True, batch_fn returns (results, timings)
+    and each {stage: seconds} entry is recorded as a pipeline stage.
+    """
+
+    def __init__(self, executor, batch_fn, batch_size=OCR_BATCH_SIZE, max_wait=OCR_MAX_WAIT, timed=False):
+        self.executor = executor
+        self.batch_fn = batch_fn
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.timed = timed
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ocr-batcher", daemon=True)
+        self._thread.start()
+
+        self.crops = 0
+        self.batches = 0
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        self.crops += len(batch)
+        self.batches += 1
+        BATCH_SIZES.observe(len(batch))
+        # Dispatch to results, including the trip to the worker process
+        started = time.perf_counter() if metrics.sampled() else None
+
+        def deliver(batch_future):
+            try:
+                results = batch_future.result()
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                return
+            if self.timed:
+                results, timings = results
+            if started is not None:
+                weight = metrics.sampling_weight()
+                STAGE_SECONDS.observe(time.perf_counter() - started, 'ocr', weight=weight)
+                if self.timed:
+                    for stage, seconds in timings.items():
+                        STAGE_SECONDS.observe(seconds, stage, weight=weight)
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+        try:
+            self.executor.submit(self.batch_fn, items).add_done_callback(deliver)
+        except Exception as e:
+            # Executor shut down underneath us
+            for future in futures:
+                future.set_exception(e)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def mean_batch_size(self):
+        return self.crops / self.batches if self.batches else 0.0
+
+
+if __name__ == "__main__":
+    # Benchmark: crops/sec and p95 latency of batched OCR (OCR_BACKEND) on archived entry crops (CPU)
+    import argparse
+    import glob
+
+    import cv2
+
+    import plate_to_num
+
+    parser = argparse.ArgumentParser(description="Benchmark batched plate OCR")
+    parser.add_argument('--crops', default=os.getenv('EVIDENCE_DIR', 'evidence'), help="Directory searched for *.jpg crops")
+    parser.add_argument('--sizes', default='1,2,4,8,16,32')
+    parser.add_argument('--rounds', type=int, default=3, help="Passes over the crop set per batch size")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.crops, '**', '*.jpg'), recursive=True))
+    if not paths:
+        raise SystemExit(f"No .jpg crops found in {args.crops}")
+    crops = [cv2.imread(path) for path in paths]
+
+    recognizer = plate_to_num.get_recognizer()
+    buffers = plate_to_num.PreprocessBuffers()
+    plate_to_num.read_plate_texts(crops[:1], recognizer, buffers)  # Warm up the model
+
+    for batch_size in (int(size) for size in args.sizes.split(',')):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            for i in range(0, len(crops), batch_size):
+                batch = crops[i:i + batch_size]
+                batch_started = time.perf_counter()
+                plate_to_num.read_plate_texts(batch, recognizer, buffers)
+                # Every crop in a batch waits for the whole batch
+                latencies.extend([time.perf_counter() - batch_started] * len(batch))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"batch {batch_size:>2}: {len(latencies) / elapsed:7.1f} crops/s, p95 {p95 * 1000:7.1f}ms")
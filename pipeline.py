@@ -0,0 +1,420 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+from dotenv import load_dotenv
+
+import metrics
+import plate_workers
+from catalog import fetch_catalog
+from detection_scheduler import DetectionScheduler
+from evidence import EvidenceArchiver
+from occupancy_hub import publish_camera_event
+from ocr_batcher import OcrBatcher
+from plate_resolver import plate_index
+from plate_to_num import grace_period
+from session_sink import SessionSink
+from tracker import TENTATIVE, PlateTracker
+
+load_dotenv()
+
+CAMERAS_CONFIG = os.getenv('CAMERAS_CONFIG')  # Path to a JSON list of cameras
+FRAME_QUEUE_SIZE = int(os.getenv('FRAME_QUEUE_SIZE', 4))
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', os.cpu_count() or 1))
+FRAME_DIR_FPS = float(os.getenv('FRAME_DIR_FPS', 30))  # Frame rate assumed for directories of frame images
+FRAME_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+STAGE_SECONDS = metrics.histogram('pipeline_stage_seconds', "Time per pipeline stage", ('stage',))
+
+# Used when no camera config is given: the primary webcam, as before
+DEFAULT_CAMERAS = [{'name': 'camera-0', 'source': 0, 'lot_name': 'Lot A', 'slot_name': 'Slot 1'}]
+
+
+class CameraConfig:
+    """One capture source and the lot/slot it watches."""
+
+    def __init__(self, name, source, lot_name, slot_name, width=640, height=480, roi=None, fps=None):
+        self.name = name
+        # Device indexes arrive as ints or digit strings; anything else is a URL or file path
+        self.source = int(source) if isinstance(source, str) and source.isdigit() else source
+        self.lot_name = lot_name
+        self.slot_name = slot_name
+        self.width = width
+        self.height = height
+        self.roi = roi  # Optional [x, y, w, h] around the lane; detection only looks there
+        self.fps = fps  # Frame rate of a frame-image directory (default FRAME_DIR_FPS); videos carry their own
+
+    @property
+    def is_live(self):
+        """Live sources drop stale frames; recorded files are processed frame by frame."""
+        return isinstance(self.source, int) or str(self.source).startswith(('rtsp://', 'http://', 'https://'))
+
+
+class FrameDirectory:
+    """Reads a directory of frame images (in file name order) through the cv2.VideoCapture calls the pipeline uses."""
+
+    def __init__(self, path, fps=None):
+        self.paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(FRAME_EXTENSIONS))
+        self.fps = fps or FRAME_DIR_FPS
+        self.index = 0  # Frames read so far
+
+    def read(self):
+        if self.index >= len(self.paths):
+            return False, None
+        img = cv2.imread(self.paths[self.index])
+        self.index += 1
+        return img is not None, img
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            # Timestamp of the frame last read, as the video backends report it
+            return max(self.index - 1, 0) * 1000.0 / self.fps
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        return 0.0
+
+    def set(self, prop, value):
+        return False  # Frame size is whatever the images are
+
+    def release(self):
+        pass
+
+
+def open_capture(camera):
+    """Opens a camera's source: a frame-image directory, or anything cv2.VideoCapture takes."""
+    if isinstance(camera.source, str) and os.path.isdir(camera.source):
+        return FrameDirectory(camera.source, camera.fps)
+    return cv2.VideoCapture(camera.source)
+
+
+def load_camera_config(path=CAMERAS_CONFIG):
+    """Reads camera definitions from a JSON file, falling back to the default webcam."""
+    if not path:
+        entries = DEFAULT_CAMERAS
+    else:
+        with open(path) as f:
+            entries = json.load(f)
+    return [CameraConfig(**entry) for entry in entries]
+
+
+class CameraStats:
+    def __init__(self):
+        self.captured = 0
+        self.dropped = 0
+        self.processed = 0
+        self.detections = 0
+        self.ocr_calls = 0
+        self.cache_hits = 0
+        self.ocr_per_vehicle = 0.0
+        self.detection_rate = 0.0  # Share of frames that ran Haar detection
+        self.detect_cpu = 0.0  # CPU seconds spent in detection (pool processes)
+        self.process_cpu = 0.0  # CPU seconds of the camera's processing thread
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def fps(self):
+        elapsed = self.elapsed()
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def cpu_percent(self):
+        """CPU used on behalf of this camera as a percentage of one core."""
+        elapsed = self.elapsed()
+        return 100 * (self.detect_cpu + self.process_cpu) / elapsed if elapsed > 0 else 0.0
+
+
+class CameraWorker:
+    """
+    Capture thread feeding a bounded frame queue, plus a thread that runs detection, OCR and tracking.
+    Frames are stamped with the wall clock, or with `clock(cap)` when given (replay.py stamps recorded
+    frames with their position in the recording so timing-dependent logic runs deterministically).
+    Plates are resolved to registered ones with `resolver` (None reports them as read).
+    """
+
+    def __init__(self, camera, pool, ocr, writer, evidence, stop_event, display=None, clock=None,
+                 on_occupancy=publish_camera_event, resolver=plate_index.resolve):
+        self.camera = camera
+        self.pool = pool
+        self.ocr = ocr  # Shared OcrBatcher
+        self.writer = writer  # Shared SessionSink
+        self.evidence = evidence  # Shared EvidenceArchiver
+        self.stop_event = stop_event
+        self.display = display  # Dict of camera name -> latest annotated frame, or None when headless
+        self.clock = clock
+        self.on_occupancy = on_occupancy  # Called with (lot, slot, 'entry' / 'exit', plate)
+        self.frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.tracker = PlateTracker(camera.lot_name, camera.slot_name, resolver=resolver)
+        # Stable tracks are re-detected within half the grace period even when frames are dropped
+        self.scheduler = DetectionScheduler(camera.roi, max_gap=grace_period / 2)
+        self._occupied_by = None  # Plate last reported to the web app as occupying the slot
+        self.stats = CameraStats()
+        self._threads = [
+            threading.Thread(target=self._capture, name=f"{camera.name}-capture", daemon=True),
+            threading.Thread(target=self._process, name=f"{camera.name}-process", daemon=True),
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def is_alive(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def _capture(self):
+        cap = open_capture(self.camera)
+        cap.set(3, self.camera.width)  # Set width
+        cap.set(4, self.camera.height)  # Set height
+        try:
+            while not self.stop_event.is_set():
+                with STAGE_SECONDS.time('capture'):
+                    success, img = cap.read()
+                if not success:
+                    print(f"{self.camera.name}: failed to grab frame. Stopping capture.")
+                    break
+                self.stats.captured += 1
+                item = (img, self.clock(cap) if self.clock else datetime.now())
+                if self.camera.is_live:
+                    # Never let a slow detector fall behind real time: replace the oldest frame
+                    try:
+                        self.frames.put_nowait(item)
+                    except queue.Full:
+                        try:
+                            self.frames.get_nowait()
+                            self.stats.dropped += 1
+                        except queue.Empty:
+                            pass
+                        self.frames.put_nowait(item)
+                else:
+                    self.frames.put(item)
+        finally:
+            cap.release()
+            self.frames.put(None)
+
+    def _process(self):
+        cpu_started = time.thread_time()
+        now = None
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            img, now = item
+            with STAGE_SECONDS.time('frame'):
+                self._process_frame(img, now)
+            self.stats.processed += 1
+
+        # Close out whatever is still in view once the source ends, as if it left after the last frame
+        if now is not None:
+            for session in self.tracker.expire(now + grace_period + timedelta(microseconds=1)):
+                self.writer.submit(*session)
+            self._report_occupancy()
+        self.stats.process_cpu = time.thread_time() - cpu_started
+        self.stats.finished = time.perf_counter()
+
+    def _process_frame(self, img, now):
+        # Convert the image to grayscale for plate detection
+        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        region, (ox, oy) = self.scheduler.crop(img_gray)
+
+        # Static empty lane, or stable tracks between detection strides: skip detectMultiScale
+        if not self.scheduler.should_detect(region, self.tracker.tracks, now):
+            tracks = []
+        else:
+            with STAGE_SECONDS.time('detect'):  # detectMultiScale plus the trip to the worker
+                boxes, cpu = self.pool.submit(plate_workers.detect, region).result()
+            self.stats.detect_cpu += cpu
+            boxes = [(x + ox, y + oy, w, h) for x, y, w, h in boxes]
+            self.stats.detections += len(boxes)
+            # Each box joins a track; only tracks whose plate hasn't settled yet are OCR'd
+            tracks = self.tracker.update(boxes, now)
+
+        pending = []
+        for track in tracks:
+            future = img_roi = None
+            if self.tracker.needs_ocr(track):
+                x, y, w, h = track.box
+                img_roi = img[y: y + h, x: x + w]
+                future = self.ocr.submit(img_roi)
+                self.stats.ocr_calls += 1
+            pending.append((track, future, img_roi))
+
+        for track, future, img_roi in pending:
+            if future is not None:
+                was_tentative = track.state == TENTATIVE
+                self.tracker.record_reading(track, *future.result(), now)
+                if was_tentative and track.state != TENTATIVE:
+                    # Entry evidence: the crop that first read as a valid plate
+                    self.evidence.submit(img_roi, self.camera.name, track.track_id, track.plate, now)
+
+            # Voted text; only ever set to a valid plate
+            if track.plate and self.display is not None:
+                x, y, w, h = track.box
+                # Draw rectangle around the detected plate
+                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                cv2.putText(img, track.plate, (x, y - 5), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (255, 0, 255), 2)
+
+        # Handle plate exit
+        for session in self.tracker.expire(now):
+            self.writer.submit(*session)
+        self._report_occupancy()
+
+        if self.display is not None:
+            self.display[self.camera.name] = img
+
+
+    def _report_occupancy(self):
+        # Entry/exit events for the live slots page; a vehicle counts from its first plate
+        # read until its track expires (briefly lost tracks still occupy the slot)
+        plate = next((track.plate for track in self.tracker.tracks if track.state != TENTATIVE), None)
+        if (plate is None) != (self._occupied_by is None):
+            kind = 'entry' if plate is not None else 'exit'
+            self.on_occupancy(self.camera.lot_name, self.camera.slot_name, kind, plate or self._occupied_by)
+            self._occupied_by = plate
+
+
+def pipeline_collector(camera_workers, ocr, writer, evidence):
+    """Per-camera frame counts and every queue's depth, read at scrape time (nothing on the hot path)."""
+    def collect():
+        for worker in camera_workers:
+            camera = {'camera': worker.camera.name}
+            yield ('pipeline_frames_captured_total', 'counter', "Frames read from the source",
+                   camera, worker.stats.captured)
+            yield ('pipeline_frames_dropped_total', 'counter', "Live frames dropped because processing fell behind",
+                   camera, worker.stats.dropped)
+            yield ('pipeline_frames_processed_total', 'counter', "Frames through detection/OCR/tracking",
+                   camera, worker.stats.processed)
+            yield ('pipeline_queue_depth', 'gauge', "Items waiting in each pipeline queue",
+                   {'queue': 'frames', **camera}, worker.frames.qsize())
+        yield 'pipeline_queue_depth', 'gauge', "Items waiting in each pipeline queue", {'queue': 'ocr'}, ocr.queue_depth()
+        yield ('pipeline_queue_depth', 'gauge', "Items waiting in each pipeline queue",
+               {'queue': 'session_sink'}, writer.pending())
+        yield ('pipeline_queue_depth', 'gauge', "Items waiting in each pipeline queue",
+               {'queue': 'evidence'}, evidence.pending())
+        yield 'pipeline_sessions_written_total', 'counter', "Sessions inserted", {}, writer.written
+        yield 'pipeline_sessions_spooled_total', 'counter', "Sessions spooled to the journal", {}, writer.spooled
+    return collect
+
+
+def check_cameras(cameras):
+    """Warns about cameras watching a lot/slot that isn't in the catalog (the web app would ignore them)."""
+    try:
+        catalog = fetch_catalog()
+    except Exception as e:
+        print(f"Could not check cameras against the lot catalog: {e}")
+        return
+    for camera in cameras:
+        if not catalog.has_slot(camera.lot_name, camera.slot_name):
+            print(f"Warning: {camera.name} watches {camera.slot_name} in {camera.lot_name}, which is not in the catalog.")
+
+
+def run_pipeline(cameras, headless=False, workers=PIPELINE_WORKERS, writer=None, evidence=None, **worker_options):
+    """
+    Runs every camera until its source ends, 'q' is pressed, or Ctrl+C. Returns per-camera stats.
+    `writer` and `evidence` default to a SessionSink and an EvidenceArchiver; `worker_options`
+    (clock, on_occupancy) are passed to every CameraWorker.
+    """
+    stop_event = threading.Event()
+    display = None if headless else {}
+    own_writer, own_evidence = writer is None, evidence is None
+    writer = writer or SessionSink()
+    evidence = evidence or EvidenceArchiver()
+
+    # spawn keeps the OCR model's threads out of fork()
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=plate_workers.init_worker) as pool:
+        ocr = OcrBatcher(pool, plate_workers.ocr_batch, timed=True)
+        camera_workers = [CameraWorker(camera, pool, ocr, writer, evidence, stop_event, display, **worker_options)
+                          for camera in cameras]
+        collector = pipeline_collector(camera_workers, ocr, writer, evidence)
+        metrics.add_collector(collector)
+        for worker in camera_workers:
+            worker.start()
+
+        try:
+            while any(worker.is_alive() for worker in camera_workers):
+                if headless:
+                    time.sleep(0.2)
+                    continue
+                # cv2.imshow must run on the main thread
+                for name, img in list(display.items()):
+                    cv2.imshow(name, img)
+                # Exit on pressing 'q'
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_event.set()
+            for worker in camera_workers:
+                worker.join()
+            ocr.close()
+            writer.close()
+            if own_writer:
+                print(f"Sessions: {writer.written} saved, {writer.spooled} spooled to {writer.journal_path}, "
+                      f"{writer.replayed} replayed.")
+            evidence.close()
+            metrics.remove_collector(collector)
+            if own_evidence:
+                print(f"Evidence: {evidence.saved} entry crops archived, {evidence.dropped} dropped.")
+            if not headless:
+                cv2.destroyAllWindows()
+            print("Camera released.")
+
+    for worker in camera_workers:
+        worker.stats.cache_hits = worker.tracker.hits
+        worker.stats.ocr_per_vehicle = worker.tracker.ocr_calls_per_vehicle()
+        worker.stats.detection_rate = worker.scheduler.detection_rate()
+    return {worker.camera.name: worker.stats for worker in camera_workers}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="License plate recognition pipeline")
+    parser.add_argument('--config', default=CAMERAS_CONFIG, help="JSON list of cameras (name, source, lot_name, slot_name, optional roi)")
+    parser.add_argument('--video', action='append', default=[], help="Recorded video file or frame directory to run instead of the config (repeatable)")
+    parser.add_argument('--lot', default='Lot A', help="Lot for --video sources")
+    parser.add_argument('--headless', action='store_true', help="Don't open preview windows")
+    parser.add_argument('--workers', type=int, default=PIPELINE_WORKERS, help="Detection/OCR processes")
+    parser.add_argument('--metrics-port', default=metrics.METRICS_PORT, help="Serve Prometheus /metrics on this port")
+    args = parser.parse_args(argv)
+
+    metrics.serve(args.metrics_port)
+
+    if args.video:
+        cameras = [
+            CameraConfig(f"video-{i}", path, args.lot, f"Slot {i + 1}")
+            for i, path in enumerate(args.video)
+        ]
+    else:
+        cameras = load_camera_config(args.config)
+    check_cameras(cameras)
+    # Registered plates load in the background instead of stalling the first vehicle
+    threading.Thread(target=plate_index.ensure_fresh, name="plate-index", daemon=True).start()
+
+    stats = run_pipeline(cameras, headless=args.headless, workers=args.workers)
+
+    # Throughput report (doubles as the benchmark when run over recorded --video files)
+    for name, s in stats.items():
+        print(f"{name}: {s.processed} frames, {s.fps():.1f} frames/s, {s.dropped} dropped, "
+              f"{s.detections} detections, {s.ocr_calls} OCR crops, {s.cache_hits} plate cache hits, "
+              f"{s.ocr_per_vehicle:.1f} OCR calls/vehicle, detection on {s.detection_rate:.0%} of frames, "
+              f"{s.cpu_percent():.0f}% CPU")
+    return stats
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+from collections import defaultdict
+
+from plate_resolver import normalize_plate
+from plate_to_num import is_valid_license_plate
+
+# A track stops being OCR'd once its voted plate is valid, backed by at least
+# PLATE_MIN_VOTES readings, and every character position agrees to this degree.
+PLATE_MIN_VOTES = int(os.getenv('PLATE_MIN_VOTES', 2))
+PLATE_CONFIDENCE = float(os.getenv('PLATE_CONFIDENCE', 0.8))
+PLATE_MAX_READINGS = int(os.getenv('PLATE_MAX_READINGS', 6))  # Give up OCR on a track after this many
+
+
+def vote(readings):
+    """
+    Character-by-character vote over [(text, confidence)] readings. Readings of the most
+    common (confidence-weighted) length take part. Returns (text, agreement), where
+    agreement is the weakest position's share of the confidence mass, or (None, 0.0).
+    """
+    by_length = defaultdict(float)
+    for text, confidence in readings:
+        by_length[len(text)] += confidence
+    if not by_length:
+        return None, 0.0
+    length = max(by_length, key=by_length.get)
+    voters = [(text, confidence) for text, confidence in readings if len(text) == length]
+
+    chars = []
+    agreement = 1.0
+    for i in range(length):
+        weights = defaultdict(float)
+        for text, confidence in voters:
+            weights[text[i]] += confidence
+        total = sum(weights.values())
+        char = max(weights, key=weights.get)
+        chars.append(char)
+        agreement = min(agreement, weights[char] / total if total else 0.0)
+    return "".join(chars), agreement
+
+
+class TrackReadings:
+    """OCR readings accumulated for one tracked plate box."""
+
+    __slots__ = ('readings', 'attempts', 'voted', 'plate', 'agreement', 'settled')
+
+    def __init__(self):
+        self.readings = []
+        self.attempts = 0  # OCR calls made, including ones that returned nothing usable
+        self.voted = None  # Current voted text, valid or not
+        self.plate = None  # Current voted plate, only set once it passes validation
+        self.agreement = 0.0
+        self.settled = False  # No more OCR for this track
+
+    def add(self, text, confidence):
+        """Records one OCR result (text may be None) and re-votes."""
+        self.attempts += 1
+        # Spacing and O/0-style slips are fixed before voting, so they can't split the vote
+        text = normalize_plate(text) if text else None
+        if text:
+            self.readings.append((text, confidence))
+        voted, agreement = vote(self.readings)
+        self.voted = voted
+        if voted and is_valid_license_plate(voted):
+            self.plate, self.agreement = voted, agreement
+        converged = (self.plate is not None and len(self.readings) >= PLATE_MIN_VOTES
+                     and self.agreement >= PLATE_CONFIDENCE)
+        # Unreadable plates also stop being OCR'd once they've had their attempts
+        self.settled = converged or self.attempts >= PLATE_MAX_READINGS
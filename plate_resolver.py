@@ -0,0 +1,297 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fuzzy matching of OCR'd plate text against registered plates (users.license_plate plus
+# active reservations). Text is compared without spaces or punctuation; characters OCR
+# confuses (O/0, I/1, S/5, ...) cost a fraction of a real edit.
+#
+# Lookups go through a hash of each plate's "skeleton" (confusable characters collapsed to
+# one symbol), so any number of confusions is a single dict hit, and one real edit on top is
+# found by probing the ~500 skeletons one insert/delete/substitution away. That stays well
+# under a millisecond for hundreds of thousands of plates, where a BK-tree over these short,
+# high-entropy strings ends up visiting thousands of nodes per query.
+
+PLATE_MATCH_MAX_COST = float(os.getenv('PLATE_MATCH_MAX_COST', 1.0))  # One real edit, or a few confusions
+PLATE_INDEX_MAX_AGE = float(os.getenv('PLATE_INDEX_MAX_AGE', 300))  # Seconds before a full reload from MySQL
+
+# Characters OCR mixes up on plates. Each group is one digit and the letters read for it.
+CONFUSABLE = ['0ODQ', '1IL', '2Z', '4A', '5S', '6G', '7T', '8B']
+CONFUSION_COST = 3  # Tenths: a confusable substitution
+EDIT_COST = 10  # Any other substitution, insertion or deletion
+
+PLATE_SHAPE = 'LLDDLLDDDD'  # is_valid_license_plate's "AA 00 AA 0000" without the spaces
+PLATE_GROUPS = (2, 2, 2, 4)
+
+SKELETON = {char: group[0] for group in CONFUSABLE for char in group}
+TO_DIGIT = {char: group[0] for group in CONFUSABLE for char in group[1:]}
+TO_LETTER = {group[0]: group[1] for group in CONFUSABLE}
+ALPHANUMERIC = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+SKELETON_ALPHABET = sorted({SKELETON.get(char, char) for char in ALPHANUMERIC})
+
+
+def compact(text):
+    """Upper-case letters and digits only: 'ka 01-ab 1234' -> 'KA01AB1234'."""
+    return ''.join(char for char in text.upper() if char.isalnum())
+
+
+def skeleton(text):
+    return ''.join(SKELETON.get(char, char) for char in compact(text))
+
+
+def normalize_plate(text):
+    """
+    Cleans up OCR text: spacing is rebuilt and, when the text has a plate's length, digits
+    read in letter positions become letters and vice versa ('KA0IAB1234' -> 'KA 01 AB 1234').
+    Other text comes back compacted.
+    """
+    chars = compact(text)
+    if len(chars) != len(PLATE_SHAPE):
+        return chars
+    chars = ''.join(TO_LETTER.get(char, char) if kind == 'L' else TO_DIGIT.get(char, char)
+                    for char, kind in zip(chars, PLATE_SHAPE))
+    groups, start = [], 0
+    for size in PLATE_GROUPS:
+        groups.append(chars[start:start + size])
+        start += size
+    return ' '.join(groups)
+
+
+def is_plate_shaped(text):
+    """True for a well-formed plate ("AA 00 AA 0000", spacing aside)."""
+    chars = compact(text)
+    return len(chars) == len(PLATE_SHAPE) and all(
+        char.isalpha() if kind == 'L' else char.isdigit() for char, kind in zip(chars, PLATE_SHAPE))
+
+
+def _substitution_cost(a, b):
+    if a == b:
+        return 0
+    return CONFUSION_COST if SKELETON.get(a, a) == SKELETON.get(b, b) else EDIT_COST
+
+
+SUBSTITUTION_COSTS = {(a, b): _substitution_cost(a, b) for a in ALPHANUMERIC for b in ALPHANUMERIC}
+
+
+def plate_distance(a, b):
+    """Edit distance between two plates ignoring spacing, with confusable substitutions discounted."""
+    a, b = compact(a), compact(b)
+    costs = SUBSTITUTION_COSTS
+    if len(a) == len(b):
+        # Aligning equal-length strings with indels takes at least two, so anything cheaper is substitutions
+        cost = sum(costs.get(pair, 0 if pair[0] == pair[1] else EDIT_COST) for pair in zip(a, b))
+        if cost < 2 * EDIT_COST:
+            return cost / 10
+    previous = list(range(0, (len(b) + 1) * EDIT_COST, EDIT_COST))
+    for i, char_a in enumerate(a, 1):
+        current = [i * EDIT_COST]
+        left = current[0]
+        for j, char_b in enumerate(b, 1):
+            # Non-ASCII alphanumerics (rare OCR output) only ever match themselves
+            substitution = previous[j - 1] + costs.get((char_a, char_b), 0 if char_a == char_b else EDIT_COST)
+            left = min(previous[j] + EDIT_COST, left + EDIT_COST, substitution)
+            current.append(left)
+        previous = current
+    return previous[-1] / 10
+
+
+def neighbours(key):
+    """Skeletons one insertion, deletion or substitution away from `key` (may repeat), and `key` itself."""
+    keys = [key]
+    for i in range(len(key) + 1):
+        head, tail = key[:i], key[i:]
+        keys += [head + char + tail for char in SKELETON_ALPHABET]
+        if tail:
+            rest = tail[1:]
+            keys.append(head + rest)
+            keys += [head + char + rest for char in SKELETON_ALPHABET]
+    return keys
+
+
+def load_registered_plates():
+    """Every registered plate, plus plates holding an active reservation."""
+    from db import get_db_connection  # Only processes that resolve plates need the DB stack
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT license_plate FROM users WHERE license_plate IS NOT NULL
+                UNION ALL
+                SELECT license_plate FROM reservations WHERE reservation_expiry > NOW()
+            ''')
+            return [row['license_plate'] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+class PlateIndex:
+    """In-process index of registered plates for fuzzy lookups, reloaded every max_age seconds."""
+
+    def __init__(self, loader=load_registered_plates, max_age=PLATE_INDEX_MAX_AGE, max_cost=PLATE_MATCH_MAX_COST):
+        self._loader = loader
+        self.max_age = max_age
+        self.max_cost = max_cost
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._plates = {}  # skeleton -> [stored plate, ...]; one entry per registration
+        self._loaded_at = None  # Monotonic time of the last reload
+
+    def __len__(self):
+        return sum(len(plates) for plates in self._plates.values())
+
+    def load(self, plates):
+        """Replaces the index with `plates` (stored spellings, as in the database)."""
+        index = {}
+        for plate in plates:
+            if plate:
+                index.setdefault(skeleton(plate), []).append(plate)
+        with self._lock:
+            self._plates = index
+            self._loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Reloads from the loader if the index is older than max_age; keeps the old one if that fails."""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at <= self.max_age:
+            return
+        if not self._reload_lock.acquire(blocking=loaded_at is None):
+            return  # Another thread is reloading; keep answering from the current index
+        try:
+            if self._loaded_at != loaded_at:
+                return
+            try:
+                self.load(self._loader())
+            except Exception as e:
+                print(f"Could not load registered plates: {e}")
+                self._loaded_at = time.monotonic()  # Try again after max_age
+        finally:
+            self._reload_lock.release()
+
+    def add(self, plate):
+        """Write-through hook for a newly registered plate."""
+        key = skeleton(plate)
+        with self._lock:
+            # Lists are replaced rather than mutated, so lookups never see one change under them
+            self._plates[key] = self._plates.get(key, []) + [plate]
+
+    def remove(self, plate):
+        """Write-through hook for a deleted registration."""
+        key = skeleton(plate)
+        with self._lock:
+            plates = list(self._plates.get(key, []))
+            if plate in plates:
+                plates.remove(plate)
+                if plates:
+                    self._plates[key] = plates
+                else:
+                    del self._plates[key]
+
+    def lookup(self, text, max_cost=None):
+        """Registered plates within max_cost (default self.max_cost) of `text`, as [(cost, plate)] cheapest first."""
+        max_cost = self.max_cost if max_cost is None else max_cost
+        self.ensure_fresh()
+        plates = self._plates
+        target = compact(text)
+        if not target:
+            return []
+        exact = [plate for plate in plates.get(skeleton(target), []) if compact(plate) == target]
+        if exact:
+            return [(0.0, plate) for plate in exact]
+        found = {}
+        get = plates.get
+        for key in neighbours(skeleton(target)):
+            for plate in get(key, ()):
+                if plate not in found:
+                    found[plate] = plate_distance(target, plate)
+        return sorted((cost, plate) for plate, cost in found.items() if cost <= max_cost)
+
+    def resolve(self, text):
+        """
+        The registered plate `text` most likely is, or None if nothing is close or two plates tie.
+        A well-formed read is trusted: only confusable characters are corrected, never a real
+        edit, so an unregistered car is never taken for a registered one.
+        """
+        found = self.lookup(text)
+        if is_plate_shaped(normalize_plate(text)):
+            key = skeleton(text)
+            found = [(cost, plate) for cost, plate in found if skeleton(plate) == key]
+        if not found:
+            return None
+        best = found[0][0]
+        closest = {compact(plate) for cost, plate in found if cost == best}
+        return found[0][1] if len(closest) == 1 else None
+
+    def matches(self, text, plate):
+        """
+        Whether OCR'd `text` is `plate`, which needn't be indexed yet. Beyond an exact match,
+        `text` must be within reach of `plate` (confusable characters only, for a well-formed
+        read) and no other registered plate may be as close.
+        """
+        if compact(text) == compact(plate):
+            return True
+        cost = plate_distance(text, plate)
+        if is_plate_shaped(normalize_plate(text)):
+            if skeleton(text) != skeleton(plate):
+                return False  # A real edit away: a different car
+        elif cost > self.max_cost:
+            return False
+        return not any(compact(other) != compact(plate) for _, other in self.lookup(text, cost))
+
+
+plate_index = PlateIndex()
+
+
+if __name__ == "__main__":
+    # Benchmark: lookup latency against a large synthetic registry
+    import argparse
+    import random
+
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy plate lookups")
+    parser.add_argument('--plates', type=int, default=300000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    letters, digits = 'ABCDEFGHJKLMNPRSTUVWXYZ', '0123456789'
+    states = ['KA', 'MH', 'DL', 'TN', 'AP', 'UP', 'GJ', 'RJ', 'KL', 'WB']
+
+    def random_plate():
+        return (f"{rng.choice(states)} {''.join(rng.choices(digits, k=2))} "
+                f"{''.join(rng.choices(letters, k=2))} {''.join(rng.choices(digits, k=4))}")
+
+    registered = [random_plate() for _ in range(args.plates)]
+    index = PlateIndex(loader=lambda: registered)
+    started = time.perf_counter()
+    index.ensure_fresh()
+    print(f"Indexed {len(index)} plates in {time.perf_counter() - started:.2f}s")
+
+    def confused(plate):
+        swap = {'0': 'O', '1': 'I', '5': 'S', '8': 'B', 'O': '0', 'S': '5', 'B': '8'}
+        return ''.join(swap.get(char, char) if rng.random() < 0.3 else char for char in plate.replace(' ', ''))
+
+    def one_edit(plate):
+        chars = list(compact(plate))
+        chars[rng.randrange(len(chars))] = rng.choice('XYW')
+        return ''.join(chars)
+
+    samples = rng.sample(registered, args.lookups)
+    cases = {
+        'exact': samples,
+        'confused': [confused(plate) for plate in samples],
+        'one edit': [one_edit(plate) for plate in samples],
+        'unknown': [random_plate() for _ in samples],
+    }
+    for label, queries in cases.items():
+        timings, resolved = [], 0
+        for query in queries:
+            started = time.perf_counter()
+            resolved += index.resolve(query) is not None
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"{label:>9}: mean {sum(timings) / len(timings) * 1e6:7.1f}us, "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1e6:7.1f}us, resolved {resolved / len(queries):.0%}")
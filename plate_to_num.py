@@ -1,88 +1,127 @@
 import cv2
-import pymysql
-from datetime import datetime, timedelta
-import easyocr  # For OCR to extract text from the plate
+from datetime import timedelta
 import numpy as np  # For preprocessing enhancements
 import re  # For validating license plate format
+import threading
+import time
 from dotenv import load_dotenv
-import os
+
+from recognizers import default_recognizer
 
 load_dotenv()
-# Initialize EasyOCR reader
-reader = easyocr.Reader(['en'])
-
-# MySQL Database Configuration
-RDS_HOST = os.getenv('RDS_HOST')
-RDS_USER = os.getenv('RDS_USER')
-RDS_PASSWORD = os.getenv('RDS_PASSWORD')
-RDS_DB_NAME = os.getenv('RDS_DB_NAME')
-
-# Helper function to connect to the AWS RDS MySQL database
-def get_db_connection():
-    conn = pymysql.connect(
-        host=RDS_HOST,
-        user=RDS_USER,
-        password=RDS_PASSWORD,
-        db=RDS_DB_NAME,
-        cursorclass=pymysql.cursors.DictCursor  # This allows results to be accessed like dictionaries
-    )
-    return conn
+
+# Haar Cascade model for number plate detection
+harcascade = "model/haarcascade_russian_plate_number.xml"
+
+# Minimum area for detected plates
+min_area = 500
+grace_period = timedelta(seconds=3)  # Extended grace period to handle instability
+iou_threshold = 0.5  # Intersection over Union threshold for bounding box similarity
+min_session_seconds = 30  # Sessions shorter than this are treated as drive-bys and not saved
+ocr_batch_width, ocr_batch_height = 320, 80  # Canvas plate crops are resized to for batched OCR
+
+_recognizer = None
+_recognizer_lock = threading.Lock()
+
+
+def get_recognizer():
+    """Returns the process-wide plate recognizer (OCR_BACKEND, see recognizers.py), loading its model on first use."""
+    global _recognizer
+    if _recognizer is None:
+        with _recognizer_lock:
+            if _recognizer is None:
+                recognizer = default_recognizer()
+                recognizer.load()
+                _recognizer = recognizer
+    return _recognizer
+
+
+def prewarm_recognizer():
+    """Loads the OCR model on a background thread, so the first plate doesn't wait for it."""
+    thread = threading.Thread(target=get_recognizer, name="ocr-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def load_plate_cascade():
+    """Loads the Haar Cascade classifier, raising if the model file is missing or invalid."""
+    plate_cascade = cv2.CascadeClassifier(harcascade)
+    if plate_cascade.empty():
+        raise RuntimeError("Error: Cascade Classifier could not be loaded.")
+    return plate_cascade
+
 
 # Function to save parking session
 def save_parking_session(plate, lot_name, slot_name, start_time, end_time, duration):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute('''
-                INSERT INTO parking_sessions (license_plate, lot_name, slot_name, start_time, end_time, duration)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (plate, lot_name, slot_name, start_time.strftime('%Y-%m-%d %H:%M:%S'),
-                  end_time.strftime('%Y-%m-%d %H:%M:%S'), duration))
-            conn.commit()
-    finally:
-        conn.close()
+    """Writes one session synchronously; the pipeline batches through session_sink.SessionSink instead."""
+    from session_sink import insert_sessions, session_row  # DB stack; OCR-only processes never need it
+
+    insert_sessions([session_row(plate, lot_name, slot_name, start_time, end_time, duration)])
+
+
+sharpen_kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+close_kernel = np.ones((3, 3), np.uint8)
+
+
+class PreprocessBuffers:
+    """
+    Reusable working arrays for preprocessing plate crops at the batched OCR size, so the
+    hot loop doesn't allocate a fresh image per step. One instance per thread/process.
+    """
+
+    def __init__(self, batch_size=1, width=ocr_batch_width, height=ocr_batch_height):
+        self.width = width
+        self.height = height
+        self.resized = np.empty((height, width, 3), np.uint8)
+        self.gray = np.empty((height, width), np.uint8)
+        self.blurred = np.empty((height, width), np.uint8)
+        self.sharpened = np.empty((height, width), np.uint8)
+        self.threshold = np.empty((height, width), np.uint8)
+        self.out = np.empty((batch_size, height, width), np.uint8)  # One processed slot per crop in a batch
+
+    def slots(self, count):
+        """Returns `count` output slots, growing the output stack if a batch is bigger than before."""
+        if count > len(self.out):
+            self.out = np.empty((count, self.height, self.width), np.uint8)
+        return self.out[:count]
+
 
 # Preprocess the license plate image for OCR
-def preprocess_image(img_roi):
-    # Convert to grayscale
-    gray = cv2.cvtColor(img_roi, cv2.COLOR_BGR2GRAY)
-    # Apply Gaussian blur to reduce noise
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    # Apply sharpening
-    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-    sharpened = cv2.filter2D(blurred, -1, kernel)
-    # Apply adaptive thresholding
-    threshold = cv2.adaptiveThreshold(
-        sharpened, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2
-    )
-    # Morphological operations to remove noise
-    kernel = np.ones((3, 3), np.uint8)
-    processed = cv2.morphologyEx(threshold, cv2.MORPH_CLOSE, kernel)
-    return processed
+def preprocess_image(img_roi, buffers=None, out=None):
+    """
+    Without buffers: works at the crop's own size and returns a new image. With buffers: the
+    crop is first resized to the OCR canvas and every step writes into the preallocated
+    arrays; the result lands in `out` (default buffers.out[0]) and is overwritten on reuse.
+    """
+    if buffers is None:
+        # Convert to grayscale
+        gray = cv2.cvtColor(img_roi, cv2.COLOR_BGR2GRAY)
+        # Apply Gaussian blur to reduce noise
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        # Apply sharpening
+        sharpened = cv2.filter2D(blurred, -1, sharpen_kernel)
+        # Apply adaptive thresholding
+        threshold = cv2.adaptiveThreshold(
+            sharpened, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2
+        )
+        # Morphological operations to remove noise
+        return cv2.morphologyEx(threshold, cv2.MORPH_CLOSE, close_kernel)
+
+    out = buffers.out[0] if out is None else out
+    cv2.resize(img_roi, (buffers.width, buffers.height), dst=buffers.resized, interpolation=cv2.INTER_LINEAR)
+    cv2.cvtColor(buffers.resized, cv2.COLOR_BGR2GRAY, dst=buffers.gray)
+    cv2.GaussianBlur(buffers.gray, (5, 5), 0, dst=buffers.blurred)
+    cv2.filter2D(buffers.blurred, -1, sharpen_kernel, dst=buffers.sharpened)
+    cv2.adaptiveThreshold(buffers.sharpened, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2,
+                          dst=buffers.threshold)
+    cv2.morphologyEx(buffers.threshold, cv2.MORPH_CLOSE, close_kernel, dst=out)
+    return out
 
 # Validate license plate format
 def is_valid_license_plate(plate_text):
     pattern = r"^[A-Z]{2} \d{2} [A-Z]{2} \d{4}$"
     return re.match(pattern, plate_text)
 
-# Load the Haar Cascade model for number plate detection
-harcascade = "model/haarcascade_russian_plate_number.xml"
-plate_cascade = cv2.CascadeClassifier(harcascade)
-
-if plate_cascade.empty():
-    print("Error: Cascade Classifier could not be loaded.")
-    exit()
-
-# Start video capture
-cap = cv2.VideoCapture(0)  # Use 0 for the primary camera
-cap.set(3, 640)  # Set width
-cap.set(4, 480)  # Set height
-
-# Minimum area for detected plates
-min_area = 500
-grace_period = timedelta(seconds=3)  # Extended grace period to handle instability
-iou_threshold = 0.5  # Intersection over Union threshold for bounding box similarity
-
 # Helper function to calculate IoU
 def calculate_iou(box1, box2):
     x1, y1, w1, h1 = box1
@@ -100,116 +139,53 @@ def calculate_iou(box1, box2):
 
     return inter_area / union_area if union_area > 0 else 0
 
-# Track timers, detection status, and view status for plates
-active_timers = {}
-last_seen_timestamps = {}
-last_detected_boxes = {}
-plates_in_view = set()  # To track plates that have already displayed "in view" message
-
-try:
-    while True:
-        success, img = cap.read()
-        if not success:
-            print("Failed to grab frame. Exiting.")
-            break
-
-        # Convert the image to grayscale for plate detection
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        plates = plate_cascade.detectMultiScale(img_gray, 1.1, 4)
-
-        detected_plates = []
-
-        for (x, y, w, h) in plates:
-            area = w * h
-            if area > min_area:
-                # Check for stability using IoU with previously detected boxes
-                matched_plate = None
-                for plate, last_box in last_detected_boxes.items():
-                    iou = calculate_iou((x, y, w, h), last_box)
-                    if iou > iou_threshold:
-                        matched_plate = plate
-                        break
-
-                if matched_plate:
-                    plate_text = matched_plate
-                else:
-                    # Save the detected plate as an image
-                    img_roi = img[y: y + h, x: x + w]
-                    plate_image_path = f"Plate_{x}_{y}_entry.jpg"
-                    cv2.imwrite(plate_image_path, img_roi)
-
-                    # Preprocess the image for better OCR
-                    processed_img = preprocess_image(img_roi)
-                    cv2.imwrite(f"Processed_{x}_{y}.jpg", processed_img)  # Save for debugging
-
-                    # Use EasyOCR to extract text from the preprocessed image
-                    output = reader.readtext(processed_img)
-                    number_plate = [
-                        text[1] for text in output
-                        if any(char.isdigit() for char in text[1]) and any(char.isalpha() for char in text[1])
-                    ]
-                    plate_text = number_plate[0] if number_plate else f"Unknown_{x}_{y}"
-
-                # Validate license plate format
-                if is_valid_license_plate(plate_text):
-                    # Update the detected bounding box
-                    last_detected_boxes[plate_text] = (x, y, w, h)
-                    detected_plates.append(plate_text)
-
-                    # Draw rectangle around the detected plate
-                    cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(img, plate_text, (x, y - 5), cv2.FONT_HERSHEY_COMPLEX_SMALL, 1, (255, 0, 255), 2)
-
-                    # Handle plate entry
-                    if plate_text not in active_timers:
-                        active_timers[plate_text] = datetime.now()
-                        print(f"Plate {plate_text} detected and entry image saved.")
-                    elif plate_text not in plates_in_view:
-                        print(f"Plate {plate_text} still in view.")
-                        plates_in_view.add(plate_text)
-
-                    # Update the last seen timestamp
-                    last_seen_timestamps[plate_text] = datetime.now()
-
-        # Handle plate exit
-        plates_to_remove = []
-        current_time = datetime.now()
-        for plate, last_seen_time in last_seen_timestamps.items():
-            if plate not in detected_plates and current_time - last_seen_time > grace_period:
-                start_time = active_timers.pop(plate, None)
-                if start_time:
-                    end_time = current_time
-                    duration = (end_time - start_time).total_seconds()
-                    if duration > 30:  # Save only if duration > 30 seconds
-                        print(f"Plate {plate} left. Duration: {duration} seconds.")
-
-                        # Save the parking session to the database
-                        save_parking_session(
-                            plate,
-                            "Lot_A",  # Placeholder for lot name
-                            "Slot_1",  # Placeholder for slot name
-                            start_time,
-                            end_time,
-                            duration
-                        )
-                        print(f"Parking session for {plate} saved to database.")
-                plates_to_remove.append(plate)
-
-        # Remove plates that have exited
-        for plate in plates_to_remove:
-            last_seen_timestamps.pop(plate, None)
-            last_detected_boxes.pop(plate, None)
-            plates_in_view.discard(plate)
-
-        # Display the camera feed
-        cv2.imshow('Camera Feed', img)
-
-        # Exit on pressing 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-finally:
-    # Release the camera and close OpenCV windows
-    cap.release()
-    cv2.destroyAllWindows()
-    print("Camera released.")
+
+def detect_plates(plate_cascade, img_gray):
+    """Runs Haar detection and keeps boxes above the minimum plate area."""
+    plates = plate_cascade.detectMultiScale(img_gray, 1.1, 4)
+    return [tuple(int(v) for v in box) for box in plates if box[2] * box[3] > min_area]
+
+
+def pick_plate_token(tokens):
+    """Returns (text, confidence) of the first OCR token with both letters and digits, or (None, 0.0)."""
+    for text, confidence in tokens:
+        if any(char.isdigit() for char in text) and any(char.isalpha() for char in text):
+            return text, float(confidence)
+    return None, 0.0
+
+
+def read_plate_text(img_roi, recognizer=None):
+    """OCRs a cropped plate and returns (text, confidence) of its most plate-like token."""
+    return read_plate_texts([img_roi], recognizer)[0]
+
+
+def read_plate_texts(img_rois, recognizer=None, buffers=None, timings=None):
+    """
+    OCRs several cropped plates in one batched recognizer call; returns one result per crop.
+    Pass a PreprocessBuffers to preprocess in place instead of allocating per crop, and a
+    dict as `timings` to get the seconds spent in 'preprocess' and 'readtext'.
+    """
+    recognizer = recognizer or get_recognizer()
+    if buffers is None:
+        buffers = PreprocessBuffers(len(img_rois))
+    started = time.perf_counter()
+    # Batched recognition needs equal-sized inputs, so every crop is resized to one plate-shaped canvas
+    processed = buffers.slots(len(img_rois))
+    for img_roi, out in zip(img_rois, processed):
+        preprocess_image(img_roi, buffers, out)
+    preprocessed = time.perf_counter()
+    outputs = recognizer.recognize(list(processed))
+    if timings is not None:
+        timings['preprocess'] = preprocessed - started
+        timings['readtext'] = time.perf_counter() - preprocessed
+    return [pick_plate_token(tokens) for tokens in outputs]
+
+
+def main(argv=None):
+    # The camera loop lives in pipeline.py; this stays the familiar entry point
+    import pipeline
+    return pipeline.main(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import time
+
+import plate_to_num
+
+# Process pool workers for pipeline.py. Kept in their own small module so each spawned
+# worker imports only OpenCV and the OCR code, not the pipeline's database/web stack.
+
+OCR_PREWARM = os.getenv('OCR_PREWARM', '1') != '0'  # Load the OCR model as soon as a worker starts
+
+_cascade = None
+_buffers = None
+
+
+def init_worker():
+    # Each process loads its own cascade and OCR model once
+    global _cascade, _buffers
+    _cascade = plate_to_num.load_plate_cascade()
+    _buffers = plate_to_num.PreprocessBuffers()
+    if OCR_PREWARM:
+        # Runs while the worker serves detections; the first OCR batch waits on it only if it's still loading
+        plate_to_num.prewarm_recognizer()
+
+
+def detect(img_gray):
+    # Also report this process's CPU time for the call, for per-camera CPU accounting
+    started = time.process_time()
+    boxes = plate_to_num.detect_plates(_cascade, img_gray)
+    return boxes, time.process_time() - started
+
+
+def ocr_batch(img_rois):
+    # img_rois: plate crops gathered across frames and cameras by the OcrBatcher. Stage
+    # timings ride back with the results: metrics live in the parent process.
+    timings = {}
+    results = plate_to_num.read_plate_texts(img_rois, buffers=_buffers, timings=timings)
+    return results, timings
@@ -0,0 +1,308 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Plate text recognizers. Each takes preprocessed plate canvases (equal-sized grayscale
+# images from plate_to_num.preprocess_image) and returns, per image, the [(text, confidence)]
+# tokens it read. Models load on first use (or load()), never at import.
+#
+#     python recognizers.py export                       # EasyOCR's recognizer -> ONNX, int8-quantized
+#     python recognizers.py bench --crops plates/        # Latency, throughput and accuracy per backend
+
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'easyocr')  # 'easyocr', 'easyocr-recognize' or 'onnx'
+OCR_ONNX_MODEL = os.getenv('OCR_ONNX_MODEL', 'model/plate_recognizer.int8.onnx')
+OCR_THREADS = int(os.getenv('OCR_THREADS', 0))  # Inference threads per process; 0 keeps the library default
+
+PLATE_CHARACTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 '
+MODEL_HEIGHT = 64  # Input height of EasyOCR's recognition network
+
+
+def _set_torch_threads(threads):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+class EasyOcrRecognizer:
+    """EasyOCR's full readtext: its CRAFT text detector runs on every crop, then recognition on each region found."""
+
+    name = 'easyocr'
+
+    def __init__(self, threads=OCR_THREADS):
+        self.threads = threads
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _create_reader(self):
+        import easyocr  # Pulls in torch; loaded on first use only
+        _set_torch_threads(self.threads)
+        return easyocr.Reader(['en'])
+
+    def _get_reader(self):
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    self._reader = self._create_reader()
+        return self._reader
+
+    def load(self):
+        self._get_reader()
+
+    def recognize(self, images):
+        height, width = images[0].shape[:2]
+        outputs = self._get_reader().readtext_batched(images, n_width=width, n_height=height, batch_size=len(images))
+        return [[(text, confidence) for _, text, confidence in output] for output in outputs]
+
+
+class EasyOcrRecognizeOnly(EasyOcrRecognizer):
+    """
+    EasyOCR's recognition network alone: the crop already is the plate, so the text detector
+    is never loaded or run, and decoding is limited to plate characters. The batch is stacked
+    into one image with a box per crop for a single call; on the CPU, EasyOCR still runs the
+    network once per box.
+    """
+
+    name = 'easyocr-recognize'
+
+    def _create_reader(self):
+        import easyocr
+        _set_torch_threads(self.threads)
+        return easyocr.Reader(['en'], detector=False)
+
+    def recognize(self, images):
+        height, width = images[0].shape[:2]
+        boxes = [[0, width, i * height, (i + 1) * height] for i in range(len(images))]
+        results = self._get_reader().recognize(np.vstack(images), horizontal_list=boxes, free_list=[],
+                                               allowlist=PLATE_CHARACTERS)
+        outputs = [[] for _ in images]
+        for box, text, confidence in results:
+            outputs[int(box[0][1]) // height].append((text, confidence))  # Top edge -> crop index
+        return outputs
+
+
+class OnnxRecognizer:
+    """
+    A CTC recognizer run with ONNX Runtime on the CPU, normally EasyOCR's recognition network
+    exported and int8-quantized by `python recognizers.py export`. Its character list lives in
+    <model>.chars (JSON, index 0 = CTC blank).
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model_path=OCR_ONNX_MODEL, threads=OCR_THREADS):
+        self.model_path = model_path
+        self.threads = threads
+        self._session = None
+        self._lock = threading.Lock()
+        self.characters = None
+        self.allowed = None  # Class mask: plate characters and the blank
+        self.input_width = None  # Fixed by the exported model
+
+    def _get_session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import json
+
+                    import onnxruntime  # Loaded on first use only
+
+                    options = onnxruntime.SessionOptions()
+                    if self.threads:
+                        options.intra_op_num_threads = self.threads
+                        options.inter_op_num_threads = 1
+                    with open(self.model_path + '.chars') as f:
+                        self.characters = json.load(f)
+                    self.allowed = np.array([i == 0 or char in PLATE_CHARACTERS
+                                             for i, char in enumerate(self.characters)])
+                    session = onnxruntime.InferenceSession(self.model_path, options,
+                                                           providers=['CPUExecutionProvider'])
+                    self.input_width = session.get_inputs()[0].shape[3]
+                    self._session = session
+        return self._session
+
+    def load(self):
+        self._get_session()
+
+    def recognize(self, images):
+        session = self._get_session()
+        batch = np.empty((len(images), 1, MODEL_HEIGHT, self.input_width), np.float32)
+        for image, out in zip(images, batch):
+            out[0] = cv2.resize(image, (self.input_width, MODEL_HEIGHT), interpolation=cv2.INTER_AREA)
+        batch *= 2 / 255.0  # EasyOCR's normalization: [0, 255] -> [-1, 1]
+        batch -= 1.0
+        logits = session.run(None, {session.get_inputs()[0].name: batch})[0]  # (batch, steps, classes)
+        return [self._decode(steps) for steps in logits]
+
+    def _decode(self, logits):
+        # Greedy CTC over plate characters only: best class per step, repeats collapsed, blanks dropped
+        logits = np.where(self.allowed, logits, -np.inf)
+        probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        # Steps that emit a character: not blank, and not a repeat of the step before
+        emitted = (best != 0) & (best != np.concatenate(([0], best[:-1])))
+        text = ''.join(self.characters[index] for index in best[emitted]).strip()
+        if not text:
+            return []
+        # EasyOCR's confidence over the emitting steps: product of their maxima, scaled by 2 / sqrt(count)
+        kept = probs[np.arange(len(best)), best][emitted]
+        confidence = float(np.exp(np.log(np.maximum(kept, 1e-12)).sum() * 2 / np.sqrt(len(kept))))
+        return [(text, confidence)]
+
+
+RECOGNIZERS = {cls.name: cls for cls in (EasyOcrRecognizer, EasyOcrRecognizeOnly, OnnxRecognizer)}
+
+
+def default_recognizer(backend=OCR_BACKEND):
+    if backend not in RECOGNIZERS:
+        raise ValueError(f"Unknown OCR_BACKEND {backend!r}; expected one of {', '.join(RECOGNIZERS)}")
+    return RECOGNIZERS[backend]()
+
+
+def export_onnx(out=OCR_ONNX_MODEL, quantize=True):
+    """Exports EasyOCR's English recognition network to ONNX (int8 weights unless quantize=False)."""
+    import json
+
+    import easyocr
+    import torch
+
+    from plate_to_num import ocr_batch_height, ocr_batch_width
+
+    # quantize=False: EasyOCR's own CPU quantization swaps in dynamically quantized LSTM/Linear
+    # modules that torch.onnx.export can't handle; int8 is applied by ONNX Runtime below instead
+    reader = easyocr.Reader(['en'], detector=False, gpu=False, quantize=False)
+    network = reader.recognizer.eval()
+
+    class Recognition(torch.nn.Module):
+        # EasyOCR's forward(input, text) ignores `text` for CTC models
+        def __init__(self):
+            super().__init__()
+            self.network = network
+
+        def forward(self, image):
+            return self.network(image, None)
+
+    # Width is fixed to the OCR canvas scaled to the network's height; only the batch varies
+    width = round(ocr_batch_width * MODEL_HEIGHT / ocr_batch_height)
+    fp32 = out.replace('.int8', '') if quantize else out
+    if quantize and fp32 == out:
+        fp32 = os.path.splitext(out)[0] + '.fp32.onnx'
+    torch.onnx.export(Recognition(), torch.zeros(1, 1, MODEL_HEIGHT, width), fp32, input_names=['image'],
+                      output_names=['logits'], dynamic_axes={'image': {0: 'batch'}, 'logits': {0: 'batch'}},
+                      opset_version=13)
+    paths = [fp32]
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32, out, weight_type=QuantType.QInt8)
+        paths.append(out)
+    for path in paths:
+        with open(path + '.chars', 'w') as f:
+            json.dump(reader.converter.character, f)
+    return paths
+
+
+def load_labelled_crops(crops_dir, labels_path=None):
+    """Returns [(name, image, plate)] for every crop named in the labels file ({file name: plate})."""
+    import json
+
+    labels_path = labels_path or os.path.join(crops_dir, 'labels.json')
+    with open(labels_path) as f:
+        labels = json.load(f)
+    crops = []
+    for name, plate in sorted(labels.items()):
+        img = cv2.imread(os.path.join(crops_dir, name))
+        if img is None:
+            print(f"Skipping {name}: not readable")
+            continue
+        crops.append((name, img, plate))
+    return crops
+
+
+def benchmark(backend, crops, batch_size=8, rounds=3):
+    """Load time, crops/s, p50/p95 batch latency and accuracy of one backend on labelled crops."""
+    import time
+
+    import plate_to_num
+    from plate_resolver import compact, normalize_plate, plate_distance
+
+    recognizer = default_recognizer(backend)
+    started = time.perf_counter()
+    recognizer.load()
+    load_seconds = time.perf_counter() - started
+
+    images = [img for _, img, _ in crops]
+    buffers = plate_to_num.PreprocessBuffers(batch_size)
+    plate_to_num.read_plate_texts(images[:batch_size], recognizer, buffers)  # Warm up
+
+    latencies, texts = [], []
+    started = time.perf_counter()
+    for round_number in range(rounds):
+        for i in range(0, len(images), batch_size):
+            batch_started = time.perf_counter()
+            results = plate_to_num.read_plate_texts(images[i:i + batch_size], recognizer, buffers)
+            latencies.append(time.perf_counter() - batch_started)
+            if round_number == 0:
+                texts += [text for text, _ in results]
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    # Scored the way the pipeline sees a reading: normalized, spacing ignored
+    exact = near = 0
+    for (_, _, plate), text in zip(crops, texts):
+        read = normalize_plate(text) if text else ''
+        exact += compact(read) == compact(plate)
+        near += plate_distance(read, plate) <= 1.0
+    return {
+        'backend': backend,
+        'load_seconds': load_seconds,
+        'crops_per_second': len(images) * rounds / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'accuracy': exact / len(crops),
+        'within_one_edit': near / len(crops),
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plate recognizer backends: export and benchmark")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="Export EasyOCR's recognizer to ONNX")
+    export.add_argument('--out', default=OCR_ONNX_MODEL)
+    export.add_argument('--no-quantize', action='store_true', help="Keep float32 weights")
+    bench = commands.add_parser('bench', help="Compare backends on a labelled crop set (CPU)")
+    bench.add_argument('--crops', required=True, help="Directory of plate crops")
+    bench.add_argument('--labels', help="JSON {file name: plate}; default <crops>/labels.json")
+    bench.add_argument('--backends', default=','.join(RECOGNIZERS))
+    bench.add_argument('--batch', type=int, default=8, help="Crops per recognize call (OCR_BATCH_SIZE)")
+    bench.add_argument('--rounds', type=int, default=3, help="Timed passes over the crop set")
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        for path in export_onnx(args.out, quantize=not args.no_quantize):
+            print(f"Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        return
+
+    crops = load_labelled_crops(args.crops, args.labels)
+    if not crops:
+        raise SystemExit(f"No labelled crops found in {args.crops}")
+    print(f"{len(crops)} labelled crops, batches of {args.batch}, {OCR_THREADS or 'default'} threads")
+    for backend in args.backends.split(','):
+        try:
+            result = benchmark(backend, crops, args.batch, args.rounds)
+        except Exception as e:  # Missing model file or library: report it and compare the rest
+            print(f"{backend:>18}: unavailable ({e})")
+            continue
+        print(f"{backend:>18}: load {result['load_seconds']:5.1f}s, {result['crops_per_second']:7.1f} crops/s, "
+              f"p50 {result['p50_ms']:7.1f}ms, p95 {result['p95_ms']:7.1f}ms per batch, "
+              f"accuracy {result['accuracy']:.1%} ({result['within_one_edit']:.1%} within one edit)")
+
+
+if __name__ == "__main__":
+    main()
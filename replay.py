@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from pipeline import PIPELINE_WORKERS, CameraConfig, run_pipeline
+from plate_resolver import PlateIndex, compact
+from plate_to_num import grace_period, min_session_seconds
+from tracker import assign
+
+load_dotenv()
+
+# Offline replay of recorded lanes through the real pipeline (detection scheduling, Haar
+# detection, batched OCR, tracking, session logic), scored against hand-made annotations.
+# Frames are stamped with their position in the recording instead of the wall clock, so the
+# grace period and the minimum session length behave the same however fast the machine is.
+#
+#     python replay.py recordings/gate1.mp4 recordings/gate2/                 # Score a suite
+#     python replay.py recordings/*.mp4 --history replay_history.jsonl        # Track results per commit
+#
+# Each recording needs an annotation file next to it with the same name and a .json extension
+# (gate1.mp4 -> gate1.json, gate2/ -> gate2.json), times in seconds from the first frame:
+#
+#     {"fps": 25, "roi": [0, 200, 640, 280],
+#      "vehicles": [{"plate": "KA 01 AB 1234", "entry": 4.0, "exit": 61.5}]}
+#
+# entry/exit are when the plate first and last shows in frame. fps is only needed for frame
+# directories (default FRAME_DIR_FPS); roi is the camera's optional detection region. The
+# suite's annotated plates stand in for the registered plates OCR text is resolved against.
+
+REPLAY_EPOCH = datetime(2000, 1, 1)  # Virtual time of every recording's first frame
+BOUNDARY_TOLERANCE = float(os.getenv('REPLAY_BOUNDARY_TOLERANCE', 2.0))  # Seconds a session start/end may be off
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class VirtualClock:
+    """Stamps each frame with its position in the recording (CAP_PROP_POS_MSEC) from REPLAY_EPOCH."""
+
+    def __init__(self, start=REPLAY_EPOCH):
+        self.start = start
+
+    def __call__(self, cap):
+        return self.start + timedelta(milliseconds=cap.get(cv2.CAP_PROP_POS_MSEC))
+
+
+class SessionRecorder:
+    """Stands in for SessionSink: keeps finished sessions in memory instead of writing them."""
+
+    def __init__(self):
+        self.sessions = []
+        self.written = 0
+        self.spooled = 0
+        self._lock = threading.Lock()
+
+    def submit(self, plate, lot_name, slot_name, start_time, end_time, duration):
+        with self._lock:  # One call per camera thread
+            self.sessions.append((plate, lot_name, slot_name, start_time, end_time, duration))
+            self.written += 1
+
+    def pending(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class DiscardEvidence:
+    """Stands in for EvidenceArchiver; replays don't archive entry crops."""
+
+    def submit(self, img_roi, camera, track_id, plate, timestamp):
+        pass
+
+    def pending(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+def annotation_path(recording):
+    return os.path.splitext(recording.rstrip('/\\'))[0] + '.json'
+
+
+def load_recording(recording):
+    """Returns (CameraConfig, vehicles) for one recording and its annotation file."""
+    with open(annotation_path(recording)) as f:
+        annotation = json.load(f)
+    name = os.path.basename(recording.rstrip('/\\'))
+    camera = CameraConfig(name, recording, 'Replay', name, roi=annotation.get('roi'), fps=annotation.get('fps'))
+    vehicles = [
+        {'plate': vehicle['plate'].strip().upper(), 'entry': float(vehicle['entry']), 'exit': float(vehicle['exit'])}
+        for vehicle in annotation['vehicles']
+    ]
+    return camera, vehicles
+
+
+def seconds(timestamp):
+    """Virtual timestamp -> seconds from the first frame."""
+    return (timestamp - REPLAY_EPOCH).total_seconds()
+
+
+def expected_sessions(vehicles):
+    """
+    Vehicles that should produce a session, with the boundaries the tracker should report: the
+    start when the plate shows, the end one grace period after it was last seen. Shorter visits
+    are drive-bys and must not be saved.
+    """
+    grace = grace_period.total_seconds()
+    return [
+        dict(vehicle, start=vehicle['entry'], end=vehicle['exit'] + grace)
+        for vehicle in vehicles
+        if vehicle['exit'] + grace - vehicle['entry'] > min_session_seconds
+    ]
+
+
+def overlap_matrix(expected, sessions):
+    """Temporal IoU of every expected session (rows) with every produced session (columns)."""
+    iou = np.zeros((len(expected), len(sessions)))
+    for r, want in enumerate(expected):
+        for c, (start, end) in enumerate(sessions):
+            inter = min(want['end'], end) - max(want['start'], start)
+            union = max(want['end'], end) - min(want['start'], start)
+            iou[r, c] = max(inter, 0) / union if union > 0 else 0.0
+    return iou
+
+
+def score_recording(vehicles, sessions, stats, tolerance=BOUNDARY_TOLERANCE):
+    """Compares one recording's sessions with its annotations; returns (score dict, problem lines)."""
+    expected = expected_sessions(vehicles)
+    produced = sorted((plate, seconds(start), seconds(end)) for plate, _, _, start, end, _ in sessions)
+    matches = assign(overlap_matrix(expected, [(start, end) for _, start, end in produced]), 0.0, 'greedy')
+
+    plates_right = boundaries_right = 0
+    entry_errors, exit_errors, problems = [], [], []
+    for r, c in sorted(matches):
+        want, (plate, start, end) = expected[r], produced[c]
+        entry_error, exit_error = start - want['start'], end - want['end']
+        entry_errors.append(abs(entry_error))
+        exit_errors.append(abs(exit_error))
+        if compact(plate) == compact(want['plate']):
+            plates_right += 1
+        else:
+            problems.append(f"read {plate} for {want['plate']} (entered {want['entry']:.1f}s)")
+        if abs(entry_error) <= tolerance and abs(exit_error) <= tolerance:
+            boundaries_right += 1
+        else:
+            problems.append(f"{want['plate']}: session {start:.1f}-{end:.1f}s, expected "
+                            f"{want['start']:.1f}-{want['end']:.1f}s")
+    matched_rows = {r for r, _ in matches}
+    matched_cols = {c for _, c in matches}
+    for r, want in enumerate(expected):
+        if r not in matched_rows:
+            problems.append(f"{want['plate']}: no session (in view {want['entry']:.1f}-{want['exit']:.1f}s)")
+    for c, (plate, start, end) in enumerate(produced):
+        if c not in matched_cols:
+            problems.append(f"{plate}: unexpected session {start:.1f}-{end:.1f}s")
+
+    score = {
+        'frames': stats.processed,
+        'fps': stats.fps(),
+        'vehicles': len(vehicles),
+        'expected': len(expected),
+        'sessions': len(produced),
+        'missed': len(expected) - len(matches),
+        'spurious': len(produced) - len(matches),
+        'plates_right': plates_right,
+        'boundaries_right': boundaries_right,
+        'ocr_calls': stats.ocr_calls,
+        'mean_entry_error': float(np.mean(entry_errors)) if entry_errors else None,
+        'mean_exit_error': float(np.mean(exit_errors)) if exit_errors else None,
+    }
+    return score, problems
+
+
+def summarize(scores, elapsed):
+    """Suite totals: a missed vehicle counts against both accuracies, a drive-by against nothing."""
+    total = {key: sum(score[key] for score in scores.values())
+             for key in ('frames', 'vehicles', 'expected', 'sessions', 'missed', 'spurious',
+                         'plates_right', 'boundaries_right', 'ocr_calls')}
+    expected = total['expected']
+    total['fps'] = total['frames'] / elapsed if elapsed > 0 else 0.0
+    total['plate_accuracy'] = total['plates_right'] / expected if expected else None
+    total['boundary_accuracy'] = total['boundaries_right'] / expected if expected else None
+    total['ocr_per_vehicle'] = total['ocr_calls'] / total['vehicles'] if total['vehicles'] else 0.0
+    return total
+
+
+def replay(recordings, workers=PIPELINE_WORKERS, tolerance=BOUNDARY_TOLERANCE, resolve=True):
+    """Runs the recordings through the pipeline together; returns (per-recording scores, problems, sessions, seconds)."""
+    loaded = [load_recording(recording) for recording in recordings]
+    resolver = None
+    if resolve:
+        annotated = [vehicle['plate'] for _, vehicles in loaded for vehicle in vehicles]
+        resolver = PlateIndex(loader=lambda: annotated).resolve
+    cameras = [camera for camera, _ in loaded]
+    if len({camera.name for camera in cameras}) != len(cameras):
+        raise ValueError("Recordings must have distinct names; sessions are told apart by it")
+    recorder = SessionRecorder()
+
+    started = time.perf_counter()
+    stats = run_pipeline(cameras, headless=True, workers=workers, writer=recorder, evidence=DiscardEvidence(),
+                         clock=VirtualClock(), on_occupancy=lambda *event: None, resolver=resolver)
+    elapsed = time.perf_counter() - started
+
+    scores, problems, sessions = {}, {}, {}
+    for camera, vehicles in loaded:
+        mine = sorted(session for session in recorder.sessions if session[2] == camera.name)
+        scores[camera.name], problems[camera.name] = score_recording(vehicles, mine, stats[camera.name], tolerance)
+        sessions[camera.name] = mine
+    return scores, problems, sessions, elapsed
+
+
+def git_commit():
+    """Short hash of the checked-out commit, suffixed -dirty with uncommitted changes."""
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return 'unknown'
+    return result.stdout.strip() or 'unknown'
+
+
+def last_result(history, suite, resolve):
+    """The most recent history entry for the same recordings and resolver setting, or None."""
+    if not history or not os.path.exists(history):
+        return None
+    previous = None
+    with open(history) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if entry['suite'] == suite and entry.get('resolver', True) == resolve:
+                    previous = entry
+    return previous
+
+
+def percent(value):
+    return 'n/a' if value is None else f"{value:.1%}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded lanes through the pipeline and score them")
+    parser.add_argument('recordings', nargs='+', help="Video files or frame directories, each with a .json annotation")
+    parser.add_argument('--workers', type=int, default=PIPELINE_WORKERS, help="Detection/OCR processes")
+    parser.add_argument('--tolerance', type=float, default=BOUNDARY_TOLERANCE,
+                        help="Seconds a session start/end may differ from the annotation")
+    parser.add_argument('--runs', type=int, default=1, help="Replay this many times and check the sessions are identical")
+    parser.add_argument('--no-resolver', action='store_true', help="Report plates as read, without fuzzy matching")
+    parser.add_argument('--history', help="JSON lines file: append this result and compare with the last one")
+    parser.add_argument('--max-drop', type=float, default=0.0,
+                        help="Fail if plate or boundary accuracy fell more than this below the last result")
+    args = parser.parse_args(argv)
+
+    resolve = not args.no_resolver
+    runs = [replay(args.recordings, args.workers, args.tolerance, resolve) for _ in range(args.runs)]
+    scores, problems, sessions, elapsed = min(runs, key=lambda run: run[3])  # Fastest run for throughput
+    deterministic = all(run[2] == sessions for run in runs)
+
+    for name, score in scores.items():
+        print(f"{name}: {score['frames']} frames, {score['fps']:.1f} frames/s, {score['sessions']} sessions for "
+              f"{score['expected']} expected ({score['vehicles'] - score['expected']} drive-bys), "
+              f"{score['plates_right']} plates right, {score['boundaries_right']} boundaries right, "
+              f"{score['missed']} missed, {score['spurious']} spurious")
+        for problem in problems[name]:
+            print(f"    {problem}")
+    total = summarize(scores, elapsed)
+    print(f"Suite: {total['fps']:.1f} frames/s, {total['ocr_per_vehicle']:.1f} OCR calls/vehicle, "
+          f"plate accuracy {percent(total['plate_accuracy'])}, "
+          f"session boundary accuracy {percent(total['boundary_accuracy'])} (within {args.tolerance:g}s)")
+
+    failures = []
+    if not deterministic:
+        failures.append(f"sessions differed between the {args.runs} runs")
+
+    suite = sorted(os.path.basename(recording.rstrip('/\\')) for recording in args.recordings)
+    if args.history:
+        previous = last_result(args.history, suite, resolve)
+        if previous:
+            print(f"Previous ({previous['commit']}): {previous['fps']:.1f} frames/s, "
+                  f"{previous['ocr_per_vehicle']:.1f} OCR calls/vehicle, "
+                  f"plate accuracy {percent(previous['plate_accuracy'])}, "
+                  f"session boundary accuracy {percent(previous['boundary_accuracy'])}")
+            for key in ('plate_accuracy', 'boundary_accuracy'):
+                if previous[key] is not None and total[key] is not None and total[key] < previous[key] - args.max_drop:
+                    failures.append(f"{key.replace('_', ' ')} fell from {percent(previous[key])} to {percent(total[key])}")
+        entry = {'commit': git_commit(), 'date': datetime.now().isoformat(timespec='seconds'), 'suite': suite, 'resolver': resolve,
+                 'deterministic': deterministic, **total, 'recordings': scores}
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"Result for {entry['commit']} appended to {args.history}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    return total
+
+
+if __name__ == "__main__":
+    main()
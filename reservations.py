@@ -0,0 +1,142 @@
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+
+from db import get_db_connection
+
+RESERVATION_MINUTES = 10
+MAX_ATTEMPTS = 5
+
+# Outcomes of reserve_slot()
+RESERVED = 'reserved'
+SLOT_TAKEN = 'slot_taken'
+UNPAID = 'unpaid'
+
+# InnoDB deadlock / lock wait timeout: the transaction was rolled back and is safe to retry
+RETRYABLE_ERRORS = (1213, 1205)
+
+
+def _attempt(conn, license_plate, lot_name, slot_name, now):
+    with conn.cursor() as cursor:
+        conn.begin()
+
+        cursor.execute('''
+            SELECT id
+            FROM parking_sessions
+            WHERE license_plate = %s AND paid = 0 AND end_time IS NOT NULL
+            LIMIT 1
+        ''', (license_plate,))
+        if cursor.fetchone():
+            conn.rollback()
+            return UNPAID, None
+
+        # Locks the slot's active range (rows and gap) until commit, so a concurrent
+        # booking of the same slot either waits for us or deadlocks and retries.
+        cursor.execute('''
+            SELECT id
+            FROM reservations
+            WHERE lot_name = %s AND slot_name = %s AND reservation_expiry > %s
+            LIMIT 1
+            FOR UPDATE
+        ''', (lot_name, slot_name, now))
+        if cursor.fetchone():
+            conn.rollback()
+            return SLOT_TAKEN, None
+
+        reservation_expiry = now + timedelta(minutes=RESERVATION_MINUTES)
+        cursor.execute('''
+            INSERT INTO reservations (license_plate, lot_name, slot_name, reservation_expiry)
+            VALUES (%s, %s, %s, %s)
+        ''', (license_plate, lot_name, slot_name, reservation_expiry))
+        conn.commit()
+        return RESERVED, reservation_expiry
+
+
+def reserve_slot(license_plate, lot_name, slot_name):
+    """
+    Books a slot in a single transaction: unpaid-session check, availability check and
+    insert. Returns (outcome, reservation_expiry); exactly one of any set of concurrent
+    callers for the same free slot gets RESERVED. Relies on InnoDB's default
+    REPEATABLE READ isolation for the gap lock taken by SELECT ... FOR UPDATE.
+    """
+    conn = get_db_connection()
+    try:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                return _attempt(conn, license_plate, lot_name, slot_name, datetime.now())
+            except pymysql.err.OperationalError as e:
+                conn.rollback()
+                if e.args[0] not in RETRYABLE_ERRORS or attempt == MAX_ATTEMPTS:
+                    raise
+                # Brief, growing pause so the winner can commit before we re-check
+                time.sleep(0.005 * attempt)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Stress test: N drivers post /reserve for the same slot at the same instant
+    import argparse
+    import threading
+
+    from app import app
+    from catalog import add_lot, remove_lot
+
+    parser = argparse.ArgumentParser(
+        description="Concurrent /reserve stress test (raise DB_POOL_TIMEOUT for large --clients)"
+    )
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--lot', default='Stress Lot', help="Prefix of the throwaway lot created for the run")
+    args = parser.parse_args()
+
+    # /reserve only accepts catalogued slots: create a throwaway lot, removed again below
+    lot_name = f"{args.lot} {int(time.time())}"
+    slot_name = "Stress Slot"
+    add_lot(lot_name, [slot_name])
+    barrier = threading.Barrier(args.clients)
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+
+    def client(i):
+        with app.test_client() as c:
+            with c.session_transaction() as sess:
+                sess['license_plate'] = f"ST {i:02d} RS {i:04d}"
+            barrier.wait()
+            started = time.perf_counter()
+            response = c.post('/reserve', data={'lot_name': lot_name, 'slot_name': slot_name})
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(response.headers.get('Location', ''))
+
+    try:
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) AS bookings FROM reservations WHERE lot_name = %s AND slot_name = %s",
+                    (lot_name, slot_name),
+                )
+                bookings = cursor.fetchone()['bookings']
+                cursor.execute("DELETE FROM reservations WHERE lot_name = %s", (lot_name,))
+                conn.commit()
+        finally:
+            conn.close()
+    finally:
+        remove_lot(lot_name)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    winners = sum(1 for location in statuses if location.endswith('/thankyou'))
+    print(f"{args.clients} clients: {bookings} booking(s), {winners} thank-you redirect(s)")
+    print(f"latency p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms max={latencies[-1] * 1000:.1f}ms")
+    assert bookings == 1 and winners == 1, "Double booking detected"
@@ -1,58 +1,38 @@
 import pymysql
+import select
+import socket
 import time
 import os
-from app import send_alert 
+import db
+import metrics
+from migrations import migrate
+from notifications import send_sms
+from session_wakeup import WAKE_BIND, WAKE_PORT, notify_new_session
 from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Get AWS RDS credentials from .env
-RDS_HOST = os.getenv('RDS_HOST')
-RDS_USER = os.getenv('RDS_USER')
-RDS_PASSWORD = os.getenv('RDS_PASSWORD')
-RDS_DB_NAME = os.getenv('RDS_DB_NAME')
-
 EXPECTED_PLATE = "KA 18 EQ 0001" 
 PHONE_NUMBER = os.getenv("MANAGER_PHONE_NUMBER")  
 
+POLL_SECONDS = float(os.getenv("SESSION_ALERT_POLL_SECONDS", 10))  # Fallback when no wake-up arrives
+LOOKBACK_IDS = 100  # Re-check this many ids below the mark for late-committing inserts
+
+ALERT_LAG = metrics.histogram('alert_lag_seconds', "Session row written to its plate check by the alert worker",
+                              buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300))
+
 
 def get_db_connection():
-    """Establishes and returns a database connection."""
+    """Checks out a pooled database connection, or returns None if the database is unreachable."""
     try:
-        conn = pymysql.connect(
-            host=RDS_HOST,
-            user=RDS_USER,
-            password=RDS_PASSWORD,
-            db=RDS_DB_NAME,
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        return conn
+        return db.get_db_connection()
     except pymysql.MySQLError as e:
         print(f"Error connecting to the database: {e}")
         return None
 
 
-def create_processed_sessions_table():
-    """Creates the processed_sessions table if it does not already exist."""
-    conn = get_db_connection()
-    if conn:
-        with conn.cursor() as cursor:
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS processed_sessions (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    license_plate VARCHAR(255) NOT NULL,
-                    lot_name VARCHAR(255) NOT NULL,
-                    slot_name VARCHAR(255) NOT NULL,
-                    start_time TIMESTAMP NOT NULL,
-                    processed_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            conn.commit()
-        conn.close()
-
-
 def insert_parking_session(license_plate, lot_name, slot_name, start_time):
     """Adds a new row to the parking_sessions table."""
     conn = get_db_connection()
@@ -65,82 +45,201 @@ def insert_parking_session(license_plate, lot_name, slot_name, start_time):
                 ''', (license_plate, lot_name, slot_name, start_time))
                 conn.commit()
                 print(f"Inserted new parking session: {license_plate}, Lot: {lot_name}, Slot: {slot_name}, Start Time: {start_time}")
+                notify_new_session()
         except Exception as e:
             print(f"Error inserting new parking session: {e}")
         finally:
             conn.close()
 
 
+def open_wake_socket():
+    """Binds the UDP socket that notify_new_session() pokes, or returns None if unavailable."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind((WAKE_BIND, WAKE_PORT))
+    except OSError as e:
+        print(f"Wake socket unavailable ({e}); falling back to polling every {POLL_SECONDS}s")
+        sock.close()
+        return None
+    sock.setblocking(False)
+    return sock
+
+
+def wait_for_wake(sock, timeout):
+    """Sleeps until a wake-up arrives or the timeout passes, then drains pending wake-ups."""
+    if sock is None:
+        time.sleep(timeout)
+        return
+    ready, _, _ = select.select([sock], [], [], timeout)
+    while ready:
+        try:
+            sock.recv(16)
+        except BlockingIOError:
+            break
+
+
+def load_high_water_mark(cursor):
+    """Returns the highest parking_sessions id already handled."""
+    cursor.execute("SELECT COALESCE(MAX(id), 0) AS mark FROM processed_sessions")
+    return cursor.fetchone()["mark"]
+
+
+def fetch_new_sessions(cursor, mark):
+    """
+    Reads sessions inserted since the high-water mark, open or already closed (the camera
+    pipeline writes each session once, when it ends). Returns (sessions, new_mark).
+    A short look-back below the mark catches inserts that committed out of id order;
+    the NOT EXISTS probe on processed_sessions' primary key keeps those from repeating.
+    """
+    cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM parking_sessions")
+    max_id = cursor.fetchone()["max_id"]
+
+    cursor.execute('''
+        SELECT ps.id, ps.license_plate AS detected_plate, ps.lot_name, ps.slot_name, ps.start_time,
+               COALESCE(ps.end_time, ps.start_time) AS written_time, %s AS expected_plate
+        FROM parking_sessions ps
+        WHERE ps.id > %s AND ps.id <= %s
+          AND NOT EXISTS (SELECT 1 FROM processed_sessions p WHERE p.id = ps.id)
+        ORDER BY ps.id
+    ''', (EXPECTED_PLATE, max(0, mark - LOOKBACK_IDS), max_id))
+    return cursor.fetchall(), max(mark, max_id)
+
+
+def handle_session(cursor, conn, session):
+    """Alerts on a mismatched plate and records the session as processed."""
+    row_id = session["id"]
+    detected_plate = session["detected_plate"]
+    expected_plate = session["expected_plate"]
+    lot_name = session["lot_name"]
+    slot_name = session["slot_name"]
+    ALERT_LAG.observe((datetime.now() - session["written_time"]).total_seconds())
+
+    # Check for mismatch
+    if detected_plate != expected_plate:
+        print(f"Mismatch detected in Lot: {lot_name}, Slot: {slot_name}")
+        print(f"Detected Plate: {detected_plate}, Expected Plate: {expected_plate}")
+
+        # Create a message for the alert
+        message = (f"Alert! License plate mismatch detected.\n"
+                   f"Detected: {detected_plate}\n"
+                   f"Expected: {expected_plate}\n"
+                   f"Lot: {lot_name}, Slot: {slot_name}")
+
+        # Queued for the alert workers so one slow SMS doesn't hold up the rest
+        send_sms(PHONE_NUMBER, message, key=(detected_plate, lot_name, slot_name))
+        print(f"Alert queued for: {PHONE_NUMBER}")
+
+    # Mark the session as processed
+    try:
+        cursor.execute('''
+            INSERT INTO processed_sessions (id, license_plate, lot_name, slot_name, start_time)
+            SELECT id, license_plate, lot_name, slot_name, start_time
+            FROM parking_sessions
+            WHERE id = %s
+        ''', (row_id,))
+        conn.commit()
+        print(f"Marked session {row_id} as processed.")
+    except Exception as e:
+        print(f"Error marking session {row_id} as processed: {e}")
+
+
 def process_sessions():
-    """Checks for mismatched license plates and sends alerts."""
-    create_processed_sessions_table()
+    """Checks newly inserted sessions for mismatched license plates and sends alerts."""
+    migrate()  # Creates processed_sessions and the indexes the queries below rely on
+    wake_socket = open_wake_socket()
+    mark = None
 
     while True:
         conn = get_db_connection()
         if conn:
-            with conn.cursor() as cursor:
-                # Query all unprocessed active sessions
+            try:
+                with conn.cursor() as cursor:
+                    if mark is None:
+                        mark = load_high_water_mark(cursor)
+                    sessions, mark = fetch_new_sessions(cursor, mark)
+                    conn.commit()  # End the read snapshot so the next cycle sees new rows
+                    for session in sessions:
+                        handle_session(cursor, conn, session)
+            except pymysql.MySQLError as e:
+                print(f"Error processing sessions: {e}")
+            finally:
+                conn.close()
+
+        # Sleep until a writer pokes us, or at most POLL_SECONDS
+        wait_for_wake(wake_socket, POLL_SECONDS)
+
+
+def benchmark_cycle_cost(total_rows, steps=5, batch_size=10000):
+    """Times one fetch_new_sessions() cycle as parking_sessions grows by synthetic closed sessions."""
+    conn = get_db_connection()
+    start = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        with conn.cursor() as cursor:
+            mark = load_high_water_mark(cursor)
+            inserted = 0
+            for step in range(1, steps + 1):
+                target = total_rows * step // steps
+                while inserted < target:
+                    count = min(batch_size, target - inserted)
+                    cursor.executemany('''
+                        INSERT INTO parking_sessions (license_plate, lot_name, slot_name, start_time, end_time, duration, paid)
+                        VALUES ('BENCH', 'Bench Lot', 'Bench Slot', %s, %s, 60, 1)
+                    ''', [(start, start)] * count)
+                    conn.commit()
+                    inserted += count
+
+                cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM parking_sessions")
+                mark = cursor.fetchone()["max_id"]
+                started = time.perf_counter()
+                sessions, mark = fetch_new_sessions(cursor, mark)
+                conn.commit()
+                elapsed = time.perf_counter() - started
+
+                # The previous full-table query, for comparison
+                started = time.perf_counter()
                 cursor.execute('''
-                    SELECT ps.id, ps.license_plate AS detected_plate, ps.lot_name, ps.slot_name, ps.start_time,
-                           %s AS expected_plate
-                    FROM parking_sessions ps
+                    SELECT ps.id FROM parking_sessions ps
                     WHERE ps.end_time IS NULL
                       AND ps.id NOT IN (SELECT id FROM processed_sessions)
-                ''', (EXPECTED_PLATE,))
-                sessions = cursor.fetchall()
-
-                for session in sessions:
-                    row_id = session["id"]
-                    detected_plate = session["detected_plate"]
-                    expected_plate = session["expected_plate"]
-                    lot_name = session["lot_name"]
-                    slot_name = session["slot_name"]
-
-                    # Check for mismatch
-                    if detected_plate != expected_plate:
-                        print(f"Mismatch detected in Lot: {lot_name}, Slot: {slot_name}")
-                        print(f"Detected Plate: {detected_plate}, Expected Plate: {expected_plate}")
-
-                        # Create a message for the alert
-                        message = (f"Alert! License plate mismatch detected.\n"
-                                   f"Detected: {detected_plate}\n"
-                                   f"Expected: {expected_plate}\n"
-                                   f"Lot: {lot_name}, Slot: {slot_name}")
-
-                        try:
-                            send_alert(PHONE_NUMBER, message)
-                            print(f"Alert successfully sent to: {PHONE_NUMBER}")
-                        except Exception as e:
-                            print(f"Failed to send alert: {e}")
-
-                    # Mark the session as processed
-                    try:
-                        cursor.execute('''
-                            INSERT INTO processed_sessions (id, license_plate, lot_name, slot_name, start_time)
-                            SELECT id, license_plate, lot_name, slot_name, start_time
-                            FROM parking_sessions
-                            WHERE id = %s
-                        ''', (row_id,))
-                        conn.commit()
-                        print(f"Marked session {row_id} as processed.")
-                    except Exception as e:
-                        print(f"Error marking session {row_id} as processed: {e}")
+                ''')
+                cursor.fetchall()
+                conn.commit()
+                legacy = time.perf_counter() - started
+                print(f"{inserted:>10} synthetic rows: incremental {elapsed * 1000:.2f}ms "
+                      f"({len(sessions)} new), full scan {legacy * 1000:.2f}ms")
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM parking_sessions WHERE license_plate = 'BENCH' AND lot_name = 'Bench Lot'")
+            conn.commit()
+        conn.close()
 
-            conn.close()
 
-        # Wait for 10 seconds before the next check
-        time.sleep(10)
+def main(argv=None):
+    import argparse
 
+    parser = argparse.ArgumentParser(description="Session alert processor")
+    parser.add_argument('--bench-rows', type=int, help="Benchmark per-cycle cost up to this many synthetic rows and exit")
+    parser.add_argument('--metrics-port', default=metrics.METRICS_PORT, help="Serve Prometheus /metrics on this port")
+    args = parser.parse_args(argv)
+
+    if args.bench_rows:
+        migrate()
+        benchmark_cycle_cost(args.bench_rows)
+        return
 
-if __name__ == "__main__":
     print("Starting session alert processor...")
+    metrics.serve(args.metrics_port)
 
     # Add a test row (optional, for demonstration purposes)
     test_license_plate = "CG 19 EQ 0001"
-    test_lot_name = "Lot_A"
-    test_slot_name = "Slot_1"
+    test_lot_name = "Lot A"
+    test_slot_name = "Slot 1"
     test_start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     insert_parking_session(test_license_plate, test_lot_name, test_slot_name, test_start_time)
 
     # Start monitoring sessions for mismatched plates
     process_sessions()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+from db import get_db_connection
+from migrations import migrate
+from session_wakeup import notify_new_session
+from unpaid_guard import broadcast_unpaid_change
+
+load_dotenv()
+
+SESSION_QUEUE_SIZE = int(os.getenv('SESSION_QUEUE_SIZE', 1000))  # Past this, exits spill straight to the journal
+SESSION_BATCH_SIZE = int(os.getenv('SESSION_BATCH_SIZE', 50))
+SESSION_FLUSH_SECONDS = float(os.getenv('SESSION_FLUSH_SECONDS', 1))  # Max time an exit waits in memory
+SESSION_JOURNAL = os.getenv('SESSION_JOURNAL', 'sessions.journal')  # Local spool used while the DB is down
+SESSION_RETRY_MAX = 30  # Cap, in seconds, on the back-off between reconnect attempts
+
+STAGE_SECONDS = metrics.histogram('pipeline_stage_seconds', "Time per pipeline stage", ('stage',))
+
+# A repeated session_key is a no-op (0 affected rows). INSERT IGNORE would also turn bad
+# values and NOT NULL violations into warnings, silently altering or dropping rows.
+INSERT_SESSIONS = '''
+    INSERT INTO parking_sessions
+        (session_key, license_plate, lot_name, slot_name, start_time, end_time, duration)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE session_key = session_key
+'''
+
+
+def session_row(plate, lot_name, slot_name, start_time, end_time, duration):
+    """
+    Row for INSERT_SESSIONS. The key is derived from the vehicle, slot and entry time,
+    so writing the same exit again (retry, journal replay) is a no-op.
+    """
+    start = start_time.strftime('%Y-%m-%d %H:%M:%S')
+    end = end_time.strftime('%Y-%m-%d %H:%M:%S')
+    key = hashlib.sha1(f"{plate}|{lot_name}|{slot_name}|{start}".encode()).hexdigest()
+    return (key, plate, lot_name, slot_name, start, end, duration)
+
+
+def insert_sessions(rows, connect=get_db_connection):
+    """Writes session rows in one executemany/commit; returns how many were new."""
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            inserted = cursor.executemany(INSERT_SESSIONS, rows)
+            conn.commit()
+    finally:
+        conn.close()
+    if not inserted:
+        return 0
+    # Let the alert worker pick the new rows up immediately
+    notify_new_session()
+    # Each row is an unpaid completed session: drop the web workers' cached "paid up" state
+    broadcast_unpaid_change({row[1] for row in rows})
+    return inserted
+
+
+class SessionSink:
+    """
+    Write-behind sink for finished parking sessions. submit() never touches the database:
+    rows are buffered and flushed by one background thread in batches of batch_size or
+    every flush_seconds, whichever comes first. While the database is unreachable batches
+    go to an append-only journal, which is replayed once a flush succeeds again. Rows are
+    written at least once; idempotent session keys make repeats harmless.
+    """
+
+    def __init__(self, connect=get_db_connection, journal_path=SESSION_JOURNAL, batch_size=SESSION_BATCH_SIZE,
+                 flush_seconds=SESSION_FLUSH_SECONDS, queue_size=SESSION_QUEUE_SIZE):
+        self._connect = connect
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._journal_lock = threading.Lock()
+        self._migrated = False
+        self._retry_at = 0.0  # While the DB is down, monotonic time of the next attempt
+        self._backoff = 1.0
+        self._thread = threading.Thread(target=self._run, name="session-sink", daemon=True)
+
+        self.submitted = 0
+        self.written = 0  # Rows actually inserted (duplicates excluded)
+        self.batches = 0
+        self.spooled = 0  # Rows sent to the journal
+        self.replayed = 0
+        self.failures = 0
+        self._thread.start()
+
+    def submit(self, plate, lot_name, slot_name, start_time, end_time, duration):
+        row = session_row(plate, lot_name, slot_name, start_time, end_time, duration)
+        self.submitted += 1
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Never block the camera: a backed-up sink spills to disk instead
+            self._spool([row])
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        if time.monotonic() < self._retry_at:
+            # Still backing off; keep the rows safe on disk until the database is back
+            self._spool(batch)
+            return
+        try:
+            if not self._migrated:
+                migrate()  # Adds the session_key column the inserts rely on
+                self._migrated = True
+            self._replay()
+            if batch:
+                with STAGE_SECONDS.time('session_write'):
+                    self.written += insert_sessions(batch, self._connect)
+                self.batches += 1
+            self._retry_at, self._backoff = 0.0, 1.0
+        except Exception as e:
+            self.failures += 1
+            print(f"Session sink: database unavailable ({e}); spooling {len(batch)} sessions to {self.journal_path}")
+            self._spool(batch)
+            self._retry_at = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, SESSION_RETRY_MAX)
+
+    def _spool(self, rows):
+        if not rows:
+            return
+        with self._journal_lock:
+            with open(self.journal_path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.spooled += len(rows)
+
+    def _replay(self):
+        """Writes journalled rows back to the database; the journal is removed only once they're committed."""
+        replaying = self.journal_path + '.replaying'
+        while True:
+            with self._journal_lock:
+                # A leftover .replaying file is from an interrupted replay; finish that one first
+                if not os.path.exists(replaying):
+                    if not os.path.exists(self.journal_path):
+                        return
+                    os.replace(self.journal_path, replaying)
+
+            with open(replaying) as f:
+                rows = [tuple(json.loads(line)) for line in f if line.strip()]
+            for i in range(0, len(rows), self.batch_size):
+                self.written += insert_sessions(rows[i:i + self.batch_size], self._connect)
+                self.batches += 1
+            self.replayed += len(rows)
+            os.remove(replaying)
+            print(f"Session sink: replayed {len(rows)} journalled sessions.")
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Flushes what's buffered (to the database, or to the journal if it's down) and stops."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    # Benchmark of sustained exits/sec, and a fault-injection run with the database down
+    import argparse
+    from datetime import datetime, timedelta
+
+    import pymysql
+
+    parser = argparse.ArgumentParser(description="Benchmark the write-behind session sink")
+    parser.add_argument('--exits', type=int, default=2000, help="Synthetic vehicle exits to submit")
+    parser.add_argument('--down-seconds', type=float, default=0,
+                        help="Fault injection: refuse DB connections for this long after starting")
+    parser.add_argument('--journal', default='bench_sessions.journal')
+    args = parser.parse_args()
+
+    outage_ends = time.monotonic() + args.down_seconds
+
+    def flaky_connect():
+        if time.monotonic() < outage_ends:
+            raise pymysql.err.OperationalError(2003, "Injected fault: database down")
+        return get_db_connection()
+
+    sink = SessionSink(connect=flaky_connect, journal_path=args.journal)
+    base = datetime.now().replace(microsecond=0) - timedelta(days=1)
+    started = time.perf_counter()
+    for i in range(args.exits):
+        start_time = base + timedelta(seconds=i)
+        sink.submit('BENCH', 'Bench Lot', f"Slot {i % 8 + 1}", start_time, start_time + timedelta(minutes=5), 300)
+        # A duplicate exit of every tenth vehicle must not produce a second row
+        if i % 10 == 0:
+            sink.submit('BENCH', 'Bench Lot', f"Slot {i % 8 + 1}", start_time, start_time + timedelta(minutes=5), 300)
+    submit_elapsed = time.perf_counter() - started
+
+    sink.close()
+    replayed = 0
+    if os.path.exists(args.journal) or os.path.exists(args.journal + '.replaying'):
+        # Closed while the database was down: the next sink to start (after the outage) replays the journal
+        time.sleep(max(0.0, outage_ends - time.monotonic()))
+        restarted = SessionSink(journal_path=args.journal)
+        restarted.close()
+        replayed = restarted.replayed
+    elapsed = time.perf_counter() - started
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS n FROM parking_sessions WHERE license_plate = 'BENCH' AND lot_name = 'Bench Lot'")
+            rows = cursor.fetchone()['n']
+            cursor.execute("DELETE FROM parking_sessions WHERE license_plate = 'BENCH' AND lot_name = 'Bench Lot'")
+            conn.commit()
+    finally:
+        conn.close()
+
+    expected = args.exits
+    print(f"submit: {args.exits / submit_elapsed:,.0f} exits/s (caller side)")
+    print(f"end to end: {args.exits / elapsed:,.0f} exits/s, {sink.batches} batches, "
+          f"{sink.spooled} spooled, {sink.replayed + replayed} replayed, {sink.failures} failed flushes")
+    print(f"rows in database: {rows} (expected {expected})")
+    if rows != expected:
+        raise SystemExit("Session sink lost or duplicated rows")
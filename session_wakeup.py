@@ -0,0 +1,23 @@
+import os
+import socket
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Wake-up poke from parking_sessions writers to the alert worker (session_alert.py), so a new
+# row is checked right away instead of at the worker's next poll. Kept apart from the worker
+# so writers such as the camera pipeline don't import it.
+
+WAKE_PORT = int(os.getenv("SESSION_ALERT_WAKE_PORT", 8765))  # UDP port writers poke on insert
+WAKE_HOST = os.getenv("SESSION_ALERT_WAKE_HOST", "127.0.0.1")  # Where writers send the poke: the alert worker's host
+WAKE_BIND = os.getenv("SESSION_ALERT_WAKE_BIND", "127.0.0.1")  # 0.0.0.0 to accept pokes from writers on other hosts
+
+
+def notify_new_session():
+    """Wakes the alert worker right away instead of at its next poll (best effort)."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b"1", (WAKE_HOST, WAKE_PORT))
+    except OSError:
+        pass
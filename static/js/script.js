@@ -33,7 +33,7 @@ function startReservationTimer(duration, displayElement) {
             clearInterval(interval);
             displayElement.textContent = "Reservation Expired!";
             alert("Your reservation has expired. Please try again.");
-            window.location.reload(); // Reload to show slots as available again
+            // No reload needed: the live slots channel marks the slot available again
         }
     }, 1000);
 }
@@ -69,3 +69,53 @@ function stopParkingTimer(intervalId) {
     alert("Parking session ended. Redirecting to payment...");
     window.location.href = "/payment"; // Redirect to payment page
 }
+
+// Live slot updates: the server pushes slot changes instead of the page being reloaded
+function renderSlot(button, state, expiry) {
+    const slotName = button.dataset.slot;
+    button.classList.toggle("available", state === "available");
+    button.classList.toggle("occupied", state !== "available");
+    button.disabled = state !== "available";
+
+    if (state === "reserved" && expiry) {
+        button.textContent = `${slotName} (Reserved until ${expiry})`;
+    } else if (state === "occupied") {
+        button.textContent = `${slotName} (Occupied)`;
+    } else {
+        button.textContent = slotName;
+    }
+}
+
+function subscribeToSlots(container) {
+    const buttons = {};
+    container.querySelectorAll("button[data-slot]").forEach((button) => {
+        buttons[button.dataset.slot] = button;
+    });
+
+    // EventSource reconnects on its own, and every connection starts with a snapshot
+    const source = new EventSource(`/slots/${encodeURIComponent(container.dataset.lot)}/events`);
+
+    source.addEventListener("snapshot", (e) => {
+        const slots = JSON.parse(e.data).slots;
+        Object.entries(buttons).forEach(([slotName, button]) => {
+            const slot = slots[slotName];
+            renderSlot(button, slot ? slot.state : "available", slot ? slot.expiry : null);
+        });
+    });
+
+    source.addEventListener("slot", (e) => {
+        const update = JSON.parse(e.data);
+        const button = buttons[update.slot];
+        if (button) {
+            renderSlot(button, update.state, update.expiry);
+        }
+    });
+}
+
+// Subscribe if it's the slots page
+document.addEventListener("DOMContentLoaded", () => {
+    const container = document.querySelector(".slots[data-lot]");
+    if (container && window.EventSource) {
+        subscribeToSlots(container);
+    }
+});
@@ -0,0 +1,234 @@
+import json
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TARIFF_CONFIG = os.getenv('TARIFF_CONFIG')  # Path to a JSON object of lot name (or "default") -> rate plan
+MINUTES_PER_DAY = 24 * 60
+
+# The original pricing rule: ₹20 for the first 10 minutes, ₹2 per extra minute
+DEFAULT_PLAN = {'base_fee': 20, 'base_minutes': 10, 'per_minute': 2}
+
+
+def _minute_of_day(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _rupees(paise):
+    # Whole-rupee amounts stay ints so they render as before (₹20, not ₹20.0)
+    paise = int(paise)
+    return paise // 100 if paise % 100 == 0 else paise / 100
+
+
+class RatePlan:
+    """
+    Pricing for one lot. Billed minutes are whole minutes of the session. The base fee
+    covers the first base_minutes; every minute after that is charged per_minute, or the
+    rate of the time-of-day band it falls in. Sessions under grace_minutes are free, and
+    daily_cap limits the charge per started day. Amounts are kept in paise internally.
+    """
+
+    def __init__(self, base_fee=20, base_minutes=10, per_minute=2, bands=(), grace_minutes=0, daily_cap=None):
+        self.base_fee = round(base_fee * 100)
+        self.base_minutes = int(base_minutes)
+        self.grace_minutes = int(grace_minutes)
+        self.daily_cap = round(daily_cap * 100) if daily_cap is not None else None
+
+        # Per-minute rate for every minute of the day, then its running total, so the
+        # charge for any span of minutes is two lookups (cost_to(end) - cost_to(start)).
+        rates = np.full(MINUTES_PER_DAY, round(per_minute * 100), dtype=np.int64)
+        for band in bands:  # {"from": "08:00", "to": "20:00", "per_minute": 3}; may wrap midnight
+            start, end = _minute_of_day(band['from']), _minute_of_day(band['to'])
+            rate = round(band['per_minute'] * 100)
+            if start < end:
+                rates[start:end] = rate
+            else:
+                rates[start:] = rate
+                rates[:end] = rate
+        self._cumulative = np.concatenate(([0], np.cumsum(rates)))
+        self._per_day = int(self._cumulative[-1])
+
+    def _cost_to(self, minute):
+        """Per-minute charges from midnight of the start day up to `minute` (scalar or array)."""
+        days, minute_of_day = np.divmod(minute, MINUTES_PER_DAY)
+        return days * self._per_day + self._cumulative[minute_of_day]
+
+    def price_paise(self, duration_seconds, start_minute=0):
+        minutes = int(duration_seconds) // 60
+        if minutes < self.grace_minutes:
+            return 0
+        fee = self.base_fee
+        if minutes > self.base_minutes:
+            fee += int(self._cost_to(start_minute + minutes) - self._cost_to(start_minute + self.base_minutes))
+        if self.daily_cap is not None:
+            fee = min(fee, self.daily_cap * max(1, -(-minutes // MINUTES_PER_DAY)))
+        return fee
+
+    def price_paise_many(self, duration_seconds, start_minutes=None):
+        """Vectorized price_paise over arrays; returns an int64 array of paise."""
+        minutes = np.asarray(duration_seconds, dtype=np.int64) // 60
+        start = np.zeros_like(minutes) if start_minutes is None else np.asarray(start_minutes, dtype=np.int64)
+        extra = self._cost_to(start + np.maximum(minutes, self.base_minutes)) - self._cost_to(start + self.base_minutes)
+        fee = self.base_fee + extra
+        if self.daily_cap is not None:
+            days = np.maximum(1, -(-minutes // MINUTES_PER_DAY))
+            fee = np.minimum(fee, self.daily_cap * days)
+        return np.where(minutes < self.grace_minutes, 0, fee)
+
+
+def load_rate_plans(path=TARIFF_CONFIG):
+    """Reads per-lot plans from JSON; lots without an entry use "default" (the original rule if absent)."""
+    entries = {}
+    if path:
+        with open(path) as f:
+            entries = json.load(f)
+    default = RatePlan(**entries.pop('default', DEFAULT_PLAN))
+    return default, {lot_name: RatePlan(**plan) for lot_name, plan in entries.items()}
+
+
+_default_plan, _lot_plans = load_rate_plans()
+
+
+def plan_for(lot_name):
+    return _lot_plans.get(lot_name, _default_plan)
+
+
+def start_minute_of(start_time):
+    return start_time.hour * 60 + start_time.minute if start_time is not None else 0
+
+
+def price(duration_seconds, lot_name=None, start_time=None):
+    """Amount in rupees for one parking session."""
+    return _rupees(plan_for(lot_name).price_paise(duration_seconds, start_minute_of(start_time)))
+
+
+def price_many(duration_seconds, lot_names=None, start_times=None):
+    """
+    Prices arrays of sessions at once; returns an int64 array of paise. start_times is
+    an array of datetime64 (or None to price every session from midnight).
+    """
+    durations = np.asarray(duration_seconds, dtype=np.int64)
+    start_minutes = None
+    if start_times is not None:
+        start_times = np.asarray(start_times, dtype='datetime64[m]')
+        start_minutes = (start_times - start_times.astype('datetime64[D]')).astype(np.int64)
+    if lot_names is None:
+        return _default_plan.price_paise_many(durations, start_minutes)
+
+    lot_names = np.asarray(lot_names)
+    fees = np.empty(len(durations), dtype=np.int64)
+    for lot_name in np.unique(lot_names):
+        rows = lot_names == lot_name
+        fees[rows] = plan_for(lot_name).price_paise_many(
+            durations[rows], None if start_minutes is None else start_minutes[rows])
+    return fees
+
+
+REPORT_CHUNK_ROWS = 100000
+
+
+def revenue_report(date_from, date_to, lot_name=None):
+    """
+    Daily revenue and reconciliation per lot over completed sessions (archived ones
+    included) that ended in [date_from, date_to): billed at the current tariff, and how
+    much of that is paid. Rows are streamed from MySQL and priced a chunk at a time.
+    """
+    import pymysql
+
+    from db import get_db_connection
+
+    # Old paid sessions live in the archive (maintenance.py); its end_time partitions prune the range
+    select = '''
+        SELECT DATE(end_time) AS day, lot_name, start_time, duration, paid
+        FROM {table}
+        WHERE end_time >= %s AND end_time < %s AND duration IS NOT NULL
+    '''
+    if lot_name:
+        select += " AND lot_name = %s"
+    params = [date_from, date_to] + ([lot_name] if lot_name else [])
+    query = select.format(table='parking_sessions') + " UNION ALL " + select.format(table='parking_sessions_archive')
+    params += params
+
+    totals = {}  # (day, lot) -> [sessions, billed paise, paid sessions, paid paise]
+    conn = get_db_connection()
+    finished = False
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(REPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            days, lots, starts, durations, paid = zip(*rows)
+            fees = price_many(durations, lots, np.array(starts, dtype='datetime64[m]'))
+            paid = np.array(paid, dtype=bool)
+            keys = np.array([f"{day}|{lot}" for day, lot in zip(days, lots)])
+            for key in np.unique(keys):
+                rows_for_key = keys == key
+                entry = totals.setdefault(tuple(key.split('|', 1)), [0, 0, 0, 0])
+                entry[0] += int(rows_for_key.sum())
+                entry[1] += int(fees[rows_for_key].sum())
+                entry[2] += int((rows_for_key & paid).sum())
+                entry[3] += int(fees[rows_for_key & paid].sum())
+        finished = True
+    finally:
+        if finished:
+            conn.close()
+        else:
+            conn.discard()
+
+    return [
+        {'day': day, 'lot_name': lot, 'sessions': sessions, 'billed': _rupees(billed),
+         'paid_sessions': paid_sessions, 'paid': _rupees(paid_amount), 'outstanding': _rupees(billed - paid_amount)}
+        for (day, lot), (sessions, billed, paid_sessions, paid_amount) in sorted(totals.items())
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from datetime import date, datetime, timedelta
+
+    parser = argparse.ArgumentParser(description="Tariff reports and benchmark")
+    commands = parser.add_subparsers(dest='command', required=True)
+    report = commands.add_parser('report', help="Daily revenue / reconciliation per lot")
+    report.add_argument('--from', dest='date_from', default=str(date.today() - timedelta(days=7)))
+    report.add_argument('--to', dest='date_to', default=str(date.today() + timedelta(days=1)))
+    report.add_argument('--lot')
+    bench = commands.add_parser('bench', help="Row-by-row pricing vs the vectorized path on synthetic sessions")
+    bench.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        print(f"{'day':<12}{'lot':<12}{'sessions':>10}{'billed':>14}{'paid':>14}{'outstanding':>14}")
+        for row in revenue_report(args.date_from, args.date_to, args.lot):
+            print(f"{str(row['day']):<12}{row['lot_name']:<12}{row['sessions']:>10}"
+                  f"{row['billed']:>14}{row['paid']:>14}{row['outstanding']:>14}")
+    else:
+        rng = np.random.default_rng(0)
+        durations = rng.integers(0, 6 * 3600, args.rows)
+        lots = rng.choice(['Lot A', 'Lot B', 'Lot C', 'Lot D'], args.rows)
+        base = np.datetime64('2024-01-01T00:00')
+        starts = base + rng.integers(0, 30 * MINUTES_PER_DAY, args.rows).astype('timedelta64[m]')
+
+        started = time.perf_counter()
+        start_datetimes = starts.astype(datetime)
+        loop_total = sum(
+            plan_for(lot).price_paise(duration, start_minute_of(start))
+            for duration, lot, start in zip(durations.tolist(), lots.tolist(), start_datetimes.tolist())
+        )
+        loop_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vector_total = int(price_many(durations, lots, starts).sum())
+        vector_elapsed = time.perf_counter() - started
+
+        print(f"row-by-row: {args.rows / loop_elapsed:12,.0f} sessions/s")
+        print(f"vectorized: {args.rows / vector_elapsed:12,.0f} sessions/s ({loop_elapsed / vector_elapsed:.0f}x)")
+        if loop_total != vector_total:
+            raise SystemExit(f"Totals differ: {loop_total} vs {vector_total}")
+        print(f"totals match: ₹{_rupees(vector_total):,}")
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+from admin_queries import export_query, next_cursor, page_query, parse_filters
+
+
+def rows(count, **extra):
+    return [dict(id=i, **extra) for i in range(1, count + 1)]
+
+
+def test_cursor_round_trip_by_id():
+    page = rows(4)
+    after = next_cursor('users', page, limit=3)
+    assert after == '3'
+    query, params = page_query('users', {}, after=after, limit=3)
+    assert 'WHERE id > %s' in query and 'ORDER BY id ASC LIMIT %s' in query
+    assert params == ['3', 4]
+
+
+def test_cursor_round_trip_by_column():
+    page = [{'id': 7, 'start_time': '2024-05-01 10:00:00'}, {'id': 3, 'start_time': '2024-05-01 09:00:00'},
+            {'id': 9, 'start_time': '2024-05-01 08:00:00'}]
+    after = next_cursor('parking_sessions', page, sort='start_time', limit=2)
+    assert after == '2024-05-01 09:00:00|3'
+    query, params = page_query('parking_sessions', {'lot': 'Lot A'}, sort='start_time', order='desc', after=after, limit=2)
+    assert '(start_time < %s OR (start_time = %s AND id < %s))' in query
+    assert query.endswith('ORDER BY start_time DESC, id DESC LIMIT %s')
+    assert params == ['Lot A', '2024-05-01 09:00:00', '2024-05-01 09:00:00', '3', 3]
+
+
+def test_last_page_has_no_cursor():
+    assert next_cursor('users', rows(3), limit=3) is None
+
+
+def test_sort_and_filters_are_whitelisted():
+    # An unknown sort column falls back to id instead of reaching the SQL
+    query, _ = page_query('users', {}, sort='password; DROP TABLE users', order='desc')
+    assert 'ORDER BY id DESC' in query and 'password' not in query
+    # Filters a table doesn't support are ignored
+    query, params = export_query('users', {'lot': 'Lot A', 'paid': 0, 'plate': 'KA 01 AB 1234'})
+    assert query.endswith('WHERE license_plate = %s ORDER BY id ASC') and params == ['KA 01 AB 1234']
+    with pytest.raises(KeyError):
+        page_query('schema_migrations', {})
+
+
+def test_parse_filters_drops_bad_values():
+    filters = parse_filters({'plate': ' KA 01 AB 1234 ', 'lot': '', 'paid': 'yes', 'date_from': '2024-05-01',
+                             'date_to': '05/02/2024'})
+    assert filters == {'plate': 'KA 01 AB 1234', 'date_from': datetime(2024, 5, 1)}
@@ -0,0 +1,49 @@
+import asyncio
+
+from occupancy_hub import AsyncSubscriber, OccupancyHub
+
+
+class StaticIndex:
+    def add_listener(self, listener):
+        pass
+
+    async def reserved_slots_async(self, lot_name):
+        return {}
+
+
+class EmptyBoard:
+    def counts(self, lot_name):
+        return {}
+
+
+def test_async_subscriber_overflow_resets():
+    async def run():
+        subscriber = AsyncSubscriber('Lot A', asyncio.get_running_loop(), maxsize=2)
+        for i in range(5):
+            subscriber.put(f"message {i}")
+        await asyncio.sleep(0)  # put() hands messages to the loop
+        assert subscriber.overflowed
+        subscriber.reset()
+        assert not subscriber.overflowed
+        assert await subscriber.get(0.01) is None
+
+    asyncio.run(run())
+
+
+def test_stream_async_resyncs_after_overflow():
+    hub = OccupancyHub(index=StaticIndex(), board=EmptyBoard())
+    hub._started = True  # No expiry ticker or UDP listener in tests
+    hub.snapshot = lambda lot_name, reserved: "snapshot"
+
+    async def run():
+        stream = hub.stream_async('Lot A')
+        assert await stream.__anext__() == "snapshot"
+        (subscriber,) = hub._subscribers['Lot A']
+        for i in range(subscriber._queue.maxsize + 5):
+            subscriber.put(f"message {i}")
+        await asyncio.sleep(0)
+        # The overflowing subscriber gets a fresh snapshot instead of the stream dying
+        assert await stream.__anext__() == "snapshot"
+        await stream.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,35 @@
+import plate_cache
+from plate_cache import TrackReadings, vote
+
+
+def test_vote_per_character():
+    text, agreement = vote([('KA01AB1234', 0.9), ('KA01A81234', 0.5), ('KA01AB1234', 0.8)])
+    assert text == 'KA01AB1234'
+    assert agreement == (0.9 + 0.8) / (0.9 + 0.5 + 0.8)
+
+
+def test_vote_uses_the_heaviest_length():
+    # The short misread has the highest single confidence but is outweighed
+    text, agreement = vote([('KA01AB123', 0.95), ('KA01AB1234', 0.6), ('KA01AB1234', 0.6)])
+    assert text == 'KA01AB1234' and agreement == 1.0
+
+
+def test_vote_without_readings():
+    assert vote([]) == (None, 0.0)
+
+
+def test_readings_settle_once_votes_agree():
+    readings = TrackReadings()
+    readings.add('KA 01 AB 1234', 0.9)
+    assert readings.plate == 'KA 01 AB 1234' and not readings.settled  # One vote isn't enough
+    readings.add('KA0IAB1234', 0.9)  # Normalized before voting: same plate
+    assert readings.settled and readings.agreement == 1.0
+
+
+def test_unreadable_plate_settles_after_max_readings():
+    readings = TrackReadings()
+    for _ in range(plate_cache.PLATE_MAX_READINGS - 1):
+        readings.add(None, 0.0)
+    assert not readings.settled
+    readings.add('???', 0.2)
+    assert readings.settled and readings.plate is None
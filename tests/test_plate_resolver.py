@@ -0,0 +1,56 @@
+from plate_resolver import PlateIndex, is_plate_shaped, normalize_plate, plate_distance
+
+
+def make_index(*plates):
+    index = PlateIndex(loader=lambda: list(plates))
+    index.ensure_fresh()
+    return index
+
+
+def test_normalize_plate():
+    assert normalize_plate('ka0IAB1234') == 'KA 01 AB 1234'
+    assert normalize_plate('KA-01 AB') == 'KA01AB'  # Not a plate's length: compacted only
+    assert is_plate_shaped('KA 01 AB 1234') and not is_plate_shaped('KA 0I AB 1234')
+
+
+def test_plate_distance_discounts_confusions():
+    assert plate_distance('KA 01 AB 1234', 'KA01AB1234') == 0
+    assert plate_distance('KAO1AB1234', 'KA01AB1234') == 0.3
+    assert plate_distance('KA01AB1234', 'KA01AB1235') == 1.0
+    assert plate_distance('KA01AB123', 'KA01AB1234') == 1.0
+
+
+def test_resolve_corrects_confusions():
+    index = make_index('KA 01 AB 1234', 'MH 12 CD 5678')
+    assert index.resolve('KA 01 AB 1234') == 'KA 01 AB 1234'
+    assert index.resolve('KAO1A81234') == 'KA 01 AB 1234'
+
+
+def test_resolve_never_rewrites_a_well_formed_read():
+    index = make_index('KA 01 AB 1234')
+    # One real edit away, but a valid plate in its own right: an unregistered car
+    assert index.resolve('KA 01 AB 1235') is None
+    # A malformed read one edit away is resolved
+    assert index.resolve('KA01AB123') == 'KA 01 AB 1234'
+
+
+def test_resolve_refuses_ties():
+    index = make_index('KA 01 AB 1234', 'KA 01 AB 1236')
+    assert index.resolve('KA01AB123') is None
+
+
+def test_matches():
+    index = make_index('KA 01 AB 1234', 'KA 01 AB 1239')
+    assert index.matches('KA 01 AB 1234', 'KA 01 AB 1234')
+    assert index.matches('KAO1AB1234', 'KA 01 AB 1234')
+    assert not index.matches('KA 01 AB 1235', 'KA 01 AB 1234')
+    # The reserved plate needn't be indexed yet
+    assert index.matches('TN 09 ZZ 0001', 'TN 09 ZZ 0001')
+
+
+def test_add_and_remove():
+    index = make_index()
+    index.add('KA 01 AB 1234')
+    assert index.resolve('KA0IAB1234') == 'KA 01 AB 1234'
+    index.remove('KA 01 AB 1234')
+    assert index.resolve('KA0IAB1234') is None and len(index) == 0
@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+if not os.getenv('RDS_HOST'):
+    pytest.skip("No database configured (RDS_HOST)", allow_module_level=True)
+
+from migrations import HOT_QUERIES, check_query_plans, migrate
+
+
+def test_hot_queries_use_an_index():
+    migrate()
+    assert check_query_plans() == []  # (query, table, extra) for each full scan
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+import numpy as np
+
+from plate_to_num import grace_period
+from replay import REPLAY_EPOCH, overlap_matrix, score_recording
+
+GRACE = grace_period.total_seconds()
+
+
+class Stats:
+    processed = 1000
+    ocr_calls = 12
+
+    def fps(self):
+        return 25.0
+
+
+def session(plate, start, end):
+    started, ended = REPLAY_EPOCH + timedelta(seconds=start), REPLAY_EPOCH + timedelta(seconds=end)
+    return (plate, 'Lot A', 'Slot 1', started, ended, end - start)
+
+
+def test_overlap_matrix():
+    expected = [{'start': 0.0, 'end': 10.0}, {'start': 20.0, 'end': 30.0}]
+    iou = overlap_matrix(expected, [(0.0, 10.0), (5.0, 25.0), (40.0, 50.0)])
+    assert np.allclose(iou, [[1.0, 5 / 25, 0.0],
+                             [0.0, 5 / 25, 0.0]])
+
+
+def test_score_recording_all_right():
+    vehicles = [{'plate': 'KA 01 AB 1234', 'entry': 4.0, 'exit': 61.5},
+                {'plate': 'MH 12 CD 5678', 'entry': 100.0, 'exit': 200.0}]
+    sessions = [session('KA01AB1234', 4.5, 61.5 + GRACE), session('MH 12 CD 5678', 100.0, 201.0 + GRACE)]
+    score, problems = score_recording(vehicles, sessions, Stats(), tolerance=2.0)
+    assert problems == []
+    assert (score['expected'], score['missed'], score['spurious']) == (2, 0, 0)
+    assert (score['plates_right'], score['boundaries_right']) == (2, 2)
+    assert score['mean_entry_error'] == 0.25 and score['mean_exit_error'] == 0.5
+
+
+def test_score_recording_problems():
+    vehicles = [{'plate': 'KA 01 AB 1234', 'entry': 0.0, 'exit': 60.0},
+                {'plate': 'MH 12 CD 5678', 'entry': 100.0, 'exit': 200.0},
+                {'plate': 'TN 09 ZZ 0001', 'entry': 300.0, 'exit': 305.0}]  # Drive-by: no session expected
+    sessions = [session('KA 01 AB 1235', 0.0, 60.0 + GRACE),  # Misread plate
+                session('MH 12 CD 5678', 110.0, 200.0 + GRACE),  # Entry 10s late
+                session('DL 01 XX 0001', 400.0, 500.0)]  # Nothing annotated there
+    score, problems = score_recording(vehicles, sessions, Stats(), tolerance=2.0)
+    assert (score['vehicles'], score['expected'], score['sessions']) == (3, 2, 3)
+    assert (score['missed'], score['spurious']) == (0, 1)
+    assert (score['plates_right'], score['boundaries_right']) == (1, 1)
+    assert len(problems) == 3
+
+
+def test_score_recording_missed_vehicle():
+    vehicles = [{'plate': 'KA 01 AB 1234', 'entry': 0.0, 'exit': 60.0}]
+    score, problems = score_recording(vehicles, [], Stats())
+    assert score['missed'] == 1 and score['mean_entry_error'] is None
+    assert problems == ["KA 01 AB 1234: no session (in view 0.0-60.0s)"]
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import tariff
+from tariff import RatePlan
+
+
+def test_default_plan_matches_original_rule():
+    # ₹20 for the first 10 minutes, ₹2 per extra minute
+    assert tariff.price(5 * 60) == 20
+    assert tariff.price(10 * 60 + 59) == 20
+    assert tariff.price(25 * 60) == 50
+
+
+def test_price_paise_many_matches_scalar():
+    plan = RatePlan(base_fee=30, base_minutes=15, per_minute=1.5, grace_minutes=5, daily_cap=400,
+                    bands=[{'from': '08:00', 'to': '20:00', 'per_minute': 3},
+                           {'from': '22:00', 'to': '06:00', 'per_minute': 0.5}])
+    rng = np.random.default_rng(0)
+    durations = np.concatenate(([0, 4 * 60, 5 * 60, 15 * 60, 16 * 60], rng.integers(0, 3 * 24 * 3600, 500)))
+    starts = rng.integers(0, tariff.MINUTES_PER_DAY, len(durations))
+    vectorized = plan.price_paise_many(durations, starts)
+    scalar = [plan.price_paise(duration, start) for duration, start in zip(durations, starts)]
+    assert vectorized.tolist() == scalar
+
+
+def test_price_many_matches_price_per_lot():
+    rng = np.random.default_rng(1)
+    durations = rng.integers(0, 2 * 24 * 3600, 200)
+    lot_names = rng.choice(['Lot A', 'Lot B', 'Lot C'], len(durations))
+    start_times = [datetime(2024, 5, 1) + timedelta(minutes=int(m)) for m in rng.integers(0, 7 * 24 * 60, len(durations))]
+
+    fees = tariff.price_many(durations, lot_names, np.array(start_times, dtype='datetime64[m]'))
+    expected = [round(tariff.price(int(duration), lot_name, start) * 100)
+                for duration, lot_name, start in zip(durations, lot_names, start_times)]
+    assert fees.tolist() == expected
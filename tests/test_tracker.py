@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from plate_to_num import grace_period
+from tracker import CONFIRMED, LOST, TENTATIVE, PlateTracker, assign, iou_matrix
+
+T0 = datetime(2024, 1, 1, 9, 0, 0)
+
+
+def test_iou_matrix():
+    iou = iou_matrix([(0, 0, 10, 10)], [(0, 0, 10, 10), (5, 0, 10, 10), (20, 20, 5, 5)])
+    assert np.allclose(iou, [[1.0, 50 / 150, 0.0]])
+    assert iou_matrix([], [(0, 0, 1, 1)]).shape == (0, 1)
+
+
+def test_assign_is_one_to_one_above_threshold():
+    iou = np.array([[0.9, 0.8],
+                    [0.85, 0.1]])
+    # Greedy takes the best pair first
+    assert sorted(assign(iou, 0.5, 'greedy')) == [(0, 0)]
+    assert assign(np.array([[0.4]]), 0.5) == []
+    assert assign(np.zeros((0, 3)), 0.5) == []
+
+
+def test_hungarian_maximizes_total_iou():
+    pytest.importorskip('scipy')
+    iou = np.array([[0.9, 0.8],
+                    [0.85, 0.1]])
+    assert sorted(assign(iou, 0.5, 'hungarian')) == [(0, 1), (1, 0)]
+
+
+def test_track_follows_box_and_confirms_on_valid_plate():
+    tracker = PlateTracker('Lot A', 'Slot 1')
+    [track] = tracker.update([(100, 100, 60, 20)], T0)
+    tracker.record_reading(track, 'KA 01 AB 1234', 0.9, T0)
+    assert track.state == CONFIRMED and track.entered == T0
+
+    # A slightly moved box stays on the same track
+    [same] = tracker.update([(102, 101, 60, 20)], T0 + timedelta(seconds=1))
+    assert same is track and track.box == (102, 101, 60, 20)
+    assert tracker.tracks_created == 1
+
+
+def test_invalid_reading_leaves_track_tentative():
+    tracker = PlateTracker('Lot A', 'Slot 1')
+    [track] = tracker.update([(0, 0, 60, 20)], T0)
+    tracker.record_reading(track, 'HELLO', 0.9, T0)
+    assert track.state == TENTATIVE and track.plate is None
+
+
+def test_resolver_supplies_registered_spelling():
+    tracker = PlateTracker('Lot A', 'Slot 1', resolver=lambda text: 'KA 01 AB 1234' if text == 'KA01AB123' else None)
+    [track] = tracker.update([(0, 0, 60, 20)], T0)
+    tracker.record_reading(track, 'KA01AB123', 0.9, T0)  # Fails the format check, but resolves
+    assert track.state == CONFIRMED and track.plate == 'KA 01 AB 1234'
+
+
+def test_expire_saves_long_sessions_only():
+    tracker = PlateTracker('Lot A', 'Slot 1')
+    [track] = tracker.update([(0, 0, 60, 20)], T0)
+    tracker.record_reading(track, 'KA 01 AB 1234', 0.9, T0)
+    last_seen = T0 + timedelta(seconds=60)
+    tracker.update([(0, 0, 60, 20)], last_seen)
+
+    tracker.update([], last_seen + timedelta(seconds=1))
+    assert track.state == LOST
+    assert tracker.expire(last_seen + grace_period) == []  # Still within the grace period
+
+    left = last_seen + grace_period + timedelta(seconds=1)
+    [(plate, lot_name, slot_name, entered, ended, duration)] = tracker.expire(left)
+    assert (plate, lot_name, slot_name, entered, ended) == ('KA 01 AB 1234', 'Lot A', 'Slot 1', T0, left)
+    assert tracker.tracks == []
+
+    # A drive-by shorter than min_session_seconds is dropped
+    [track] = tracker.update([(0, 0, 60, 20)], T0)
+    tracker.record_reading(track, 'KA 01 AB 1234', 0.9, T0)
+    assert tracker.expire(T0 + grace_period + timedelta(seconds=1)) == []
+
+
+def test_new_track_for_same_plate_keeps_entry_time():
+    tracker = PlateTracker('Lot A', 'Slot 1')
+    [first] = tracker.update([(0, 0, 60, 20)], T0)
+    tracker.record_reading(first, 'KA 01 AB 1234', 0.9, T0)
+
+    # The box jumps far enough that a new track picks the plate up
+    later = T0 + timedelta(seconds=5)
+    [second] = tracker.update([(500, 300, 60, 20)], later)
+    assert second is not first
+    tracker.record_reading(second, 'KA 01 AB 1234', 0.9, later)
+    assert second.entered == T0
+    assert tracker.tracks == [second]
@@ -0,0 +1,224 @@
+import numpy as np
+
+from plate_cache import TrackReadings
+from plate_to_num import grace_period, iou_threshold, min_session_seconds
+
+try:
+    from scipy.optimize import linear_sum_assignment  # Optional: optimal assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Track lifecycle
+TENTATIVE = 'tentative'  # Box is being followed but no valid plate has been read yet
+CONFIRMED = 'confirmed'  # Plate read; the parking session has started
+LOST = 'lost'  # Confirmed track missing from recent frames, still within the grace period
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of two arrays of (x, y, w, h) boxes, shape (len(a), len(b))."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    ax1, ay1 = a[:, 0:1], a[:, 1:2]
+    ax2, ay2 = ax1 + a[:, 2:3], ay1 + a[:, 3:4]
+    bx1, by1 = b[:, 0], b[:, 1]
+    bx2, by2 = bx1 + b[:, 2], by1 + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + b[:, 2] * b[:, 3] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def assign(iou, threshold, method='hungarian'):
+    """
+    One-to-one (row, col) matches with IoU above the threshold. 'hungarian' maximizes
+    total IoU (falls back to greedy without scipy); 'greedy' takes pairs best-first.
+    """
+    if iou.size == 0:
+        return []
+    if method == 'hungarian' and linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-iou)
+        return [(r, c) for r, c in zip(rows, cols) if iou[r, c] > threshold]
+
+    candidates = np.flatnonzero(iou > threshold)
+    candidates = candidates[np.argsort(-iou.flat[candidates], kind='stable')]
+    used_rows, used_cols, matches = set(), set(), []
+    for flat in candidates:
+        r, c = divmod(int(flat), iou.shape[1])
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            matches.append((r, c))
+    return matches
+
+
+class Track:
+    """State of one plate box followed across frames."""
+
+    __slots__ = ('track_id', 'box', 'state', 'first_seen', 'last_seen', 'entered', 'announced', 'readings', 'resolved')
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.state = TENTATIVE
+        self.first_seen = now
+        self.last_seen = now
+        self.entered = None  # Session start, set when the plate is first read
+        self.announced = False  # "still in view" printed
+        self.readings = TrackReadings()
+        self.resolved = None  # Registered plate the readings resolve to, if any
+
+    @property
+    def plate(self):
+        return self.resolved or self.readings.plate
+
+
+class PlateTracker:
+    """
+    Associates detections with tracks and turns confirmed tracks into parking sessions for one camera.
+    With a resolver (text -> registered plate or None), tracks take the registered spelling of their
+    plate, and a reading that fails the format check still counts once it resolves.
+    """
+
+    def __init__(self, lot_name, slot_name, method='hungarian', resolver=None):
+        self.lot_name = lot_name
+        self.slot_name = slot_name
+        self.method = method
+        self.resolver = resolver
+        self.tracks = []
+        self._next_id = 1
+
+        self.tracks_created = 0
+        self.hits = 0  # Boxes answered from a settled track without OCR
+        self.misses = 0  # Boxes sent to OCR
+
+    def update(self, boxes, now):
+        """Matches this frame's boxes to tracks; returns the track for each box, in order."""
+        iou = iou_matrix([t.box for t in self.tracks], boxes)
+        matches = assign(iou, iou_threshold, self.method)
+
+        result = [None] * len(boxes)
+        matched_tracks = set()
+        for r, c in matches:
+            track = self.tracks[r]
+            track.box = boxes[c]
+            track.last_seen = now
+            if track.state == LOST:
+                track.state = CONFIRMED
+            elif track.state == CONFIRMED and not track.announced:
+                print(f"Plate {track.plate} still in view.")
+                track.announced = True
+            result[c] = track
+            matched_tracks.add(r)
+
+        for r, track in enumerate(self.tracks):
+            if r not in matched_tracks and track.state == CONFIRMED:
+                track.state = LOST
+
+        for c, box in enumerate(boxes):
+            if result[c] is None:
+                track = Track(self._next_id, box, now)
+                self._next_id += 1
+                self.tracks_created += 1
+                self.tracks.append(track)
+                result[c] = track
+        return result
+
+    def needs_ocr(self, track):
+        if track.readings.settled:
+            self.hits += 1
+            return False
+        self.misses += 1
+        return True
+
+    def record_reading(self, track, text, confidence, now):
+        """Adds an OCR result to the track; confirms it (starting the session) on its first valid plate."""
+        track.readings.add(text, confidence)
+        if self.resolver is not None and track.readings.voted:
+            track.resolved = self.resolver(track.readings.voted)
+        if track.state != TENTATIVE or track.plate is None:
+            return
+
+        # Same plate already tracked (e.g. the box jumped and a new track picked it up):
+        # carry the original entry time over instead of starting a second session.
+        for other in self.tracks:
+            if other is not track and other.state != TENTATIVE and other.plate == track.plate:
+                track.entered = other.entered
+                track.announced = other.announced
+                self.tracks.remove(other)
+                break
+        else:
+            track.entered = now
+            print(f"Plate {track.plate} detected and entry image saved.")
+        track.state = CONFIRMED
+
+    def expire(self, now):
+        """Drops tracks unseen for longer than the grace period; returns sessions worth saving."""
+        finished = []
+        remaining = []
+        for track in self.tracks:
+            if now - track.last_seen <= grace_period:
+                remaining.append(track)
+                continue
+            if track.state != TENTATIVE:
+                duration = (now - track.entered).total_seconds()
+                if duration > min_session_seconds:  # Save only if duration > 30 seconds
+                    print(f"Plate {track.plate} left. Duration: {duration} seconds.")
+                    finished.append((track.plate, self.lot_name, self.slot_name, track.entered, now, duration))
+        self.tracks = remaining
+        return finished
+
+    def ocr_calls_per_vehicle(self):
+        return self.misses / self.tracks_created if self.tracks_created else 0.0
+
+
+if __name__ == "__main__":
+    # Benchmark: per-frame association cost with hundreds of simultaneous synthetic tracks
+    import argparse
+    import time
+    from datetime import datetime, timedelta
+
+    from plate_to_num import calculate_iou
+
+    parser = argparse.ArgumentParser(description="Benchmark track association")
+    parser.add_argument('--tracks', type=int, default=300)
+    parser.add_argument('--frames', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    origins = rng.uniform(0, 4000, size=(args.tracks, 2))
+    velocity = rng.uniform(-3, 3, size=(args.tracks, 2))
+    frames = []
+    for f in range(args.frames):
+        xy = origins + velocity * f + rng.normal(0, 1, size=origins.shape)
+        frames.append([(int(x), int(y), 60, 20) for x, y in xy])
+
+    def legacy(frames):
+        # The original loop: first match over 0.5 per detection, O(detections x tracks) in Python
+        last_boxes = {}
+        for boxes in frames:
+            for i, box in enumerate(boxes):
+                matched = None
+                for plate, last_box in last_boxes.items():
+                    if calculate_iou(box, last_box) > iou_threshold:
+                        matched = plate
+                        break
+                last_boxes[matched if matched is not None else i] = box
+
+    started = time.perf_counter()
+    legacy(frames)
+    elapsed = time.perf_counter() - started
+    print(f"{'legacy loop':>12}: {elapsed / args.frames * 1000:8.2f} ms/frame")
+
+    for method in ('greedy', 'hungarian'):
+        tracker = PlateTracker('Bench Lot', 'Bench Slot', method=method)
+        now = datetime.now()
+        started = time.perf_counter()
+        for f, boxes in enumerate(frames):
+            tracker.update(boxes, now + timedelta(milliseconds=33 * f))
+        elapsed = time.perf_counter() - started
+        label = method if method == 'greedy' or linear_sum_assignment is not None else 'hungarian*'
+        print(f"{label:>12}: {elapsed / args.frames * 1000:8.2f} ms/frame, {tracker.tracks_created} tracks created")
+    if linear_sum_assignment is None:
+        print("* scipy not installed; hungarian fell back to greedy")
@@ -0,0 +1,203 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_db_connection
+
+# How long a plate's outstanding-balance state is trusted without re-querying. Changes are
+# also broadcast to every process holding a cache (UDP, best effort), so the TTL only bounds
+# staleness when a datagram is lost.
+UNPAID_CACHE_TTL = float(os.getenv('UNPAID_CACHE_TTL', 10))
+UNPAID_CACHE_SIZE = int(os.getenv('UNPAID_CACHE_SIZE', 10000))  # Plates kept, least recently used dropped first
+# Each web worker listens on the first free port of UNPAID_EVENT_PORT .. + UNPAID_EVENT_PORTS - 1;
+# changes are sent to all of them on every host in UNPAID_EVENT_HOSTS (comma-separated).
+UNPAID_EVENT_PORT = int(os.getenv('UNPAID_EVENT_PORT', 8767))
+UNPAID_EVENT_PORTS = int(os.getenv('UNPAID_EVENT_PORTS', 16))
+UNPAID_EVENT_HOSTS = [host.strip() for host in os.getenv('UNPAID_EVENT_HOSTS', '127.0.0.1').split(',') if host.strip()]
+BROADCAST_CHUNK = 200  # Plates per datagram, well under the UDP size limit
+
+
+LATEST_UNPAID_QUERY = '''
+    SELECT *
+    FROM parking_sessions
+    WHERE license_plate = %s AND paid = 0 AND end_time IS NOT NULL
+    ORDER BY end_time DESC
+    LIMIT 1
+'''
+
+
+def fetch_latest_unpaid_session(license_plate):
+    """Returns the latest unpaid, completed parking session for the plate, or None."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(LATEST_UNPAID_QUERY, (license_plate,))
+            return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+async def fetch_latest_unpaid_session_async(license_plate):
+    """fetch_latest_unpaid_session() on the async pool, for the ASGI app."""
+    from db import fetch_one_async
+
+    return await fetch_one_async(LATEST_UNPAID_QUERY, (license_plate,))
+
+
+def broadcast_unpaid_change(plates=None, hosts=UNPAID_EVENT_HOSTS, port=UNPAID_EVENT_PORT, ports=UNPAID_EVENT_PORTS):
+    """
+    Tells every process's guard that these plates' balances changed (None: every plate).
+    Best effort, like the alert wake-up; a lost datagram is covered by the TTL.
+    """
+    plates = [None] if plates is None else list(plates)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for start in range(0, len(plates), BROADCAST_CHUNK):
+                message = json.dumps({'plates': plates[start:start + BROADCAST_CHUNK]}).encode()
+                for host in hosts:
+                    for target in range(port, port + ports):
+                        try:
+                            sock.sendto(message, (host, target))
+                        except OSError:
+                            pass  # No listener there, or host unreachable
+    except OSError:
+        pass
+
+
+class UnpaidSessionGuard:
+    """Per-plate TTL cache of the latest unpaid session, shared by every route."""
+
+    def __init__(self, loader=fetch_latest_unpaid_session, ttl=UNPAID_CACHE_TTL, max_size=UNPAID_CACHE_SIZE,
+                 event_port=UNPAID_EVENT_PORT, event_ports=UNPAID_EVENT_PORTS):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_size = max_size
+        self.event_port = event_port
+        self.event_ports = event_ports
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # license_plate -> (fetched_at, session row or None), least recent first
+        self._generation = 0  # Bumped on every invalidation so in-flight loads can't cache stale rows
+        self._listening = False
+
+        self.lookups = 0
+        self.queries = 0
+
+    def start(self):
+        """Starts listening for other processes' changes (idempotent; the first lookup calls it)."""
+        with self._lock:
+            if self._listening:
+                return
+            self._listening = True
+        for port in range(self.event_port, self.event_port + self.event_ports):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind(('0.0.0.0', port))
+            except OSError:
+                sock.close()
+                continue  # Another worker's port
+            threading.Thread(target=self._listen, args=(sock,), name="unpaid-guard-events", daemon=True).start()
+            return
+        print(f"Unpaid guard: no free port in {self.event_port}-{self.event_port + self.event_ports - 1}; "
+              f"changes from other processes wait for the {self.ttl:g}s TTL")
+
+    def _listen(self, sock):
+        while True:
+            data, _ = sock.recvfrom(65535)
+            try:
+                plates = json.loads(data)['plates']
+            except (ValueError, KeyError, TypeError):
+                continue
+            for plate in plates:
+                self.invalidate(plate, broadcast=False)
+
+    def _lookup(self, license_plate, now):
+        """Returns (True, cached session) on a hit, or (False, generation to store the load under)."""
+        if not self._listening:
+            self.start()
+        with self._lock:
+            self.lookups += 1
+            cached = self._cache.get(license_plate)
+            if cached is not None and now - cached[0] <= self.ttl:
+                self._cache.move_to_end(license_plate)
+                return True, cached[1]
+            return False, self._generation
+
+    def latest_unpaid(self, license_plate):
+        """Returns the plate's latest unpaid completed session (None if paid up)."""
+        now = time.monotonic()
+        hit, value = self._lookup(license_plate, now)
+        if hit:
+            return value
+        return self._store(license_plate, now, value, self._loader(license_plate))
+
+    async def latest_unpaid_async(self, license_plate, loader=fetch_latest_unpaid_session_async):
+        """latest_unpaid() for the ASGI app: same cache, queries through the async driver."""
+        now = time.monotonic()
+        hit, value = self._lookup(license_plate, now)
+        if hit:
+            return value
+        return self._store(license_plate, now, value, await loader(license_plate))
+
+    def _store(self, license_plate, now, generation, unpaid_session):
+        with self._lock:
+            self.queries += 1
+            if generation == self._generation:
+                self._cache[license_plate] = (now, unpaid_session)
+                self._cache.move_to_end(license_plate)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return unpaid_session
+
+    def has_unpaid(self, license_plate):
+        return self.latest_unpaid(license_plate) is not None
+
+    def invalidate(self, license_plate=None, broadcast=True):
+        """
+        Forgets the cached state for a plate (or for every plate) after its balance changed,
+        here and, unless broadcast=False, in every other process's guard.
+        """
+        with self._lock:
+            self._generation += 1
+            if license_plate is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(license_plate, None)
+        if broadcast:
+            broadcast_unpaid_change(None if license_plate is None else [license_plate],
+                                    port=self.event_port, ports=self.event_ports)
+
+    def stats(self):
+        with self._lock:
+            return {'lookups': self.lookups, 'queries': self.queries, 'cached_plates': len(self._cache)}
+
+
+unpaid_guard = UnpaidSessionGuard()
+
+
+if __name__ == "__main__":
+    # Benchmark: unpaid-session round trips for a login -> lots -> slots -> reserve flow
+    import argparse
+
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Count unpaid-session queries per user flow")
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--lot', default='Lot A')
+    parser.add_argument('--flows', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.test_client() as client:
+        for _ in range(args.flows):
+            client.post('/login', data={'username': args.email, 'password': args.password})
+            client.get('/lots')
+            client.get(f'/slots/{args.lot}')
+            client.get('/payment')
+            client.get('/logout')
+
+    stats = unpaid_guard.stats()
+    print(f"{args.flows} flows: {stats['lookups']} unpaid checks, {stats['queries']} database round trips "
+          f"({stats['lookups'] / args.flows:.1f} -> {stats['queries'] / args.flows:.1f} per flow)")